@@ -0,0 +1,140 @@
+import os
+import time
+import hashlib
+import datetime
+import threading
+from database import get_mysql_pool, get_db_dialect
+
+# In-process registry of system_academic_years. The list is loaded once and
+# served from memory; it reloads when an admin endpoint invalidates it, when the
+# date-based current year changes (September 1), and every
+# ACADEMIC_YEAR_REFRESH_SECONDS so changes made by other workers show up.
+ACADEMIC_YEAR_REFRESH_SECONDS = float(os.getenv('ACADEMIC_YEAR_REFRESH_SECONDS', 300))
+
+def get_current_academic_year_name(today=None):
+    """Calculate the current academic year based on the current date.
+    Academic year starts in September and ends in June.
+    For example: If current date is between Sep 2025 - June 2026, the year is 2025/2026
+    """
+    today = today or datetime.date.today()
+    start_year = today.year if today.month >= 9 else today.year - 1
+    return f"{start_year}/{start_year + 1}", start_year, start_year + 1
+
+def ensure_academic_year(cursor, name, start_year, end_year, is_current=1):
+    """Create a system academic year unless one with that name exists. Safe to run concurrently."""
+    query = '''INSERT INTO system_academic_years (name, start_year, end_year, start_date, end_date, is_current)
+               VALUES (%s, %s, %s, %s, %s, %s)'''
+    if get_db_dialect() == 'sqlite':
+        query += ' ON CONFLICT (name) DO NOTHING'
+    else:
+        query += ' ON DUPLICATE KEY UPDATE name = name'
+    cursor.execute(query, (name, start_year, end_year, f"{start_year}-09-01", f"{end_year}-06-30", is_current))
+
+def current_academic_year_id(cursor, today=None):
+    """Id of the date-based current year, created if missing, in the caller's transaction.
+
+    Unlike resolve_current_academic_year_id this does not trust the is_current
+    flag, which stays on last year's row until someone changes it.
+    """
+    name, start_year, end_year = get_current_academic_year_name(today)
+    cursor.execute('SELECT id FROM system_academic_years WHERE name = %s', (name,))
+    year = cursor.fetchone()
+    if not year:
+        ensure_academic_year(cursor, name, start_year, end_year)
+        cursor.execute('SELECT id FROM system_academic_years WHERE name = %s', (name,))
+        year = cursor.fetchone()
+    return year['id'] if isinstance(year, dict) else year[0]
+
+class AcademicYearRegistry:
+    def __init__(self, refresh_seconds=ACADEMIC_YEAR_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._years = None
+        self._current_name = None
+        self._fingerprint = None
+        self._loaded_at = 0
+        # Set while one thread reloads outside the lock; bumped by invalidate()
+        self._loading = False
+        self._generation = 0
+        self._lock = threading.Condition()
+
+    def invalidate(self):
+        with self._lock:
+            self._years = None
+            self._generation += 1
+
+    def _load(self, current_name, start_year, end_year):
+        pool = get_mysql_pool()
+        if not pool:
+            return None
+        conn = pool.get_connection()
+        try:
+            cur = conn.cursor(dictionary=True)
+            ensure_academic_year(cur, current_name, start_year, end_year)
+            conn.commit()
+            cur.execute('SELECT * FROM system_academic_years ORDER BY start_year DESC')
+            return [dict(row) for row in cur.fetchall()]
+        finally:
+            conn.close()
+
+    def _is_fresh(self, name):
+        return (self._years is not None and self._current_name == name
+                and time.monotonic() - self._loaded_at < self.refresh_seconds)
+
+    def _snapshot(self):
+        """Return (current year name, years), reloading when stale.
+
+        One thread at a time loads, without holding the lock. Meanwhile other
+        callers get the previous list if it is still for the current year, and
+        wait for the load otherwise (first use, invalidation, September 1).
+        """
+        name, start_year, end_year = get_current_academic_year_name()
+        with self._lock:
+            while not self._is_fresh(name):
+                if not self._loading:
+                    self._loading = True
+                    generation = self._generation
+                    break
+                if self._years is not None and self._current_name == name:
+                    return self._current_name, self._years
+                self._lock.wait()
+            else:
+                return self._current_name, self._years
+
+        years = None
+        try:
+            years = self._load(name, start_year, end_year)
+        finally:
+            with self._lock:
+                self._loading = False
+                self._lock.notify_all()
+                if years is not None:
+                    self._years = years
+                    self._current_name = name
+                    self._fingerprint = hashlib.sha1(repr((name, years)).encode('utf-8')).hexdigest()[:16]
+                    # Invalidated while loading: the list may predate the change, reload next time
+                    self._loaded_at = time.monotonic() if generation == self._generation else 0
+        if years is None:
+            return name, None
+        return name, years
+
+    def fingerprint(self):
+        """A value that changes whenever the year list or the current year changes (for ETags)"""
+        _, years = self._snapshot()
+        return self._fingerprint if years is not None else None
+
+    def years(self):
+        """All years, newest first, with is_current set from the date. None without a database."""
+        current_name, years = self._snapshot()
+        if years is None:
+            return None
+        return [dict(year, is_current=1 if year['name'] == current_name else 0) for year in years]
+
+    def current(self):
+        """The date-based current year (created on first use). None without a database."""
+        current_name, years = self._snapshot()
+        for year in years or ():
+            if year['name'] == current_name:
+                return dict(year, is_current=1)
+        return None
+
+academic_years = AcademicYearRegistry()
@@ -0,0 +1,91 @@
+from database import GRADE_PERIODS
+from grading import SCORE_SCALES, score_bands, get_score_bands
+
+# Every band threshold of every scale; the SQL counts scores at or above each
+# one so Python can pick the thresholds matching each grade's scale.
+SCORE_THRESHOLDS = sorted({t for max_score in SCORE_SCALES for t in score_bands(max_score)})
+
+# Per-year attendance rows may carry English or Arabic statuses
+ATTENDANCE_STATUS_KEYS = {
+    'present': 'present', 'حاضر': 'present',
+    'absent': 'absent', 'غائب': 'absent',
+    'late': 'late', 'متأخر': 'late',
+    'excused': 'excused', 'إجازة': 'excused',
+}
+
+def _rate(part, whole):
+    return round(part * 100.0 / whole, 1) if whole else 0
+
+def _score_aggregate_columns():
+    """SELECT list that sums graded (> 0) scores over all periods and counts them per threshold"""
+    def over_periods(expression):
+        return ' + '.join(f'SUM({expression.format(col=f"sg.{period}")})' for period in GRADE_PERIODS)
+    columns = [
+        f"{over_periods('CASE WHEN {col} > 0 THEN {col} ELSE 0 END')} AS score_total",
+        f"{over_periods('CASE WHEN {col} > 0 THEN 1 ELSE 0 END')} AS score_count",
+    ]
+    for threshold in SCORE_THRESHOLDS:
+        columns.append(f"{over_periods('CASE WHEN {col} >= ' + str(threshold) + ' THEN 1 ELSE 0 END')} AS at_least_{threshold}")
+    return ',\n                   '.join(columns)
+
+def compute_school_analytics(cur, school_id, academic_year_id, grade=None, subject=None):
+    """Performance indicators of a school for one academic year, computed with SQL aggregates.
+
+    Scores are grouped by the student's grade so each group can be judged on
+    its own scale (10 points for elementary grades 1-4, 100 otherwise); zero
+    scores count as "not graded", as on the dashboard.
+    """
+    filters = ' AND s.grade = %s' if grade else ''
+    grade_params = (grade,) if grade else ()
+
+    query = f'''SELECT s.grade,
+                   {_score_aggregate_columns()}
+                FROM student_grades sg
+                JOIN students s ON s.id = sg.student_id
+                WHERE s.school_id = %s AND sg.academic_year_id = %s{filters}'''
+    params = (school_id, academic_year_id) + grade_params
+    if subject:
+        query += ' AND sg.subject_name = %s'
+        params += (subject,)
+    cur.execute(query + ' GROUP BY s.grade', params)
+
+    score_total = score_count = 0
+    distribution = {'excellent': 0, 'good': 0, 'average': 0, 'poor': 0}
+    for row in cur.fetchall():
+        count = int(row['score_count'] or 0)
+        if not count:
+            continue
+        excellent, good, passing = get_score_bands(row['grade'])
+        at_least = {t: int(row[f'at_least_{t}'] or 0) for t in SCORE_THRESHOLDS}
+        score_total += float(row['score_total'] or 0)
+        score_count += count
+        distribution['excellent'] += at_least[excellent]
+        distribution['good'] += at_least[good] - at_least[excellent]
+        distribution['average'] += at_least[passing] - at_least[good]
+        distribution['poor'] += count - at_least[passing]
+
+    cur.execute(f'''SELECT sa.status, COUNT(*) AS records
+                    FROM student_attendance sa
+                    JOIN students s ON s.id = sa.student_id
+                    WHERE s.school_id = %s AND sa.academic_year_id = %s{filters}
+                    GROUP BY sa.status''', (school_id, academic_year_id) + grade_params)
+    attendance = {'present': 0, 'absent': 0, 'late': 0, 'excused': 0}
+    attendance_records = 0
+    for row in cur.fetchall():
+        records = int(row['records'])
+        attendance_records += records
+        key = ATTENDANCE_STATUS_KEYS.get(row['status'])
+        if key:
+            attendance[key] += records
+
+    passed = distribution['excellent'] + distribution['good'] + distribution['average']
+    return {
+        'avg_grade': round(score_total / score_count, 1) if score_count else 0,
+        'pass_rate': _rate(passed, score_count),
+        'excellence_rate': _rate(distribution['excellent'], score_count),
+        'attendance_rate': _rate(attendance['present'], attendance_records),
+        'grade_distribution': distribution,
+        'attendance_distribution': attendance,
+        'graded_scores': score_count,
+        'attendance_records': attendance_records,
+    }
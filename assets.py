@@ -0,0 +1,136 @@
+import os
+import re
+import gzip
+import time
+import hashlib
+import threading
+import mimetypes
+from compression import brotli, is_compressible
+
+# Static files of public/, read once at startup into an in-memory manifest.
+# Every non-HTML file is also served under a content-hash URL
+# (assets/js/school.<hash>.js) that never changes, and the HTML pages are
+# rewritten to reference those URLs. Compressed variants are built up front.
+MIN_COMPRESS_BYTES = 1024
+FINGERPRINT_LENGTH = 10
+# src="assets/..." and href="/assets/..." references in the HTML pages
+_ASSET_REFERENCE_RE = re.compile(r'''(\b(?:src|href)=["'])(/?)(assets/[^"'?#]+)(["'])''')
+
+class Asset:
+    """One file's bytes plus its precompressed variants"""
+
+    def __init__(self, path, body):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {'identity': body}
+        if len(body) >= MIN_COMPRESS_BYTES and is_compressible(self.mimetype):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants['br'] = compressed
+
+    def negotiate(self, accept_encodings):
+        """Return (encoding, bytes) of the smallest variant the client accepts"""
+        best = 'identity'
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accept_encodings[encoding] > 0:
+                if len(self.variants[encoding]) < len(self.variants[best]):
+                    best = encoding
+        return best, self.variants[best]
+
+def fingerprinted_path(path, body):
+    base, extension = os.path.splitext(path)
+    return f'{base}.{hashlib.sha256(body).hexdigest()[:FINGERPRINT_LENGTH]}{extension}'
+
+class AssetManifest:
+    """Map of URL path -> Asset for everything under root.
+
+    With reload=True (development) the tree is re-read when a file changes,
+    checked at most once per second; otherwise the filesystem is never touched
+    after startup.
+    """
+
+    def __init__(self, root, reload=False):
+        self.root = root
+        self.reload = reload
+        self._assets = {}
+        self._immutable = set()
+        self._signature = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self._build()
+
+    def _scan(self):
+        files = []
+        for directory, subdirectories, filenames in os.walk(self.root):
+            subdirectories[:] = sorted(d for d in subdirectories if not d.startswith('.'))
+            for filename in sorted(filenames):
+                if filename.startswith('.'):
+                    continue
+                full_path = os.path.join(directory, filename)
+                stat = os.stat(full_path)
+                files.append((os.path.relpath(full_path, self.root).replace(os.sep, '/'), stat.st_mtime, stat.st_size))
+        return files
+
+    def _build(self):
+        files = self._scan()
+        bodies = {}
+        for path, _, _ in files:
+            with open(os.path.join(self.root, path), 'rb') as f:
+                bodies[path] = f.read()
+
+        assets = {}
+        immutable = set()
+        fingerprints = {}
+        for path, body in bodies.items():
+            if path.endswith('.html'):
+                continue
+            asset = Asset(path, body)
+            hashed = fingerprinted_path(path, body)
+            fingerprints[path] = hashed
+            # The plain URL keeps working (revalidated), the hashed one is cached forever
+            assets[path] = asset
+            assets[hashed] = asset
+            immutable.add(hashed)
+
+        def rewrite(match):
+            hashed = fingerprints.get(match.group(3))
+            return f'{match.group(1)}{match.group(2)}{hashed}{match.group(4)}' if hashed else match.group(0)
+
+        for path, body in bodies.items():
+            if path.endswith('.html'):
+                html = _ASSET_REFERENCE_RE.sub(rewrite, body.decode('utf-8'))
+                assets[path] = Asset(path, html.encode('utf-8'))
+
+        with self._lock:
+            self._assets = assets
+            self._immutable = immutable
+            self._signature = files
+        total = sum(len(body) for body in bodies.values())
+        print(f"📦 Asset manifest: {len(bodies)} files, {total // 1024} KiB"
+              f"{'' if brotli else ' (brotli not installed, gzip only)'}")
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < 1:
+            return
+        self._checked_at = now
+        if self._scan() != self._signature:
+            self._build()
+
+    def lookup(self, path):
+        """Return (asset, immutable) for a URL path, or (None, False)"""
+        if self.reload:
+            self._reload_if_changed()
+        with self._lock:
+            asset = self._assets.get(path)
+            return asset, path in self._immutable
+
+    def stats(self):
+        with self._lock:
+            return {'assets': len(self._assets) - len(self._immutable), 'fingerprinted': len(self._immutable),
+                    'brotli': brotli is not None}
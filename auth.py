@@ -0,0 +1,269 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import jwt
+import bcrypt
+from database import get_mysql_pool
+from cache import ExpiringCache
+
+# JWT issuing and verification. Verified tokens are cached by hash until their
+# exp, so the HMAC check runs once per token instead of once per request;
+# revocations (logout, deleted accounts) are checked on every request.
+TOKEN_LIFETIME_SECONDS = 24 * 60 * 60
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+# How often each process picks up revocations written by other workers
+REVOCATION_SYNC_SECONDS = float(os.getenv('REVOCATION_SYNC_SECONDS', 5))
+# Re-read this far back on each sync so rows from transactions that committed late are not missed
+REVOCATION_SYNC_OVERLAP_SECONDS = 60
+
+class TokenRevokedError(jwt.InvalidTokenError):
+    """Raised for a validly signed token that was revoked by logout or account deletion"""
+    pass
+
+def token_hash(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+class RevocationList:
+    """In-memory copy of revoked_tokens, refreshed from the database every few seconds.
+
+    A row either revokes one token (token_hash) or every token of a subject
+    (role, subject_id) issued at or before revoked_at.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._subjects = {}
+        self._synced_at = 0
+        self._lock = threading.Lock()
+
+    def _apply(self, token_hash, role, subject_id, revoked_at, expires_at):
+        if token_hash:
+            self._tokens[token_hash] = max(expires_at, self._tokens.get(token_hash, 0))
+        else:
+            key = (role, subject_id)
+            self._subjects[key] = max(revoked_at, self._subjects.get(key, 0))
+
+    def add(self, token_hash, role, subject_id, revoked_at, expires_at):
+        with self._lock:
+            self._apply(token_hash, role, subject_id, revoked_at, expires_at)
+
+    def sync(self, now):
+        """Load recent revocations from the database, at most once per REVOCATION_SYNC_SECONDS"""
+        with self._lock:
+            if now - self._synced_at < REVOCATION_SYNC_SECONDS:
+                return
+            since = self._synced_at - REVOCATION_SYNC_OVERLAP_SECONDS if self._synced_at else 0
+            self._synced_at = now
+
+        pool = get_mysql_pool()
+        if not pool:
+            return
+        conn = pool.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute('''SELECT token_hash, role, subject_id, revoked_at, expires_at FROM revoked_tokens
+                           WHERE revoked_at >= %s AND expires_at > %s''', (int(since), int(now)))
+            rows = cur.fetchall()
+        except Exception as e:
+            print(f"❌ Could not load revoked tokens: {e}")
+            return
+        finally:
+            conn.close()
+
+        with self._lock:
+            for row in rows:
+                self._apply(*row)
+            self._tokens = {key: expires_at for key, expires_at in self._tokens.items() if expires_at > now}
+            self._subjects = {key: revoked_at for key, revoked_at in self._subjects.items()
+                              if revoked_at + TOKEN_LIFETIME_SECONDS > now}
+
+    def is_revoked(self, token_hash, claims):
+        with self._lock:
+            if token_hash in self._tokens:
+                return True
+            revoked_at = self._subjects.get((claims.get('role'), claims.get('id')))
+        # Tokens issued before iat was added count as issued at 0
+        return revoked_at is not None and claims.get('iat', 0) <= revoked_at
+
+    def stats(self):
+        with self._lock:
+            return {'tokens': len(self._tokens), 'subjects': len(self._subjects)}
+
+class TokenAuthority:
+    """Issue, verify and revoke the HS256 access tokens of one secret"""
+
+    def __init__(self, secret, max_entries=TOKEN_CACHE_SIZE):
+        self.secret = secret
+        self.cache = ExpiringCache(max_entries)
+        self.revocations = RevocationList()
+
+    def issue(self, claims):
+        now = int(time.time())
+        return jwt.encode(dict(claims, iat=now, exp=now + TOKEN_LIFETIME_SECONDS), self.secret, algorithm='HS256')
+
+    def verify(self, token):
+        """Return (claims, cache hit). Raises jwt.ExpiredSignatureError or jwt.InvalidTokenError."""
+        now = time.time()
+        key = token_hash(token)
+        claims = self.cache.get(key, now)
+        cached = claims is not None
+        if not cached:
+            claims = jwt.decode(token, self.secret, algorithms=['HS256'], options={'require': ['exp']})
+            self.cache.set(key, claims['exp'], claims)
+
+        self.revocations.sync(now)
+        if self.revocations.is_revoked(key, claims):
+            raise TokenRevokedError('Token has been revoked')
+        # Copy so a route cannot change the cached claims
+        return dict(claims), cached
+
+    def revoke_token(self, cur, token, claims):
+        """Revoke one token until it expires (logout). Runs in the caller's transaction.
+
+        Returns a function the caller runs after committing: it updates this
+        process's cache and revocation list, which a rolled back transaction
+        must leave alone.
+        """
+        key = token_hash(token)
+        now = int(time.time())
+        cur.execute('DELETE FROM revoked_tokens WHERE expires_at <= %s', (now,))
+        cur.execute('''INSERT INTO revoked_tokens (token_hash, revoked_at, expires_at)
+                       VALUES (%s, %s, %s)''', (key, now, int(claims['exp'])))
+
+        def apply():
+            self.cache.discard(key)
+            self.revocations.add(key, None, None, now, int(claims['exp']))
+        return apply
+
+    def revoke_subject(self, cur, role, subject_id):
+        """Revoke every token issued so far to an account (e.g. a deleted school).
+
+        Like revoke_token, returns a function to run after the commit.
+        """
+        now = int(time.time())
+        cur.execute('''INSERT INTO revoked_tokens (role, subject_id, revoked_at, expires_at)
+                       VALUES (%s, %s, %s, %s)''', (role, subject_id, now, now + TOKEN_LIFETIME_SECONDS))
+        return lambda: self.revocations.add(None, role, subject_id, now, now + TOKEN_LIFETIME_SECONDS)
+
+    def stats(self):
+        return {'cache': self.cache.stats(), 'revoked': self.revocations.stats()}
+
+# Login password checks. bcrypt is deliberately slow, so checks run on a small
+# dedicated pool with a bounded queue: a login storm can occupy LOGIN_WORKERS
+# threads at most, and requests beyond the queue are turned away at once
+# instead of tying up the request workers every other endpoint needs.
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+LOGIN_WORKERS = int(os.getenv('LOGIN_WORKERS', 2))
+# Checks running or waiting before new logins get a 503
+LOGIN_QUEUE_LIMIT = int(os.getenv('LOGIN_QUEUE_LIMIT', 16))
+LOGIN_TIMEOUT_SECONDS = float(os.getenv('LOGIN_TIMEOUT_SECONDS', 5))
+# Token buckets: burst size and refill rate per minute
+LOGIN_IP_BURST = int(os.getenv('LOGIN_IP_BURST', 20))
+LOGIN_IP_PER_MINUTE = float(os.getenv('LOGIN_IP_PER_MINUTE', 10))
+LOGIN_USER_BURST = int(os.getenv('LOGIN_USER_BURST', 5))
+LOGIN_USER_PER_MINUTE = float(os.getenv('LOGIN_USER_PER_MINUTE', 5))
+
+class LoginBusyError(Exception):
+    """Raised when the password-check queue is full or a check did not finish in time"""
+    pass
+
+class TokenBucketLimiter:
+    """Per-key token buckets, bounded to the max_keys most recently used keys"""
+
+    def __init__(self, capacity, per_minute, max_keys=10000):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def acquire(self, key, now=None):
+        """Take one token. Returns 0 when allowed, otherwise seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                wait = 0
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def stats(self):
+        with self._lock:
+            return {'keys': len(self._buckets), 'rejected': self.rejected}
+
+def bcrypt_rounds(password_hash):
+    """Cost factor of a '$2b$12$...' hash"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+_dummy_hash = None
+
+def _check_password(password, password_hash):
+    global _dummy_hash
+    if password_hash is None:
+        # Unknown user: spend the same time as a real check so usernames cannot be probed by timing
+        if _dummy_hash is None:
+            _dummy_hash = bcrypt.hashpw(b'dummy-password', bcrypt.gensalt(BCRYPT_ROUNDS))
+        bcrypt.checkpw(password.encode('utf-8'), _dummy_hash)
+        return False, None
+    if not bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
+        return False, None
+    if bcrypt_rounds(password_hash) != BCRYPT_ROUNDS:
+        return True, bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8')
+    return True, None
+
+class PasswordVerifier:
+    """Run bcrypt checks on a bounded pool with admission control"""
+
+    def __init__(self, workers=LOGIN_WORKERS, queue_limit=LOGIN_QUEUE_LIMIT, timeout=LOGIN_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='login-check')
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+
+    def _release(self, _future):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def check(self, password, password_hash):
+        """Return (matches, rehashed password or None); password_hash is None for an unknown user.
+
+        The rehash is set when the stored hash was made with a different cost
+        than BCRYPT_ROUNDS, so the caller can store it. Raises LoginBusyError.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise LoginBusyError('Login queue is full')
+        with self._lock:
+            self.pending += 1
+        future = self._executor.submit(_check_password, password, password_hash)
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.rejected += 1
+            raise LoginBusyError('Password check timed out')
+
+    def stats(self):
+        with self._lock:
+            return {'pending': self.pending, 'queue_limit': self.queue_limit, 'rejected': self.rejected}
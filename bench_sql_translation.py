@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the MySQL -> SQLite statement translation in SQLiteCursor.execute.
+
+Compares the old per-call chain of str.replace calls with the cached
+translate_mysql_to_sqlite() over a realistic mix of statements taken from server.py.
+
+Usage:
+    python bench_sql_translation.py [iterations]
+"""
+
+import sys
+import timeit
+
+from database import translate_mysql_to_sqlite
+
+STATEMENTS = [
+    'SELECT * FROM users WHERE username = %s AND role = %s',
+    'SELECT * FROM students WHERE school_id = %s ORDER BY created_at DESC',
+    'SELECT * FROM student_grades WHERE student_id = %s AND academic_year_id = %s ORDER BY subject_name',
+    'SELECT id FROM student_attendance WHERE student_id = %s AND academic_year_id = %s AND attendance_date = %s',
+    '''UPDATE student_grades SET
+       month1 = %s, month2 = %s, midterm = %s, month3 = %s, month4 = %s, final = %s,
+       updated_at = CURRENT_TIMESTAMP
+       WHERE id = %s''',
+    '''INSERT INTO student_grades
+       (student_id, academic_year_id, subject_name, month1, month2, midterm, month3, month4, final)
+       VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)''',
+    '''SELECT sg.*, say.name as academic_year_name, say.start_year, say.end_year
+       FROM student_grades sg
+       JOIN system_academic_years say ON sg.academic_year_id = say.id
+       WHERE sg.student_id = %s
+       ORDER BY say.start_year DESC, sg.subject_name''',
+    'SELECT * FROM system_academic_years ORDER BY start_year DESC',
+]
+
+def legacy_translate(query):
+    """The translation SQLiteCursor.execute used to run on every call"""
+    query = query.replace('%s', '?')
+    query = query.replace(' JSON', ' TEXT')
+    query = query.replace('ENGINE=InnoDB DEFAULT CHARSET=utf8mb4', '')
+    query = query.replace('ON UPDATE CURRENT_TIMESTAMP', '')
+    query = query.replace('INT AUTO_INCREMENT PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT')
+    query = query.replace('INT AUTO_INCREMENT', 'INTEGER')
+    query = query.replace('INT NOT NULL', 'INTEGER NOT NULL')
+    return query
+
+def run_all(translate):
+    for statement in STATEMENTS:
+        translate(statement)
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    calls = iterations * len(STATEMENTS)
+
+    # Sanity check: both paths must agree on statements without quoted literals
+    for statement in STATEMENTS:
+        assert legacy_translate(statement) == translate_mysql_to_sqlite(statement)
+
+    translate_mysql_to_sqlite.cache_clear()
+    cold = timeit.timeit(lambda: run_all(translate_mysql_to_sqlite.__wrapped__), number=iterations)
+    legacy = timeit.timeit(lambda: run_all(legacy_translate), number=iterations)
+    cached = timeit.timeit(lambda: run_all(translate_mysql_to_sqlite), number=iterations)
+
+    print(f"{calls} translations ({len(STATEMENTS)} distinct statements)")
+    print(f"  legacy str.replace chain : {legacy / calls * 1e9:8.0f} ns/query")
+    print(f"  uncached tokenizing pass : {cold / calls * 1e9:8.0f} ns/query")
+    print(f"  cached translation       : {cached / calls * 1e9:8.0f} ns/query")
+    print(f"  speedup vs legacy        : {legacy / cached:8.1f}x")
+    print(f"  {translate_mysql_to_sqlite.cache_info()}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the vectorized grade-trend engine in trends.py.
+
+Builds a synthetic school-year of student_grades rows (default 50,000: about
+5,000 students x 10 subjects, with some periods left ungraded) and compares a
+per-row Python port of analyzeGradeTrend with analyze_trends() over the whole
+students x subjects x periods array. Both must agree before timings are printed.
+
+Usage:
+    python bench_trends.py [rows]
+"""
+
+import sys
+import time
+import random
+
+import numpy as np
+
+from database import GRADE_PERIODS
+from trends import (GradeTensor, analyze_trends, SIGNIFICANT_CHANGE_PERCENT, TREND_CHANGE_PERCENT,
+                    VARIABLE_SPREAD, INCONSISTENT_SPREAD)
+
+SUBJECTS_PER_STUDENT = 10
+GRADES = ['ابتدائي - الثالث الابتدائي', 'متوسطة - الثاني المتوسط']
+
+def make_rows(count, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    student_id = 0
+    while len(rows) < count:
+        student_id += 1
+        grade = GRADES[student_id % len(GRADES)]
+        max_score = 10 if grade.startswith('ابتدائي') else 100
+        for subject in range(SUBJECTS_PER_STUDENT):
+            scores = tuple(0 if rng.random() < 0.2 else rng.randint(1, max_score) for _ in GRADE_PERIODS)
+            rows.append((student_id, grade, f'subject-{subject}') + scores)
+    return rows[:count]
+
+def python_trend(scores, max_score):
+    """Per-subject loop with the same rules as analyzeGradeTrend in school.js"""
+    safe = max_score * 7 // 10
+    graded = [(i, score) for i, score in enumerate(scores) if score > 0]
+    if not graded:
+        return False, False, False, 'none', 'unknown'
+    improvement = deterioration = zero_before_good = False
+    for (_, previous), (_, current) in zip(graded, graded[1:]):
+        change = (current - previous) / max_score * 100
+        improvement |= change >= SIGNIFICANT_CHANGE_PERCENT
+        deterioration |= change <= -SIGNIFICANT_CHANGE_PERCENT
+    for i in range(1, len(scores)):
+        if scores[i - 1] == 0 and scores[i] >= safe:
+            zero_before_good = True
+    overall = (graded[-1][1] - graded[0][1]) / max_score * 100
+    trend = 'improving' if overall >= TREND_CHANGE_PERCENT else 'declining' if overall <= -TREND_CHANGE_PERCENT else 'stable'
+    values = [score for _, score in graded]
+    mean = sum(values) / len(values)
+    spread = (sum((v - mean) ** 2 for v in values) / len(values)) ** 0.5 / max_score
+    consistency = 'inconsistent' if spread > INCONSISTENT_SPREAD else 'variable' if spread > VARIABLE_SPREAD else 'consistent'
+    return improvement, deterioration, zero_before_good, trend, consistency
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rows = make_rows(count)
+
+    start = time.perf_counter()
+    expected = {}
+    for row in rows:
+        max_score = 10 if row[1].startswith('ابتدائي') else 100
+        expected[(row[0], row[2])] = python_trend(row[3:], max_score)
+    python_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tensor = GradeTensor.from_rows(rows)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    signals = analyze_trends(tensor.scores, tensor.max_scores)
+    numpy_seconds = time.perf_counter() - start
+
+    # Sanity check: both engines must agree on every (student, subject)
+    student_index = {sid: i for i, sid in enumerate(tensor.student_ids)}
+    subject_index = {name: j for j, name in enumerate(tensor.subjects)}
+    keys = ('improvement', 'deterioration', 'zero_before_good', 'trend', 'consistency')
+    for (student_id, subject), values in expected.items():
+        i, j = student_index[student_id], subject_index[subject]
+        assert tuple(signals[key][i, j].item() for key in keys) == values, (student_id, subject)
+
+    at_risk = int(np.count_nonzero(signals['deterioration'].any(axis=-1)))
+    print(f"{count} grade rows ({tensor.scores.shape[0]} students x {tensor.scores.shape[1]} subjects x {len(GRADE_PERIODS)} periods)")
+    print(f"  python per-row loop  : {python_seconds * 1000:8.1f} ms")
+    print(f"  build score array    : {build_seconds * 1000:8.1f} ms")
+    print(f"  vectorized analysis  : {numpy_seconds * 1000:8.1f} ms")
+    print(f"  speedup (analysis)   : {python_seconds / numpy_seconds:8.1f}x")
+    print(f"  students with a significant drop: {at_risk}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import os
+import zlib
+try:
+    import brotli
+except ImportError:
+    # Optional: without it only gzip is offered
+    brotli = None
+
+# gzip / brotli encoders shared by the API response middleware (server.py)
+# and the static asset manifest (assets.py).
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/x-ndjson', 'application/javascript',
+                      'image/svg+xml')
+# API responses smaller than this are sent as-is; compressing them costs more than it saves
+API_COMPRESSION_MIN_BYTES = int(os.getenv('API_COMPRESSION_MIN_BYTES', 1024))
+API_GZIP_LEVEL = int(os.getenv('API_GZIP_LEVEL', 6))
+API_BROTLI_QUALITY = int(os.getenv('API_BROTLI_QUALITY', 4))
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+def choose_encoding(accept_encodings):
+    """'br' or 'gzip' by the client's Accept-Encoding, preferring brotli; None for neither"""
+    if brotli is not None and accept_encodings['br'] > 0:
+        return 'br'
+    if accept_encodings['gzip'] > 0:
+        return 'gzip'
+    return None
+
+class StreamCompressor:
+    """Incremental gzip or brotli encoder: compress() chunks, flush() to emit, finish() at the end"""
+
+    def __init__(self, encoding, gzip_level=API_GZIP_LEVEL, brotli_quality=API_BROTLI_QUALITY):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self):
+        if self.encoding == 'br':
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+def compress_bytes(data, encoding, gzip_level=API_GZIP_LEVEL, brotli_quality=API_BROTLI_QUALITY):
+    compressor = StreamCompressor(encoding, gzip_level, brotli_quality)
+    return compressor.compress(data) + compressor.finish()
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of str/bytes chunks, flushing after each one.
+
+    Flushing keeps streamed NDJSON lines arriving as they are produced instead
+    of waiting for the compressor's buffer to fill. The source iterable is
+    closed when this generator finishes or is closed after it started; a
+    response that is never iterated must close the source itself
+    (see compress_api_response).
+    """
+    compressor = StreamCompressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
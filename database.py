@@ -1,7 +1,11 @@
 import os
+import re
 import datetime
+import functools
 import bcrypt
 import sqlite3
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,23 +18,135 @@ MYSQL_DATABASE = os.getenv('MYSQL_DATABASE', 'school_db')
 MYSQL_PORT = int(os.getenv('MYSQL_PORT', 3306))
 SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'school.db'))
 
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 10))
+SQLITE_POOL_TIMEOUT = float(os.getenv('SQLITE_POOL_TIMEOUT', 10))
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -20000))  # negative = KiB
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 268435456))
+SQL_TRANSLATION_CACHE_SIZE = int(os.getenv('SQL_TRANSLATION_CACHE_SIZE', 1024))
+
 _mysql_pool = None
+_sqlite_pool = None
 _use_sqlite = False
 
-# SQLite adapter class to mimic MySQL connection pool interface
+class SQLitePoolError(Exception):
+    """Raised when no pooled SQLite connection becomes free within the max wait"""
+    pass
+
+# SQLite connection pool that mimics the MySQL connection pool interface
 class SQLiteConnectionWrapper:
-    def __init__(self, path):
+    def __init__(self, path, pool_size=SQLITE_POOL_SIZE, timeout=SQLITE_POOL_TIMEOUT):
         self.path = path
-        self._conn = None
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle = []
+        self._open = 0
+        self._lock = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'timeouts': 0,
+            'discarded': 0,
+        }
     
-    def get_connection(self):
+    def _connect(self):
         conn = sqlite3.connect(self.path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
-        return SQLiteConnection(conn)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(f'PRAGMA synchronous = {SQLITE_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA cache_size = {SQLITE_CACHE_SIZE}')
+        conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+        return conn
+    
+    def _is_usable(self, conn):
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+    
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._lock:
+            self._open -= 1
+            self._stats['discarded'] += 1
+            self._lock.notify()
+    
+    def get_connection(self):
+        deadline = time.monotonic() + self.timeout
+        waited_since = None
+        with self._lock:
+            while not self._idle and self._open >= self.pool_size:
+                if waited_since is None:
+                    waited_since = time.monotonic()
+                    self._stats['waits'] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise SQLitePoolError(
+                        f"Failed getting connection; pool exhausted "
+                        f"({self.pool_size} connections busy for {self.timeout}s)")
+                self._lock.wait(remaining)
+            if waited_since is not None:
+                self._stats['wait_time_ms'] += (time.monotonic() - waited_since) * 1000
+            self._stats['checkouts'] += 1
+            # Most recently returned connection first: its page cache is warmest
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._open += 1
+        
+        if conn is not None and not self._is_usable(conn):
+            # The replacement takes over the dead connection's slot: _open is left
+            # alone, so no other caller can claim the slot in between
+            self._close_quietly(conn)
+            with self._lock:
+                self._stats['discarded'] += 1
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                    self._lock.notify()
+                raise
+        return SQLiteConnection(conn, self)
+    
+    def _release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._lock:
+            self._idle.append(conn)
+            self._lock.notify()
+    
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'backend': 'sqlite',
+                'pool_size': self.pool_size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+            })
+        stats['wait_time_ms'] = round(stats['wait_time_ms'], 2)
+        return stats
 
 class SQLiteConnection:
-    def __init__(self, conn):
+    def __init__(self, conn, pool=None):
         self._conn = conn
+        self._pool = pool
     
     def cursor(self, dictionary=False):
         return SQLiteCursor(self._conn.cursor(), dictionary)
@@ -38,8 +154,58 @@ class SQLiteConnection:
     def commit(self):
         self._conn.commit()
     
+    def rollback(self):
+        self._conn.rollback()
+    
     def close(self):
-        self._conn.close()
+        # Return the connection to the pool; safe to call more than once
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if self._pool is not None:
+            self._pool._release(conn)
+        else:
+            conn.close()
+
+# MySQL -> SQLite rewrites, applied in order outside of string literals
+_MYSQL_TO_SQLITE_REPLACEMENTS = (
+    # Convert MySQL placeholders %s to SQLite ?
+    ('%s', '?'),
+    # Handle JSON type for SQLite (store as TEXT)
+    (' JSON', ' TEXT'),
+    # Handle MySQL-specific syntax
+    ('ENGINE=InnoDB DEFAULT CHARSET=utf8mb4', ''),
+    ('ON UPDATE CURRENT_TIMESTAMP', ''),
+    # Convert MySQL auto-increment to SQLite
+    ('INT AUTO_INCREMENT PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    ('INT AUTO_INCREMENT', 'INTEGER'),
+    ('INT NOT NULL', 'INTEGER NOT NULL'),
+)
+
+# Single- or double-quoted literal, with backslash or doubled-quote escapes
+_SQL_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'" + r'|"(?:[^"\\]|\\.|"")*"', re.DOTALL)
+
+@functools.lru_cache(maxsize=SQL_TRANSLATION_CACHE_SIZE)
+def translate_mysql_to_sqlite(query):
+    """Rewrite a MySQL statement into SQLite syntax.
+    
+    Each distinct statement is translated once and cached, so the hot path
+    is a dict lookup. Text inside quoted literals (e.g. a literal '%s') is
+    left untouched.
+    """
+    parts = []
+    pos = 0
+    for match in _SQL_LITERAL_RE.finditer(query):
+        parts.append(_translate_sql_fragment(query[pos:match.start()]))
+        parts.append(match.group(0))
+        pos = match.end()
+    parts.append(_translate_sql_fragment(query[pos:]))
+    return ''.join(parts)
+
+def _translate_sql_fragment(fragment):
+    for mysql_syntax, sqlite_syntax in _MYSQL_TO_SQLITE_REPLACEMENTS:
+        fragment = fragment.replace(mysql_syntax, sqlite_syntax)
+    return fragment
 
 class SQLiteCursor:
     def __init__(self, cursor, dictionary=False):
@@ -49,17 +215,7 @@ class SQLiteCursor:
         self.rowcount = 0
     
     def execute(self, query, params=None):
-        # Convert MySQL placeholders %s to SQLite ?
-        query = query.replace('%s', '?')
-        # Handle JSON type for SQLite (store as TEXT)
-        query = query.replace(' JSON', ' TEXT')
-        # Handle MySQL-specific syntax
-        query = query.replace('ENGINE=InnoDB DEFAULT CHARSET=utf8mb4', '')
-        query = query.replace('ON UPDATE CURRENT_TIMESTAMP', '')
-        # Convert MySQL auto-increment to SQLite
-        query = query.replace('INT AUTO_INCREMENT PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT')
-        query = query.replace('INT AUTO_INCREMENT', 'INTEGER')
-        query = query.replace('INT NOT NULL', 'INTEGER NOT NULL')
+        query = translate_mysql_to_sqlite(query)
         
         if params:
             self._cursor.execute(query, params)
@@ -68,6 +224,12 @@ class SQLiteCursor:
         self.lastrowid = self._cursor.lastrowid
         self.rowcount = self._cursor.rowcount
     
+    def executemany(self, query, seq_of_params):
+        query = translate_mysql_to_sqlite(query)
+        self._cursor.executemany(query, seq_of_params)
+        self.lastrowid = self._cursor.lastrowid
+        self.rowcount = self._cursor.rowcount
+    
     def fetchone(self):
         row = self._cursor.fetchone()
         if row is None:
@@ -76,6 +238,12 @@ class SQLiteCursor:
             return dict(row)
         return tuple(row)
     
+    def fetchmany(self, size=1):
+        rows = self._cursor.fetchmany(size)
+        if self._dictionary:
+            return [dict(row) for row in rows]
+        return [tuple(row) for row in rows]
+    
     def fetchall(self):
         rows = self._cursor.fetchall()
         if self._dictionary:
@@ -83,15 +251,15 @@ class SQLiteCursor:
         return [tuple(row) for row in rows]
 
 def get_mysql_pool():
-    global _mysql_pool, _use_sqlite
+    global _mysql_pool, _sqlite_pool, _use_sqlite
     
     # Return existing pool if available
     if _mysql_pool:
         return _mysql_pool
     
-    # If already determined to use SQLite, return SQLite wrapper
+    # If already determined to use SQLite, return the shared SQLite pool
     if _use_sqlite:
-        return SQLiteConnectionWrapper(SQLITE_PATH)
+        return _sqlite_pool
     
     # Try MySQL first
     try:
@@ -111,11 +279,53 @@ def get_mysql_pool():
     except Exception as e:
         print(f"⚠️ MySQL connection failed: {e}")
         print(f"✅ Falling back to SQLite: {SQLITE_PATH}")
+        _sqlite_pool = SQLiteConnectionWrapper(SQLITE_PATH)
         _use_sqlite = True
-        return SQLiteConnectionWrapper(SQLITE_PATH)
+        return _sqlite_pool
+
+def get_pool_stats():
+    """Report connection pool usage so the pool can be sized"""
+    pool = get_mysql_pool()
+    if isinstance(pool, SQLiteConnectionWrapper):
+        return pool.stats()
+    if pool:
+        return {'backend': 'mysql', 'pool_size': pool.pool_size}
+    return None
+
+# Rows fetched per round trip when streaming large results
+STREAM_CHUNK_ROWS = int(os.getenv('STREAM_CHUNK_ROWS', 500))
+
+def iter_cursor_rows(cur, chunk_rows=STREAM_CHUNK_ROWS):
+    """Yield rows from an executed cursor a chunk at a time, never holding the full result"""
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield from rows
+
+def get_db_dialect():
+    """Return 'sqlite' when running on the SQLite fallback, otherwise 'mysql'"""
+    return 'sqlite' if isinstance(get_mysql_pool(), SQLiteConnectionWrapper) else 'mysql'
+
+_window_function_support = None
+
+def supports_window_functions(cursor):
+    """True if the backend runs window functions (RANK() OVER ...): SQLite 3.25+, MySQL 8+, MariaDB 10.2+"""
+    global _window_function_support
+    if _window_function_support is None:
+        if get_db_dialect() == 'sqlite':
+            _window_function_support = sqlite3.sqlite_version_info >= (3, 25, 0)
+        else:
+            cursor.execute('SELECT VERSION()')
+            row = cursor.fetchone()
+            version = str(list(row.values())[0] if isinstance(row, dict) else row[0])
+            numbers = tuple(int(part) for part in re.findall(r'\d+', version)[:2])
+            _window_function_support = numbers >= ((10, 2) if 'MariaDB' in version else (8, 0))
+    return _window_function_support
 
 def init_db():
     create_tables()
+    run_migrations()
 
 def create_tables():
     pool = get_mysql_pool()
@@ -304,6 +514,318 @@ def create_tables():
     finally:
         conn.close()
 
+# ============================================================================
+# SCHEMA MIGRATIONS
+# Ordered up-migrations applied once each and recorded in schema_migrations.
+# Each entry is (version, description, statements) where statements is either
+# a list shared by both backends or a dict keyed by dialect ('mysql'/'sqlite').
+# Append new migrations to the end; never edit or reorder applied ones.
+# ============================================================================
+
+# Keeps the newest row of each duplicate group so a unique index can be built.
+# The derived table lets MySQL read from the table it is deleting from.
+_DEDUPE_STUDENT_GRADES = '''DELETE FROM student_grades WHERE id NOT IN (
+    SELECT id FROM (SELECT MAX(id) AS id FROM student_grades
+                    GROUP BY student_id, academic_year_id, subject_name) AS keep_rows)'''
+
+_DEDUPE_STUDENT_ATTENDANCE = '''DELETE FROM student_attendance WHERE id NOT IN (
+    SELECT id FROM (SELECT MAX(id) AS id FROM student_attendance
+                    GROUP BY student_id, academic_year_id, attendance_date) AS keep_rows)'''
+
+MIGRATIONS = [
+    (1, 'unique index on student_grades(student_id, academic_year_id, subject_name)', [
+        _DEDUPE_STUDENT_GRADES,
+        '''CREATE UNIQUE INDEX idx_student_grades_student_year_subject
+           ON student_grades (student_id, academic_year_id, subject_name)''',
+    ]),
+    (2, 'unique index on student_attendance(student_id, academic_year_id, attendance_date)', [
+        _DEDUPE_STUDENT_ATTENDANCE,
+        '''CREATE UNIQUE INDEX idx_student_attendance_student_year_date
+           ON student_attendance (student_id, academic_year_id, attendance_date)''',
+    ]),
+    (3, 'index on students(school_id, grade)', [
+        'CREATE INDEX idx_students_school_grade ON students (school_id, grade)',
+    ]),
+    (4, 'index on teachers(school_id, grade_level)', [
+        'CREATE INDEX idx_teachers_school_grade_level ON teachers (school_id, grade_level)',
+    ]),
+    (5, 'rollover_jobs table for background year-end promotion', [
+        '''CREATE TABLE IF NOT EXISTS rollover_jobs (
+          id INT AUTO_INCREMENT PRIMARY KEY,
+          school_id INT,
+          academic_year_id INT,
+          status VARCHAR(20) NOT NULL DEFAULT 'pending',
+          total_students INT DEFAULT 0,
+          processed_students INT DEFAULT 0,
+          failed_students INT DEFAULT 0,
+          plan JSON,
+          error TEXT,
+          heartbeat_at INT DEFAULT 0,
+          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ]),
+    (6, 'student_summaries table with per-student current-year aggregates', [
+        '''CREATE TABLE IF NOT EXISTS student_summaries (
+          student_id INT PRIMARY KEY,
+          academic_year_id INT,
+          average_score FLOAT,
+          latest_score FLOAT,
+          graded_subjects INT DEFAULT 0,
+          failing_subjects INT DEFAULT 0,
+          attendance_rate FLOAT,
+          attendance_records INT DEFAULT 0,
+          updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          FOREIGN KEY(student_id) REFERENCES students(id) ON DELETE CASCADE
+        )''',
+    ]),
+    (7, 'schools.data_version change counter for cache invalidation', [
+        'ALTER TABLE schools ADD COLUMN data_version INT NOT NULL DEFAULT 0',
+    ]),
+    (8, 'report_card_jobs table for background report-card batches', [
+        '''CREATE TABLE IF NOT EXISTS report_card_jobs (
+          id INT AUTO_INCREMENT PRIMARY KEY,
+          school_id INT NOT NULL,
+          academic_year_id INT,
+          grade VARCHAR(255) NOT NULL,
+          format VARCHAR(10) NOT NULL DEFAULT 'html',
+          status VARCHAR(20) NOT NULL DEFAULT 'pending',
+          total_students INT DEFAULT 0,
+          processed_students INT DEFAULT 0,
+          file_path VARCHAR(500),
+          error TEXT,
+          heartbeat_at INT DEFAULT 0,
+          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ]),
+    (9, 'revoked_tokens table for logout and account-deletion token revocation', [
+        '''CREATE TABLE IF NOT EXISTS revoked_tokens (
+          id INT AUTO_INCREMENT PRIMARY KEY,
+          token_hash VARCHAR(64),
+          role VARCHAR(20),
+          subject_id INT,
+          revoked_at INT NOT NULL,
+          expires_at INT NOT NULL
+        )''',
+    ]),
+    (10, 'schools.data_changed_at (epoch seconds) for Last-Modified headers', [
+        'ALTER TABLE schools ADD COLUMN data_changed_at INT NOT NULL DEFAULT 0',
+    ]),
+    (11, 'indexes on revoked_tokens for the revocation sync and expiry cleanup', [
+        'CREATE INDEX idx_revoked_tokens_expires_at ON revoked_tokens (expires_at)',
+        'CREATE INDEX idx_revoked_tokens_revoked_at ON revoked_tokens (revoked_at)',
+    ]),
+]
+
+def get_schema_version(cursor):
+    cursor.execute('SELECT MAX(version) FROM schema_migrations')
+    row = cursor.fetchone()
+    return (row[0] if row else None) or 0
+
+def run_migrations():
+    """Apply every migration newer than the recorded schema version, in order"""
+    pool = get_mysql_pool()
+    if not pool:
+        return
+    
+    dialect = get_db_dialect()
+    conn = pool.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+          version INT PRIMARY KEY,
+          description VARCHAR(255) NOT NULL,
+          applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+        conn.commit()
+        
+        current_version = get_schema_version(cursor)
+        for version, description, statements in MIGRATIONS:
+            if version <= current_version:
+                continue
+            if isinstance(statements, dict):
+                statements = statements[dialect]
+            try:
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute('INSERT INTO schema_migrations (version, description) VALUES (%s, %s)',
+                               (version, description))
+                conn.commit()
+                print(f'✅ Applied migration {version}: {description}')
+            except Exception as e:
+                conn.rollback()
+                # Another worker may have applied it concurrently
+                if get_schema_version(cursor) >= version:
+                    continue
+                print(f"❌ Migration {version} failed: {e}")
+                break
+    finally:
+        conn.close()
+
+UPSERT_BATCH_SIZE = 500
+
+def build_upsert_query(table, columns, key_columns, update_columns, touch_updated_at=False, dialect=None):
+    """Build a single-statement INSERT-or-UPDATE for the current backend.
+    
+    MySQL uses INSERT ... ON DUPLICATE KEY UPDATE and SQLite uses
+    INSERT ... ON CONFLICT (...) DO UPDATE. Both rely on a unique index
+    over key_columns.
+    """
+    dialect = dialect or get_db_dialect()
+    placeholders = ', '.join(['%s'] * len(columns))
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    
+    if dialect == 'sqlite':
+        assignments = [f"{col} = excluded.{col}" for col in update_columns]
+        if touch_updated_at:
+            assignments.append('updated_at = CURRENT_TIMESTAMP')
+        return f"{query} ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {', '.join(assignments)}"
+    
+    assignments = [f"{col} = VALUES({col})" for col in update_columns]
+    if touch_updated_at:
+        assignments.append('updated_at = CURRENT_TIMESTAMP')
+    return f"{query} ON DUPLICATE KEY UPDATE {', '.join(assignments)}"
+
+def upsert_many(cursor, table, columns, key_columns, rows, touch_updated_at=False, batch_size=UPSERT_BATCH_SIZE):
+    """Insert or update rows with one executemany() per batch. Returns the number of rows sent."""
+    rows = list(rows)
+    if not rows:
+        return 0
+    update_columns = [col for col in columns if col not in key_columns]
+    query = build_upsert_query(table, columns, key_columns, update_columns, touch_updated_at)
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany(query, rows[start:start + batch_size])
+    return len(rows)
+
+def find_existing_keys(cursor, table, key_columns, keys, batch_size=UPSERT_BATCH_SIZE):
+    """Return the subset of key tuples that already have a row in table.
+    
+    Values are compared as strings so DATE columns (returned as date objects
+    by MySQL) match the 'YYYY-MM-DD' strings sent by clients.
+    """
+    wanted = {tuple(str(v) for v in key): key for key in keys}
+    existing = set()
+    wanted_keys = list(wanted)
+    for start in range(0, len(wanted_keys), batch_size):
+        chunk = wanted_keys[start:start + batch_size]
+        conditions = []
+        params = []
+        for i, col in enumerate(key_columns):
+            values = sorted({key[i] for key in chunk})
+            conditions.append(f"{col} IN ({', '.join(['%s'] * len(values))})")
+            params.extend(values)
+        cursor.execute(f"SELECT {', '.join(key_columns)} FROM {table} WHERE {' AND '.join(conditions)}",
+                       tuple(params))
+        for row in cursor.fetchall():
+            values = row.values() if isinstance(row, dict) else row
+            key = tuple(str(v) for v in values)
+            if key in wanted:
+                existing.add(wanted[key])
+    return existing
+
+GRADE_PERIODS = ['month1', 'month2', 'midterm', 'month3', 'month4', 'final']
+
+def upsert_student_grades(cursor, rows):
+    """Upsert (student_id, academic_year_id, subject_name, month1 ... final) tuples"""
+    return upsert_many(
+        cursor, 'student_grades',
+        ['student_id', 'academic_year_id', 'subject_name'] + GRADE_PERIODS,
+        ['student_id', 'academic_year_id', 'subject_name'],
+        rows, touch_updated_at=True)
+
+ATTENDANCE_KEY_COLUMNS = ['student_id', 'academic_year_id', 'attendance_date']
+
+def upsert_student_attendance(cursor, rows):
+    """Upsert (student_id, academic_year_id, attendance_date, status, notes) tuples.
+    
+    Later rows win when the same key appears twice. Returns a dict with
+    'inserted' and 'updated' counts.
+    """
+    by_key = {}
+    for row in rows:
+        by_key[tuple(row[:3])] = tuple(row)
+    if not by_key:
+        return {'inserted': 0, 'updated': 0}
+    
+    existing = find_existing_keys(cursor, 'student_attendance', ATTENDANCE_KEY_COLUMNS, list(by_key))
+    upsert_many(cursor, 'student_attendance', ATTENDANCE_KEY_COLUMNS + ['status', 'notes'],
+                ATTENDANCE_KEY_COLUMNS, by_key.values())
+    return {'inserted': len(by_key) - len(existing), 'updated': len(existing)}
+
+def insert_missing_student_grades(cursor, rows, batch_size=UPSERT_BATCH_SIZE):
+    """Batch-insert grade rows, leaving rows that already exist for the same
+    (student_id, academic_year_id, subject_name) untouched"""
+    rows = list(rows)
+    if not rows:
+        return 0
+    columns = ['student_id', 'academic_year_id', 'subject_name'] + GRADE_PERIODS
+    query = f"INSERT INTO student_grades ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    if get_db_dialect() == 'sqlite':
+        query += ' ON CONFLICT (student_id, academic_year_id, subject_name) DO NOTHING'
+    else:
+        query += ' ON DUPLICATE KEY UPDATE student_id = student_id'
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany(query, rows[start:start + batch_size])
+    return len(rows)
+
+# ------ Per-school change version ------
+# schools.data_version is bumped in the same transaction as any write to a
+# school's data, so caches keyed by it never serve results older than a commit.
+
+SCHOOL_OWNED_TABLES = ('students', 'subjects', 'grade_levels', 'teachers')
+
+def touch_school(cursor, school_id):
+    """Bump a school's data_version and stamp data_changed_at"""
+    cursor.execute('UPDATE schools SET data_version = data_version + 1, data_changed_at = %s WHERE id = %s',
+                   (int(time.time()), school_id))
+
+def touch_schools_of(cursor, table, row_ids):
+    """Bump data_version of the schools owning the given rows of a school-owned table"""
+    if table not in SCHOOL_OWNED_TABLES:
+        raise ValueError(f'{table} is not a school-owned table')
+    row_ids = list(dict.fromkeys(row_ids))
+    if not row_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(row_ids))
+    cursor.execute(f'''UPDATE schools SET data_version = data_version + 1, data_changed_at = %s
+                       WHERE id IN (SELECT school_id FROM {table} WHERE id IN ({placeholders}))''',
+                   (int(time.time()), *row_ids))
+
+def get_school_version(cursor, school_id):
+    """Return a school's data_version, or None if the school does not exist"""
+    cursor.execute('SELECT data_version FROM schools WHERE id = %s', (school_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return row['data_version'] if isinstance(row, dict) else row[0]
+
+def get_school_change_info(cursor, school_id):
+    """Return (data_version, data_changed_at) of a school, or None if it does not exist"""
+    cursor.execute('SELECT data_version, data_changed_at FROM schools WHERE id = %s', (school_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return (row['data_version'], row['data_changed_at']) if isinstance(row, dict) else tuple(row)
+
+def get_schools_fingerprint(cursor):
+    """A value that changes whenever a school is added, deleted or touched"""
+    cursor.execute('SELECT COUNT(*), MAX(id), SUM(data_version) FROM schools')
+    row = cursor.fetchone()
+    values = row.values() if isinstance(row, dict) else row
+    return '-'.join(str(value or 0) for value in values)
+
+def resolve_current_academic_year_id(cursor):
+    """Return the id of the current system academic year, or the latest one if none is flagged"""
+    cursor.execute('SELECT id FROM system_academic_years WHERE is_current = 1 ORDER BY start_year DESC LIMIT 1')
+    year = cursor.fetchone()
+    if not year:
+        cursor.execute('SELECT id FROM system_academic_years ORDER BY start_year DESC LIMIT 1')
+        year = cursor.fetchone()
+    if not year:
+        return None
+    return year['id'] if isinstance(year, dict) else year[0]
+
 def generate_school_code():
     import time
     import random
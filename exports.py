@@ -0,0 +1,143 @@
+import io
+import os
+import csv
+import tempfile
+from itertools import groupby
+import xlsxwriter
+from database import GRADE_PERIODS, iter_cursor_rows
+from analytics import ATTENDANCE_STATUS_KEYS
+from report_cards import PERIOD_NAMES, ATTENDANCE_NAMES
+
+# Student list export (CSV / XLSX), streamed from one cursor so memory stays
+# flat regardless of school size. Headers match the old browser export.
+STUDENT_EXPORT_COLUMNS = [
+    ('full_name', 'اسم الطالب'),
+    ('student_code', 'رمز الطالب'),
+    ('grade', 'الصف الدراسي'),
+    ('room', 'رقم القاعة'),
+    ('parent_contact', 'رقم ولي الأمر'),
+    ('blood_type', 'فصيلة الدم'),
+    ('chronic_disease', 'الأمراض المزمنة'),
+]
+EXPORT_FORMATS = ('csv', 'xlsx')
+# Rows written per CSV chunk, and bytes per chunk when sending the finished XLSX file
+CSV_CHUNK_ROWS = 200
+FILE_CHUNK_BYTES = 64 * 1024
+
+def _export_subjects(cur, school_id, academic_year_id, grade, room):
+    query = '''SELECT DISTINCT sg.subject_name FROM student_grades sg
+               JOIN students s ON s.id = sg.student_id
+               WHERE s.school_id = %s AND sg.academic_year_id = %s'''
+    params = [school_id, academic_year_id]
+    if grade:
+        query += ' AND s.grade = %s'
+        params.append(grade)
+    if room:
+        query += ' AND s.room = %s'
+        params.append(room)
+    cur.execute(query + ' ORDER BY sg.subject_name', tuple(params))
+    return [row['subject_name'] for row in cur.fetchall()]
+
+def iter_student_export_rows(cur, school_id, academic_year_id=None, include_grades=False,
+                             include_attendance=False, grade=None, room=None):
+    """Yield the header row, then one row per student.
+
+    Grades of the given academic year are joined in as one column per
+    subject and period, attendance as one count per status. Students come
+    out of a single ordered query, and the grade rows of one student are
+    folded together as they stream past, so only one student is held at a time.
+    """
+    subjects = _export_subjects(cur, school_id, academic_year_id, grade, room) if include_grades else []
+    statuses = list(ATTENDANCE_NAMES) if include_attendance else []
+
+    header = ['الرقم'] + [title for _, title in STUDENT_EXPORT_COLUMNS]
+    header += [f'{subject} - {PERIOD_NAMES[period]}' for subject in subjects for period in GRADE_PERIODS]
+    header += [f'الحضور - {ATTENDANCE_NAMES[status]}' for status in statuses]
+    yield header
+
+    select = ['s.id'] + [f's.{column}' for column, _ in STUDENT_EXPORT_COLUMNS]
+    joins = []
+    params = []
+    if statuses:
+        counts = []
+        for status in statuses:
+            names = [name for name, key in ATTENDANCE_STATUS_KEYS.items() if key == status]
+            counts.append(f"SUM(CASE WHEN status IN ({', '.join(['%s'] * len(names))}) THEN 1 ELSE 0 END) AS att_{status}")
+            params.extend(names)
+        joins.append(f'''LEFT JOIN (SELECT student_id, {', '.join(counts)} FROM student_attendance
+                                    WHERE academic_year_id = %s GROUP BY student_id) a ON a.student_id = s.id''')
+        params.append(academic_year_id)
+        select += [f'a.att_{status}' for status in statuses]
+    if subjects:
+        joins.append('LEFT JOIN student_grades sg ON sg.student_id = s.id AND sg.academic_year_id = %s')
+        params.append(academic_year_id)
+        select += ['sg.subject_name'] + [f'sg.{period}' for period in GRADE_PERIODS]
+
+    query = f"SELECT {', '.join(select)} FROM students s {' '.join(joins)} WHERE s.school_id = %s"
+    params.append(school_id)
+    if grade:
+        query += ' AND s.grade = %s'
+        params.append(grade)
+    if room:
+        query += ' AND s.room = %s'
+        params.append(room)
+    cur.execute(query + ' ORDER BY s.grade, s.room, s.full_name, s.id', tuple(params))
+
+    subject_index = {subject: i for i, subject in enumerate(subjects)}
+    for number, (_, rows) in enumerate(groupby(iter_cursor_rows(cur), key=lambda row: row['id']), start=1):
+        rows = list(rows)
+        first = rows[0]
+        row = [number] + [first[column] or '' for column, _ in STUDENT_EXPORT_COLUMNS]
+        if subjects:
+            scores = [''] * (len(subjects) * len(GRADE_PERIODS))
+            for grade_row in rows:
+                if grade_row['subject_name'] in subject_index:
+                    offset = subject_index[grade_row['subject_name']] * len(GRADE_PERIODS)
+                    for i, period in enumerate(GRADE_PERIODS):
+                        scores[offset + i] = grade_row[period] if grade_row[period] is not None else ''
+            row += scores
+        row += [int(first[f'att_{status}'] or 0) for status in statuses]
+        yield row
+
+def iter_csv(rows):
+    """Encode rows as UTF-8 CSV chunks, with a BOM so Excel detects Arabic text"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def iter_xlsx(rows, sheet_name='بيانات الطلاب'):
+    """Write rows to a temporary XLSX file in constant-memory mode, then yield its bytes.
+
+    XlsxWriter flushes every row to disk as soon as the next one starts, so
+    memory stays flat; the zip container can only be sent once it is complete.
+    """
+    handle, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(handle)
+    try:
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.right_to_left()
+        header_format = workbook.add_format({'bold': True})
+        for row_number, row in enumerate(rows):
+            if row_number == 0:
+                worksheet.write_row(0, 0, row, header_format)
+            else:
+                worksheet.write_row(row_number, 0, row)
+        workbook.close()
+
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
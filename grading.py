@@ -0,0 +1,59 @@
+# Grading scale rules shared by the API and the background jobs
+
+# Helper function to determine if a grade is elementary grades 1-4
+def is_elementary_grades_1_to_4(grade_string):
+    """
+    Check if a grade string represents elementary (ابتدائي) grades 1-4.
+    These grades use a 10-point scale, while all others use 100-point scale.
+    
+    Args:
+        grade_string: Full grade string like "ابتدائي - الأول الابتدائي"
+    Returns:
+        bool: True if grade is elementary 1-4, False otherwise
+    """
+    if not grade_string:
+        return False
+    
+    grade_parts = grade_string.split(' - ')
+    if len(grade_parts) < 2:
+        return False
+    
+    educational_level = grade_parts[0].strip()  # e.g., "ابتدائي"
+    grade_level = grade_parts[1].strip()  # e.g., "الأول الابتدائي"
+    
+    # Check if this is an elementary (ابتدائي) school level
+    is_elementary = ('ابتدائي' in educational_level or 
+                     'ابتدائي' in grade_level or 
+                     'الابتدائي' in grade_level)
+    
+    if not is_elementary:
+        return False
+    
+    # Check if grade is first, second, third, or fourth
+    grades_1_to_4 = ['الأول', 'الثاني', 'الثالث', 'الرابع', 'اول', 'ثاني', 'ثالث', 'رابع', 'الاول']
+    is_grades_1_to_4 = any(x in grade_level for x in grades_1_to_4)
+    
+    # Make sure it's NOT fifth or sixth grade (which should use 100-point scale)
+    grades_5_or_6 = ['الخامس', 'السادس', 'خامس', 'سادس']
+    is_grades_5_or_6 = any(x in grade_level for x in grades_5_or_6)
+    
+    return is_grades_1_to_4 and not is_grades_5_or_6
+
+def get_max_score(grade_string):
+    """Return the top of the score scale for a grade: 10 for elementary grades 1-4, otherwise 100"""
+    return 10 if is_elementary_grades_1_to_4(grade_string) else 100
+
+def get_pass_threshold(grade_string):
+    """Lowest passing score for a grade: 5 on the 10-point scale, 50 on the 100-point scale"""
+    return get_max_score(grade_string) // 2
+
+# Every score scale in use: elementary grades 1-4 and everyone else
+SCORE_SCALES = (10, 100)
+
+def score_bands(max_score):
+    """(excellent, good, pass) lower bounds on a scale: 90%, 70% and 50% of max_score"""
+    return max_score * 9 // 10, max_score * 7 // 10, max_score // 2
+
+def get_score_bands(grade_string):
+    """(excellent, good, pass) lower bounds for a grade: 9/7/5 on the 10-point scale, 90/70/50 on the 100-point scale"""
+    return score_bands(get_max_score(grade_string))
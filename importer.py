@@ -0,0 +1,288 @@
+import io
+import os
+import csv
+import math
+import datetime
+from openpyxl import load_workbook
+from database import GRADE_PERIODS, upsert_many, upsert_student_attendance, touch_school
+from grading import get_max_score
+from analytics import ATTENDANCE_STATUS_KEYS
+from report_cards import PERIOD_NAMES
+from summaries import refresh_student_summaries
+
+# Grade-sheet and attendance file import. Rows are read one at a time from the
+# uploaded CSV/XLSX and written in chunked transactions, so file size does not
+# affect memory; only the per-line error report (capped) and the roster lookups grow.
+IMPORT_KINDS = ('grades', 'attendance')
+IMPORT_EXTENSIONS = ('.csv', '.xlsx')
+IMPORT_CHUNK_ROWS = 1000
+# Errors listed in the report; the count always covers every rejected line
+MAX_IMPORT_ERRORS = 1000
+
+# Header -> field. English field names and the Arabic headers of our own exports are accepted.
+# Grade sheets may also be in the export's wide layout: one "<subject> - <period>" column
+# per subject and period (e.g. "الرياضيات - شهر الأول"), read as one row per subject.
+HEADER_ALIASES = {
+    'student_code': 'student_code', 'رمز الطالب': 'student_code',
+    'subject': 'subject', 'subject_name': 'subject', 'المادة': 'subject',
+    'date': 'date', 'attendance_date': 'date', 'التاريخ': 'date',
+    'status': 'status', 'الحالة': 'status',
+    'notes': 'notes', 'الملاحظات': 'notes',
+}
+HEADER_ALIASES.update({period: period for period in GRADE_PERIODS})
+HEADER_ALIASES.update({name: period for period, name in PERIOD_NAMES.items()})
+PERIOD_ALIASES = {period: period for period in GRADE_PERIODS}
+PERIOD_ALIASES.update({name: period for period, name in PERIOD_NAMES.items()})
+REQUIRED_FIELDS = {
+    'grades': ('student_code', 'subject'),
+    'attendance': ('student_code', 'date', 'status'),
+}
+
+class ImportFileError(ValueError):
+    """Raised when an uploaded file cannot be read as an import at all.
+
+    When raised part way through a file, report holds the counts of the
+    chunks committed before the unreadable line (see FileImport.run).
+    """
+    report = None
+
+def _normalize_header(header):
+    """Fields of the header: a field name, a (subject, period) pair for a wide column, or None"""
+    fields = []
+    for value in header:
+        name = str(value).strip() if value is not None else ''
+        field = HEADER_ALIASES.get(name.lower(), HEADER_ALIASES.get(name))
+        if field is None and ' - ' in name:
+            subject, _, period = name.rpartition(' - ')
+            period = PERIOD_ALIASES.get(period.strip().lower(), PERIOD_ALIASES.get(period.strip()))
+            if period and subject.strip():
+                field = (subject.strip(), period)
+        fields.append(field)
+    return fields
+
+def _split_wide_row(values):
+    """Turn one row of "<subject> - <period>" cells into one row per subject that has any score"""
+    common = {field: value for field, value in values.items() if not isinstance(field, tuple)}
+    subjects = {}
+    for field, value in values.items():
+        if isinstance(field, tuple) and value not in (None, ''):
+            subject, period = field
+            subjects.setdefault(subject, {})[period] = value
+    return [dict(common, subject=subject, **scores) for subject, scores in subjects.items()]
+
+def iter_upload_rows(file_storage, kind):
+    """Yield (line number, {field: value}) for each data row of an uploaded CSV or XLSX file"""
+    extension = os.path.splitext(file_storage.filename or '')[1].lower()
+    if extension not in IMPORT_EXTENSIONS:
+        raise ImportFileError(f'File must be one of: {", ".join(IMPORT_EXTENSIONS)}')
+
+    if extension == '.csv':
+        text = io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', newline='')
+        rows = csv.reader(text)
+    else:
+        try:
+            workbook = load_workbook(file_storage.stream, read_only=True, data_only=True)
+        except Exception as e:
+            raise ImportFileError(f'Could not read the workbook: {e}')
+        rows = workbook.active.iter_rows(values_only=True)
+
+    # Bad encoding or quoting surfaces while rows are read, possibly after earlier chunks were committed
+    read_errors = (UnicodeDecodeError, csv.Error) if extension == '.csv' else (Exception,)
+    line = 0
+    try:
+        header = next(rows, None)
+        if not header:
+            raise ImportFileError('File is empty')
+        fields = _normalize_header(header)
+        wide = kind == 'grades' and any(isinstance(field, tuple) for field in fields)
+        if wide:
+            fields = [None if field == 'subject' or field in GRADE_PERIODS else field for field in fields]
+            missing = [field for field in ('student_code',) if field not in fields]
+        else:
+            missing = [field for field in REQUIRED_FIELDS[kind] if field not in fields]
+            if kind == 'grades' and not any(period in fields for period in GRADE_PERIODS):
+                missing.append(' / '.join(GRADE_PERIODS))
+        if missing:
+            raise ImportFileError(f'Missing columns: {", ".join(missing)}')
+
+        line = 1
+        for line, row in enumerate(rows, start=2):
+            values = {field: value for field, value in zip(fields, row) if field}
+            if wide:
+                for subject_values in _split_wide_row(values):
+                    yield line, subject_values
+            elif any(value not in (None, '') for value in values.values()):
+                yield line, values
+    except ImportFileError:
+        raise
+    except read_errors as e:
+        where = f' after line {line}' if line else ''
+        raise ImportFileError(f'Could not read the file{where}: {e}')
+    finally:
+        if extension == '.xlsx':
+            workbook.close()
+
+def _text(value):
+    return str(value).strip() if value is not None else ''
+
+def _parse_score(value, max_score):
+    """None for an empty cell (keep the stored score), otherwise a score in 0..max_score"""
+    if value is None or _text(value) == '':
+        return None
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Score must be a number, got {value!r}')
+    if not math.isfinite(score) or score != int(score) or not 0 <= score <= max_score:
+        raise ValueError(f'Score must be a whole number between 0 and {max_score}, got {value!r}')
+    return int(score)
+
+def _parse_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    try:
+        return datetime.datetime.strptime(_text(value), '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        raise ValueError(f'Date must be YYYY-MM-DD, got {value!r}')
+
+class FileImport:
+    """Validate and upsert one uploaded file chunk by chunk, collecting a per-line report"""
+
+    def __init__(self, conn, school_id, academic_year_id, kind):
+        self.conn = conn
+        self.cur = conn.cursor(dictionary=True)
+        self.school_id = school_id
+        self.academic_year_id = academic_year_id
+        self.kind = kind
+        self.students = {}
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        # Last file line of the most recent committed chunk
+        self.committed_through_line = 0
+
+        self.cur.execute('SELECT DISTINCT name FROM subjects WHERE school_id = %s', (school_id,))
+        self.subjects = {row['name'].strip().lower(): row['name'] for row in self.cur.fetchall()}
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def _load_students(self, codes):
+        """Fetch roster rows for codes not seen yet, one query per chunk"""
+        missing = sorted({code for code in codes if code and code not in self.students})
+        if not missing:
+            return
+        placeholders = ', '.join(['%s'] * len(missing))
+        self.cur.execute(f'''SELECT id, grade, student_code FROM students
+                             WHERE school_id = %s AND student_code IN ({placeholders})''',
+                         (self.school_id, *missing))
+        for row in self.cur.fetchall():
+            self.students[row['student_code']] = row
+        for code in missing:
+            self.students.setdefault(code, None)
+
+    def run(self, rows):
+        """Import every row and return the report.
+
+        An ImportFileError part way through leaves the chunks before it
+        committed; its report attribute says how many rows that was and the
+        last line included, so the caller can tell the user where to resume.
+        """
+        chunk = []
+        try:
+            for line, values in rows:
+                chunk.append((line, values))
+                if len(chunk) >= IMPORT_CHUNK_ROWS:
+                    self._import_chunk(chunk)
+                    chunk = []
+        except ImportFileError as e:
+            e.report = self.report()
+            raise
+        if chunk:
+            self._import_chunk(chunk)
+        return self.report()
+
+    def report(self):
+        return {
+            'imported_rows': self.imported,
+            'committed_through_line': self.committed_through_line,
+            'failed_rows': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+    def _import_chunk(self, chunk):
+        self._load_students(_text(values.get('student_code')) for _, values in chunk)
+        parse = self._parse_grade_row if self.kind == 'grades' else self._parse_attendance_row
+        parsed = []
+        for line, values in chunk:
+            student = self.students.get(_text(values.get('student_code')))
+            if not student:
+                self.error(line, f"Unknown student code {_text(values.get('student_code'))!r}")
+                continue
+            try:
+                parsed.append((line, student['id'], parse(student, values)))
+            except ValueError as e:
+                self.error(line, str(e))
+        if not parsed:
+            return
+
+        try:
+            if self.kind == 'grades':
+                self._write_grades(parsed)
+            else:
+                upsert_student_attendance(self.cur, [(student_id, self.academic_year_id) + record
+                                                     for _, student_id, record in parsed])
+            touch_school(self.cur, self.school_id)
+            refresh_student_summaries(self.conn, [student_id for _, student_id, _ in parsed], self.academic_year_id)
+            self.conn.commit()
+            self.imported += len(parsed)
+            self.committed_through_line = chunk[-1][0]
+        except Exception as e:
+            self.conn.rollback()
+            for line, _, _ in parsed:
+                self.error(line, f'Database error: {e}')
+
+    def _parse_grade_row(self, student, values):
+        subject = _text(values.get('subject'))
+        if not subject:
+            raise ValueError('Subject is required')
+        if self.subjects:
+            if subject.lower() not in self.subjects:
+                raise ValueError(f'Unknown subject {subject!r}')
+            subject = self.subjects[subject.lower()]
+        max_score = get_max_score(student['grade'])
+        scores = {}
+        for period in GRADE_PERIODS:
+            score = _parse_score(values.get(period), max_score)
+            if score is not None:
+                scores[period] = score
+        if not scores:
+            raise ValueError('No scores in this row')
+        return subject, scores
+
+    def _parse_attendance_row(self, student, values):
+        status = ATTENDANCE_STATUS_KEYS.get(_text(values.get('status')).lower(),
+                                            ATTENDANCE_STATUS_KEYS.get(_text(values.get('status'))))
+        if not status:
+            raise ValueError(f"Invalid status {_text(values.get('status'))!r}")
+        return _parse_date(values.get('date')), status, _text(values.get('notes'))
+
+    def _write_grades(self, parsed):
+        """Upsert only the periods present in each row, so empty cells keep stored scores"""
+        merged = {}
+        for _, student_id, (subject, scores) in parsed:
+            merged.setdefault((student_id, subject), {}).update(scores)
+        by_periods = {}
+        for (student_id, subject), scores in merged.items():
+            periods = tuple(period for period in GRADE_PERIODS if period in scores)
+            by_periods.setdefault(periods, []).append(
+                (student_id, self.academic_year_id, subject) + tuple(scores[period] for period in periods))
+        key_columns = ['student_id', 'academic_year_id', 'subject_name']
+        for periods, rows in by_periods.items():
+            upsert_many(self.cur, 'student_grades', key_columns + list(periods), key_columns, rows,
+                        touch_updated_at=True)
@@ -0,0 +1,490 @@
+import os
+import json
+import time
+import zipfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from database import GRADE_PERIODS, get_mysql_pool, resolve_current_academic_year_id
+from grading import get_max_score, get_pass_threshold
+from promotion import promote_students, PROMOTION_CHUNK_SIZE
+from report_cards import render_report_card
+from analytics import ATTENDANCE_STATUS_KEYS
+
+# Background jobs run in this pool, outside the request cycle
+ROLLOVER_WORKERS = int(os.getenv('ROLLOVER_WORKERS', 2))
+# A running job whose heartbeat is older than this is treated as crashed and may be resumed
+JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', 300))
+# Only the first failures are kept in the job plan so it stays small
+MAX_REPORTED_FAILURES = 100
+
+_executor = ThreadPoolExecutor(max_workers=ROLLOVER_WORKERS, thread_name_prefix='rollover-job')
+
+class RolloverPlanError(ValueError):
+    """Raised when a grade progression cannot be turned into a rollover plan"""
+    pass
+
+def _grade_level_name(grade):
+    """'ابتدائي - الأول الابتدائي' -> 'الأول الابتدائي'"""
+    parts = grade.split(' - ', 1)
+    return parts[1].strip() if len(parts) == 2 else grade.strip()
+
+def _with_grade_level_name(grade, level_name):
+    """Swap the grade level in a student grade string, keeping its educational-level prefix"""
+    parts = grade.split(' - ', 1)
+    return f"{parts[0]} - {level_name}" if len(parts) == 2 else level_name
+
+def build_progression_map(cur, school_id):
+    """Map each grade level name of a school to the next one by grade_levels.display_order"""
+    cur.execute('SELECT name FROM grade_levels WHERE school_id = %s ORDER BY display_order, id', (school_id,))
+    names = [row['name'] for row in cur.fetchall()]
+    return {names[i]: names[i + 1] for i in range(len(names) - 1)}
+
+def validate_progression(progression):
+    """Raise RolloverPlanError unless progression maps non-empty level names to non-empty level names"""
+    for level, next_level in progression.items():
+        if not isinstance(level, str) or not level.strip() or not isinstance(next_level, str) or not next_level.strip():
+            raise RolloverPlanError(f'Grade progression must map level names to level names, got {level!r}: {next_level!r}')
+
+def _steps_to_top(level, progression):
+    """Number of promotions between a level and the top of its progression chain"""
+    steps = 0
+    seen = set()
+    while level in progression:
+        if level in seen:
+            raise RolloverPlanError(f'Grade progression contains a cycle at {level}')
+        seen.add(level)
+        level = progression[level]
+        steps += 1
+    return steps
+
+def build_rollover_plan(cur, school_ids, progression=None):
+    """Build the ordered list of (school, from grade, to grade) promotion steps.
+
+    Within a school, higher grades are promoted first, so a student who was
+    just moved into a grade is never picked up again by that grade's step.
+    This is also what makes a job safe to resume: re-running a step only
+    selects the students still sitting in its source grade.
+    """
+    if progression:
+        validate_progression(progression)
+    steps = []
+    total = 0
+    graduating = 0
+    for school_id in school_ids:
+        school_progression = progression or build_progression_map(cur, school_id)
+        cur.execute('SELECT grade, COUNT(*) AS student_count FROM students WHERE school_id = %s GROUP BY grade',
+                    (school_id,))
+        school_steps = []
+        for row in cur.fetchall():
+            level = _grade_level_name(row['grade'])
+            next_level = school_progression.get(level)
+            if not next_level:
+                graduating += row['student_count']
+                continue
+            school_steps.append({
+                'school_id': school_id,
+                'from_grade': row['grade'],
+                'to_grade': _with_grade_level_name(row['grade'], next_level),
+                'students': row['student_count'],
+                'promoted': 0,
+                'failed': 0,
+                'done': False,
+                'rank': _steps_to_top(level, school_progression),
+            })
+        school_steps.sort(key=lambda step: step['rank'])
+        for step in school_steps:
+            del step['rank']
+            total += step['students']
+        steps.extend(school_steps)
+    return {'steps': steps, 'graduating': graduating, 'failures': []}, total
+
+def _serialize_job(job):
+    plan = job.get('plan')
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    job['plan'] = plan or {}
+    total = job.get('total_students') or 0
+    processed = job.get('processed_students') or 0
+    job['progress'] = round(processed * 100.0 / total, 1) if total else 100.0
+    return job
+
+def create_rollover_job(school_id=None, academic_year_id=None, progression=None):
+    """Plan a year-end rollover for one school (or all schools) and queue it. Returns the job."""
+    pool = get_mysql_pool()
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        if school_id:
+            school_ids = [school_id]
+        else:
+            cur.execute('SELECT id FROM schools ORDER BY id')
+            school_ids = [row['id'] for row in cur.fetchall()]
+        if not academic_year_id:
+            academic_year_id = resolve_current_academic_year_id(cur)
+
+        plan, total = build_rollover_plan(cur, school_ids, progression)
+        cur.execute('''INSERT INTO rollover_jobs (school_id, academic_year_id, status, total_students, plan)
+                       VALUES (%s, %s, %s, %s, %s)''',
+                    (school_id, academic_year_id, 'pending', total, json.dumps(plan)))
+        job_id = cur.lastrowid
+        conn.commit()
+    finally:
+        conn.close()
+
+    _executor.submit(run_rollover_job, job_id)
+    return get_job(job_id)
+
+def get_job(job_id):
+    pool = get_mysql_pool()
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute('SELECT * FROM rollover_jobs WHERE id = %s', (job_id,))
+        job = cur.fetchone()
+    finally:
+        conn.close()
+    return _serialize_job(job) if job else None
+
+def resume_rollover_job(job_id):
+    """Queue a failed or crashed job again. Returns False if the job cannot be resumed."""
+    job = get_job(job_id)
+    if not job or not _is_resumable(job):
+        return False
+    _executor.submit(run_rollover_job, job_id)
+    return True
+
+def _is_resumable(job):
+    if job['status'] in ('pending', 'failed'):
+        return True
+    return job['status'] == 'running' and (job['heartbeat_at'] or 0) < time.time() - JOB_STALE_SECONDS
+
+def recover_rollover_jobs():
+    """Resume rollover jobs left pending or running (stale heartbeat) by a crash or restart.
+
+    Failed jobs are left for a user to resume, since they stopped on an error.
+    Returns the job ids; _claim_job keeps each job running in one worker only.
+    """
+    pool = get_mysql_pool()
+    if not pool:
+        return []
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute('''SELECT id FROM rollover_jobs
+                       WHERE status = 'pending' OR (status = 'running' AND heartbeat_at < %s) ORDER BY id''',
+                    (int(time.time()) - JOB_STALE_SECONDS,))
+        job_ids = [row['id'] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+    for job_id in job_ids:
+        _executor.submit(run_rollover_job, job_id)
+    if job_ids:
+        print(f"🔄 Resumed {len(job_ids)} rollover job(s): {job_ids}")
+    return job_ids
+
+def _claim_job(cur, job_id):
+    """Atomically mark a job as running so two workers never process it at once"""
+    now = int(time.time())
+    cur.execute('''UPDATE rollover_jobs SET status = 'running', error = NULL, heartbeat_at = %s,
+                   updated_at = CURRENT_TIMESTAMP
+                   WHERE id = %s AND (status IN ('pending', 'failed')
+                                      OR (status = 'running' AND heartbeat_at < %s))''',
+                (now, job_id, now - JOB_STALE_SECONDS))
+    return cur.rowcount == 1
+
+def _save_progress(cur, job_id, plan, status='running', error=None):
+    steps = plan['steps']
+    promoted = sum(step['promoted'] for step in steps)
+    failed = sum(step['failed'] for step in steps)
+    cur.execute('''UPDATE rollover_jobs SET status = %s, processed_students = %s, failed_students = %s,
+                   plan = %s, error = %s, heartbeat_at = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s''',
+                (status, promoted + failed, failed, json.dumps(plan), error, int(time.time()), job_id))
+
+def run_rollover_job(job_id):
+    """Worker entry point: run (or resume) every unfinished step of a rollover job"""
+    pool = get_mysql_pool()
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        if not _claim_job(cur, job_id):
+            conn.commit()
+            return
+        conn.commit()
+
+        cur.execute('SELECT * FROM rollover_jobs WHERE id = %s', (job_id,))
+        job = _serialize_job(cur.fetchone())
+        plan = job['plan']
+        try:
+            for step in plan['steps']:
+                if step['done']:
+                    continue
+                # Students that failed in an earlier attempt are retried
+                step['failed'] = 0
+                cur.execute('SELECT id FROM students WHERE school_id = %s AND grade = %s ORDER BY id',
+                            (step['school_id'], step['from_grade']))
+                student_ids = [row['id'] for row in cur.fetchall()]
+
+                for start in range(0, len(student_ids), PROMOTION_CHUNK_SIZE):
+                    chunk = student_ids[start:start + PROMOTION_CHUNK_SIZE]
+                    promoted_ids, failed, _ = promote_students(conn, chunk, step['to_grade'], job['academic_year_id'])
+                    step['promoted'] += len(promoted_ids)
+                    step['failed'] += len(failed)
+                    room = MAX_REPORTED_FAILURES - len(plan['failures'])
+                    if room > 0:
+                        plan['failures'].extend(failed[:room])
+                    _save_progress(cur, job_id, plan)
+                    conn.commit()
+
+                step['done'] = True
+                _save_progress(cur, job_id, plan)
+                conn.commit()
+
+            _save_progress(cur, job_id, plan, status='completed')
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Rollover job {job_id} failed: {e}")
+            _save_progress(cur, job_id, plan, status='failed', error=str(e))
+            conn.commit()
+    finally:
+        conn.close()
+
+# ------ Report-card batches ------
+# Cards are rendered in a process pool so CPU-bound templating never blocks the
+# web workers; the job thread only loads data and appends finished cards to the zip.
+REPORT_CARD_PROCESSES = int(os.getenv('REPORT_CARD_PROCESSES', os.cpu_count() or 2))
+REPORT_CARDS_DIR = os.getenv('REPORT_CARDS_DIR', os.path.join(os.path.dirname(__file__), 'reports'))
+# Finished archives are deleted this long after their job completed
+REPORT_CARD_RETENTION_HOURS = float(os.getenv('REPORT_CARD_RETENTION_HOURS', 72))
+# Cards handed to a worker process at a time, and cards between progress updates
+REPORT_CARD_CHUNK_SIZE = 25
+REPORT_CARD_PROGRESS_EVERY = 50
+REPORT_CARD_FORMATS = ('html',)
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def _get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # Never fork this multi-threaded server: a child could inherit a lock
+            # (DB pool, logging, ...) held mid-fork by another thread and deadlock.
+            # Workers start from a clean forkserver (spawn where unavailable) and
+            # only need report_cards, which imports neither the database nor the app.
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['report_cards'])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _render_pool = ProcessPoolExecutor(max_workers=REPORT_CARD_PROCESSES, mp_context=context)
+        return _render_pool
+
+def _with_progress(job):
+    total = job.get('total_students') or 0
+    processed = job.get('processed_students') or 0
+    if total:
+        job['progress'] = round(processed * 100.0 / total, 1)
+    else:
+        job['progress'] = 100.0 if job['status'] == 'completed' else 0.0
+    return job
+
+def create_report_card_job(school_id, grade, academic_year_id=None, report_format='html'):
+    """Queue report cards for every student of a grade. Returns the job."""
+    pool = get_mysql_pool()
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        if not academic_year_id:
+            academic_year_id = resolve_current_academic_year_id(cur)
+        cur.execute('SELECT COUNT(*) AS student_count FROM students WHERE school_id = %s AND grade = %s',
+                    (school_id, grade))
+        total = cur.fetchone()['student_count']
+        cur.execute('''INSERT INTO report_card_jobs (school_id, academic_year_id, grade, format, status, total_students)
+                       VALUES (%s, %s, %s, %s, %s, %s)''',
+                    (school_id, academic_year_id, grade, report_format, 'pending', total))
+        job_id = cur.lastrowid
+        conn.commit()
+    finally:
+        conn.close()
+
+    _executor.submit(run_report_card_job, job_id)
+    return get_report_card_job(job_id)
+
+def get_report_card_job(job_id):
+    pool = get_mysql_pool()
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute('SELECT * FROM report_card_jobs WHERE id = %s', (job_id,))
+        job = cur.fetchone()
+    finally:
+        conn.close()
+    return _with_progress(job) if job else None
+
+def load_report_cards(cur, school_id, grade, academic_year_id):
+    """Build the render input of every student of a grade with a fixed number of queries"""
+    cur.execute('SELECT name FROM schools WHERE id = %s', (school_id,))
+    school = cur.fetchone()
+    cur.execute('SELECT name FROM system_academic_years WHERE id = %s', (academic_year_id,))
+    year = cur.fetchone()
+    cur.execute('''SELECT id, full_name, student_code, room FROM students
+                   WHERE school_id = %s AND grade = %s ORDER BY room, full_name''', (school_id, grade))
+    students = cur.fetchall()
+
+    cards = {}
+    for student in students:
+        cards[student['id']] = {
+            'school_name': school['name'] if school else '',
+            'year_name': year['name'] if year else '',
+            'grade': grade,
+            'periods': list(GRADE_PERIODS),
+            'max_score': get_max_score(grade),
+            'pass_threshold': get_pass_threshold(grade),
+            'student': dict(student),
+            'subjects': {},
+            'attendance': {},
+        }
+
+    cur.execute(f'''SELECT sg.student_id, sg.subject_name, {', '.join(f'sg.{period}' for period in GRADE_PERIODS)}
+                    FROM student_grades sg
+                    JOIN students s ON s.id = sg.student_id
+                    WHERE s.school_id = %s AND s.grade = %s AND sg.academic_year_id = %s''',
+                (school_id, grade, academic_year_id))
+    for row in cur.fetchall():
+        if row['student_id'] in cards:
+            cards[row['student_id']]['subjects'][row['subject_name']] = {period: row[period] for period in GRADE_PERIODS}
+
+    cur.execute('''SELECT sa.student_id, sa.status, COUNT(*) AS records
+                   FROM student_attendance sa
+                   JOIN students s ON s.id = sa.student_id
+                   WHERE s.school_id = %s AND s.grade = %s AND sa.academic_year_id = %s
+                   GROUP BY sa.student_id, sa.status''', (school_id, grade, academic_year_id))
+    for row in cur.fetchall():
+        status = ATTENDANCE_STATUS_KEYS.get(row['status'])
+        if status and row['student_id'] in cards:
+            attendance = cards[row['student_id']]['attendance']
+            attendance[status] = attendance.get(status, 0) + int(row['records'])
+
+    return [cards[student['id']] for student in students]
+
+def _save_report_progress(cur, job_id, processed, status='running', file_path=None, error=None):
+    cur.execute('''UPDATE report_card_jobs SET status = %s, processed_students = %s, file_path = %s, error = %s,
+                   heartbeat_at = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s''',
+                (status, processed, file_path, error, int(time.time()), job_id))
+
+def run_report_card_job(job_id):
+    """Worker entry point: render every card of a job into REPORT_CARDS_DIR/report-cards-<id>.zip"""
+    pool = get_mysql_pool()
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute('''UPDATE report_card_jobs SET status = 'running', heartbeat_at = %s, updated_at = CURRENT_TIMESTAMP
+                       WHERE id = %s AND status = 'pending' ''', (int(time.time()), job_id))
+        claimed = cur.rowcount == 1
+        conn.commit()
+        if not claimed:
+            return
+
+        cur.execute('SELECT * FROM report_card_jobs WHERE id = %s', (job_id,))
+        job = cur.fetchone()
+        processed = 0
+        try:
+            cards = load_report_cards(cur, job['school_id'], job['grade'], job['academic_year_id'])
+            # Students may have been added or moved since the job was queued
+            cur.execute('UPDATE report_card_jobs SET total_students = %s WHERE id = %s', (len(cards), job_id))
+            conn.commit()
+
+            os.makedirs(REPORT_CARDS_DIR, exist_ok=True)
+            file_path = os.path.join(REPORT_CARDS_DIR, f'report-cards-{job_id}.zip')
+            partial_path = file_path + '.part'
+            with zipfile.ZipFile(partial_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                rendered = _get_render_pool().map(render_report_card, cards, chunksize=REPORT_CARD_CHUNK_SIZE)
+                for filename, content in rendered:
+                    archive.writestr(filename, content)
+                    processed += 1
+                    if processed % REPORT_CARD_PROGRESS_EVERY == 0:
+                        _save_report_progress(cur, job_id, processed)
+                        conn.commit()
+            os.replace(partial_path, file_path)
+
+            _save_report_progress(cur, job_id, processed, status='completed', file_path=file_path)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Report card job {job_id} failed: {e}")
+            _save_report_progress(cur, job_id, processed, status='failed', error=str(e))
+            conn.commit()
+    finally:
+        conn.close()
+    try:
+        expire_report_card_archives()
+    except Exception as e:
+        print(f"❌ Could not clean up report card archives: {e}")
+
+def recover_report_card_jobs():
+    """Requeue report-card jobs lost by a crash or restart. Returns the job ids.
+
+    'pending' jobs were queued in a process that is gone, and 'running' jobs
+    whose heartbeat is older than JOB_STALE_SECONDS died mid-render. Both are
+    put back to 'pending' and resubmitted; run_report_card_job claims a job
+    atomically, so a job recovered by several workers still runs once.
+    """
+    pool = get_mysql_pool()
+    if not pool:
+        return []
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        stale_before = int(time.time()) - JOB_STALE_SECONDS
+        cur.execute('''UPDATE report_card_jobs SET status = 'pending', processed_students = 0,
+                       updated_at = CURRENT_TIMESTAMP
+                       WHERE status = 'running' AND heartbeat_at < %s''', (stale_before,))
+        conn.commit()
+        cur.execute("SELECT id FROM report_card_jobs WHERE status = 'pending' ORDER BY id")
+        job_ids = [row['id'] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+    for job_id in job_ids:
+        _executor.submit(run_report_card_job, job_id)
+    if job_ids:
+        print(f"🔄 Requeued {len(job_ids)} report card job(s): {job_ids}")
+    return job_ids
+
+def expire_report_card_archives(retention_hours=REPORT_CARD_RETENTION_HOURS):
+    """Delete archives of jobs completed more than retention_hours ago, plus leftover files.
+
+    Expired jobs are marked 'expired'. Files in REPORT_CARDS_DIR that no job
+    points to (crashed .part files, deleted schools) are removed once they
+    are older than the retention period as well.
+    """
+    pool = get_mysql_pool()
+    if not pool:
+        return 0
+    cutoff = time.time() - retention_hours * 3600
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute('''SELECT id, file_path FROM report_card_jobs
+                       WHERE status = 'completed' AND heartbeat_at < %s''', (int(cutoff),))
+        expired = cur.fetchall()
+        for job in expired:
+            if job['file_path'] and os.path.exists(job['file_path']):
+                os.remove(job['file_path'])
+            cur.execute('''UPDATE report_card_jobs SET status = 'expired', file_path = NULL,
+                           updated_at = CURRENT_TIMESTAMP WHERE id = %s''', (job['id'],))
+        conn.commit()
+        cur.execute("SELECT file_path FROM report_card_jobs WHERE file_path IS NOT NULL")
+        kept = {os.path.abspath(row['file_path']) for row in cur.fetchall()}
+    finally:
+        conn.close()
+
+    if os.path.isdir(REPORT_CARDS_DIR):
+        for name in os.listdir(REPORT_CARDS_DIR):
+            path = os.path.abspath(os.path.join(REPORT_CARDS_DIR, name))
+            if path not in kept and os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+    return len(expired)
@@ -0,0 +1,83 @@
+import json
+from database import GRADE_PERIODS, insert_missing_student_grades, resolve_current_academic_year_id, touch_schools_of
+from summaries import refresh_student_summaries
+
+# Students promoted per transaction
+PROMOTION_CHUNK_SIZE = 500
+
+def _parse_detailed_scores(value):
+    if not value:
+        return {}
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+def promote_students(conn, student_ids, new_grade, academic_year_id=None, chunk_size=PROMOTION_CHUNK_SIZE):
+    """Promote many students to new_grade with a fixed number of statements per chunk.
+
+    For every chunk of student ids this runs one SELECT, one
+    UPDATE students ... WHERE id IN (...) and one batched insert of empty
+    grade rows for the new academic year, then commits. The academic year
+    is resolved once for the whole run. A failing chunk is rolled back and
+    its students are reported in failed_promotions; other chunks still commit.
+
+    Returns (promoted_ids, failed_promotions, academic_year_id).
+    """
+    cur = conn.cursor(dictionary=True)
+    if not academic_year_id:
+        academic_year_id = resolve_current_academic_year_id(cur)
+
+    promoted_ids = []
+    failed_promotions = []
+
+    valid_ids = []
+    for student_id in student_ids:
+        if isinstance(student_id, int) and not isinstance(student_id, bool):
+            valid_ids.append(student_id)
+        else:
+            failed_promotions.append({'id': student_id, 'reason': 'Invalid student id'})
+    # Keep the caller's order but promote each student only once
+    valid_ids = list(dict.fromkeys(valid_ids))
+
+    for start in range(0, len(valid_ids), chunk_size):
+        chunk = valid_ids[start:start + chunk_size]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        try:
+            cur.execute(f'SELECT id, detailed_scores FROM students WHERE id IN ({placeholders})', tuple(chunk))
+            found = {row['id']: row['detailed_scores'] for row in cur.fetchall()}
+
+            chunk_ids = []
+            grade_rows = []
+            empty_scores = (0,) * len(GRADE_PERIODS)
+            for student_id in chunk:
+                if student_id not in found:
+                    failed_promotions.append({'id': student_id, 'reason': 'Student not found'})
+                    continue
+                try:
+                    detailed_scores = _parse_detailed_scores(found[student_id])
+                except (ValueError, TypeError) as e:
+                    failed_promotions.append({'id': student_id, 'reason': f'Corrupted detailed_scores: {e}'})
+                    continue
+                chunk_ids.append(student_id)
+                if academic_year_id and isinstance(detailed_scores, dict):
+                    for subject_name in detailed_scores:
+                        grade_rows.append((student_id, academic_year_id, subject_name) + empty_scores)
+
+            if chunk_ids:
+                placeholders = ', '.join(['%s'] * len(chunk_ids))
+                cur.execute(f'UPDATE students SET grade = %s, updated_at = CURRENT_TIMESTAMP WHERE id IN ({placeholders})',
+                            (new_grade, *chunk_ids))
+                insert_missing_student_grades(cur, grade_rows)
+                # The new grade may use a different score scale
+                refresh_student_summaries(conn, chunk_ids)
+                touch_schools_of(cur, 'students', chunk_ids)
+            conn.commit()
+            promoted_ids.extend(chunk_ids)
+        except Exception as e:
+            conn.rollback()
+            failed_ids = {f['id'] for f in failed_promotions}
+            for student_id in chunk:
+                if student_id not in failed_ids:
+                    failed_promotions.append({'id': student_id, 'reason': str(e)})
+
+    return promoted_ids, failed_promotions, academic_year_id
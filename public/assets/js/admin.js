@@ -351,6 +351,8 @@ function exportSchoolsToExcel() {
 // تسجيل الخروج
 function logout() {
     if (confirm('هل أنت متأكد من تسجيل الخروج؟')) {
+        // Revoke the token on the server too; keepalive lets the request outlive the page
+        fetch('/api/logout', { method: 'POST', headers: getAuthHeaders(), keepalive: true }).catch(() => {});
         localStorage.removeItem('token');
         localStorage.removeItem('user');
         window.location.href = '/index.html';
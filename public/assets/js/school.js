@@ -1746,7 +1746,7 @@ async function fetchStudents() {
             await loadAcademicYears();
         }
         
-        const response = await fetch(`/api/school/${currentSchool.id}/students`, {
+        const response = await fetch(`/api/school/${currentSchool.id}/students?fields=*`, {
             headers: getAuthHeaders()
         });
         console.log('API Response status:', response.status);
@@ -3601,6 +3601,8 @@ async function deleteStudent(id) {
 
 function logout() {
     if (confirm('هل أنت متأكد من تسجيل الخروج؟')) {
+        // Revoke the token on the server too; keepalive lets the request outlive the page
+        fetch('/api/logout', { method: 'POST', headers: getAuthHeaders(), keepalive: true }).catch(() => {});
         localStorage.removeItem('token');
         localStorage.removeItem('school');
         localStorage.removeItem('subjects'); // Keep subjects as they are school-specific
@@ -3821,27 +3823,30 @@ async function addBulkStudents(e, originalGradeLevel) {
         return;
     }
     
-    // Add students
+    // Add students in one request; the server reports the outcome of every row
     let successCount = 0;
     let errorCount = 0;
     
-    for (const student of students) {
-        try {
-            const response = await fetch(`/api/school/${currentSchool.id}/student`, {
-                method: 'POST',
-                headers: getAuthHeaders(),
-                body: JSON.stringify(student)
+    try {
+        const response = await fetch(`/api/school/${currentSchool.id}/students/bulk`, {
+            method: 'POST',
+            headers: getAuthHeaders(),
+            body: JSON.stringify({ students: students })
+        });
+        const result = await response.json();
+        
+        if (Array.isArray(result.results)) {
+            successCount = result.created_count;
+            errorCount = result.failed_count;
+            result.results.filter(row => !row.success).forEach(row => {
+                console.error('Error saving student:', students[row.index], row.error);
             });
-            
-            if (response.ok) {
-                successCount++;
-            } else {
-                errorCount++;
-            }
-        } catch (error) {
-            console.error('Error saving student:', error);
-            errorCount++;
+        } else {
+            errorCount = students.length;
         }
+    } catch (error) {
+        console.error('Error saving students:', error);
+        errorCount = students.length;
     }
     
     // Show result notification
@@ -4080,27 +4085,30 @@ async function addBulkStudents(e, originalGradeLevel) {
         return;
     }
     
-    // Add students
+    // Add students in one request; the server reports the outcome of every row
     let successCount = 0;
     let errorCount = 0;
     
-    for (const student of students) {
-        try {
-            const response = await fetch('/api/school/' + currentSchool.id + '/student', {
-                method: 'POST',
-                headers: getAuthHeaders(),
-                body: JSON.stringify(student)
+    try {
+        const response = await fetch('/api/school/' + currentSchool.id + '/students/bulk', {
+            method: 'POST',
+            headers: getAuthHeaders(),
+            body: JSON.stringify({ students: students })
+        });
+        const result = await response.json();
+        
+        if (Array.isArray(result.results)) {
+            successCount = result.created_count;
+            errorCount = result.failed_count;
+            result.results.filter(row => !row.success).forEach(row => {
+                console.error('Error saving student:', students[row.index], row.error);
             });
-            
-            if (response.ok) {
-                successCount++;
-            } else {
-                errorCount++;
-            }
-        } catch (error) {
-            console.error('Error saving student:', error);
-            errorCount++;
+        } else {
+            errorCount = students.length;
         }
+    } catch (error) {
+        console.error('Error saving students:', error);
+        errorCount = students.length;
     }
     
     // Show result notification
@@ -4274,17 +4282,37 @@ function showPerformanceAnalytics() {
     loadPerformanceAnalytics();
 }
 
-function loadPerformanceAnalytics() {
+async function loadPerformanceAnalytics() {
     const selectedGrade = document.getElementById('analyticsGradeLevel').value;
     const selectedSubject = document.getElementById('analyticsSubject').value;
     
-    // Filter students based on selection
+    // Filter students based on selection (used for the AI predictions below)
     let filteredStudents = students;
     if (selectedGrade) {
         filteredStudents = filteredStudents.filter(student => student.grade === selectedGrade);
     }
     
-    if (filteredStudents.length === 0) {
+    // Indicators and distributions are aggregated (and cached) by the server
+    const params = new URLSearchParams();
+    if (selectedGrade) params.set('grade', selectedGrade);
+    if (selectedSubject) params.set('subject', selectedSubject);
+    if (selectedAcademicYearId) params.set('year', selectedAcademicYearId);
+    
+    let analytics = null;
+    try {
+        const response = await fetch(`/api/school/${currentSchool.id}/analytics?${params}`, {
+            headers: getAuthHeaders()
+        });
+        if (response.ok) {
+            analytics = (await response.json()).analytics;
+        } else {
+            console.error('Failed to load performance analytics');
+        }
+    } catch (error) {
+        console.error('Error loading performance analytics:', error);
+    }
+    
+    if (!analytics || (analytics.graded_scores === 0 && analytics.attendance_records === 0)) {
         // Reset indicators
         document.getElementById('avgGrade').textContent = '0';
         document.getElementById('passRate').textContent = '0%';
@@ -4293,81 +4321,14 @@ function loadPerformanceAnalytics() {
         return;
     }
     
-    // Calculate performance indicators
-    let totalGrades = 0;
-    let gradeCount = 0;
-    let passCount = 0;
-    let presentCount = 0;
-    let totalCount = 0;
-    let excellenceCount = 0;
-    
-    // Data for charts
-    const gradeDistribution = { excellent: 0, good: 0, average: 0, poor: 0 };
-    const attendanceDistribution = { present: 0, absent: 0, late: 0, excused: 0 };
-    
-    filteredStudents.forEach(student => {
-        // Calculate grades - only use data for the current academic year
-        for (const subject in student.grades) {
-            // If a specific subject is selected, only calculate for that subject
-            if (selectedSubject && subject !== selectedSubject) continue;
-            
-            const subjectGrades = student.grades[subject];
-            for (const period in subjectGrades) {
-                const grade = parseInt(subjectGrades[period]) || 0;
-                if (grade > 0) {
-                    totalGrades += grade;
-                    gradeCount++;
-                    
-                    // Check if student passed (assuming 50% is passing)
-                    const maxGrade = getMaxGradeForStudent(student);
-                    const passThreshold = maxGrade === 10 ? 5 : 50;
-                    if (grade >= passThreshold) {
-                        passCount++;
-                    }
-                    
-                    // Check for excellence (assuming 90% is excellence)
-                    if (grade >= (maxGrade === 10 ? 9 : 90)) {
-                        excellenceCount++;
-                        gradeDistribution.excellent++;
-                    } else if (grade >= (maxGrade === 10 ? 7 : 70)) {
-                        gradeDistribution.good++;
-                    } else if (grade >= (maxGrade === 10 ? 5 : 50)) {
-                        gradeDistribution.average++;
-                    } else {
-                        gradeDistribution.poor++;
-                    }
-                }
-            }
-        }
-        
-        // Calculate attendance - only use data for the current academic year
-        for (const date in student.attendance) {
-            const dayAttendance = student.attendance[date];
-            for (const subject in dayAttendance) {
-                // If a specific subject is selected, only calculate for that subject
-                if (selectedSubject && subject !== selectedSubject) continue;
-                
-                totalCount++;
-                const status = dayAttendance[subject];
-                if (status === 'حاضر') {
-                    presentCount++;
-                    attendanceDistribution.present++;
-                } else if (status === 'غائب') {
-                    attendanceDistribution.absent++;
-                } else if (status === 'متأخر') {
-                    attendanceDistribution.late++;
-                } else if (status === 'إجازة') {
-                    attendanceDistribution.excused++;
-                }
-            }
-        }
-    });
+    const gradeDistribution = analytics.grade_distribution;
+    const attendanceDistribution = analytics.attendance_distribution;
     
     // Update indicators
-    const avgGrade = gradeCount > 0 ? (totalGrades / gradeCount).toFixed(1) : 0;
-    const passRate = gradeCount > 0 ? ((passCount / gradeCount) * 100).toFixed(1) + '%' : '0%';
-    const attendanceRate = totalCount > 0 ? ((presentCount / totalCount) * 100).toFixed(1) + '%' : '0%';
-    const excellenceRate = gradeCount > 0 ? ((excellenceCount / gradeCount) * 100).toFixed(1) + '%' : '0%';
+    const avgGrade = analytics.avg_grade.toFixed(1);
+    const passRate = analytics.pass_rate.toFixed(1) + '%';
+    const attendanceRate = analytics.attendance_rate.toFixed(1) + '%';
+    const excellenceRate = analytics.excellence_rate.toFixed(1) + '%';
     
     document.getElementById('avgGrade').textContent = avgGrade;
     document.getElementById('passRate').textContent = passRate;
@@ -4809,12 +4770,13 @@ window.setupAcademicYearForm = setupAcademicYearForm;
 
 /**
  * Export all students to Excel file
- * Generates an Excel file containing all student information including:
+ * The server streams the workbook from the database, so big schools export
+ * fine and the current year's grades and attendance can be included:
  * - Student name, code, grade level, room
  * - Parent contact, blood type, chronic diseases
- * - Notes
+ * - Per-subject grades and attendance counts (optional)
  */
-function exportStudentsToExcel() {
+async function exportStudentsToExcel(format = 'xlsx', include = '') {
     if (!currentSchool) {
         showNotification('يرجى تسجيل الدخول أولاً', 'error');
         return;
@@ -4825,61 +4787,37 @@ function exportStudentsToExcel() {
         return;
     }
     
-    // Check if XLSX library is loaded
-    if (typeof XLSX === 'undefined') {
-        showNotification('خطأ: مكتبة Excel غير محملة', 'error');
-        console.error('XLSX library not loaded');
-        return;
-    }
-    
     try {
-        // Prepare data for export
-        const exportData = students.map((student, index) => {
-            return {
-                'الرقم': index + 1,
-                'اسم الطالب': student.full_name || '',
-                'رمز الطالب': student.student_code || '',
-                'الصف الدراسي': student.grade || '',
-                'رقم القاعة': student.room || '',
-                'رقم ولي الأمر': student.parent_contact || '',
-                'فصيلة الدم': student.blood_type || '',
-                'الأمراض المزمنة': student.chronic_disease || 'لا يوجد',
-                'الملاحظات': student.notes || ''
-            };
-        });
+        const params = new URLSearchParams({ format });
+        if (include) params.set('include', include);
+        if (include && selectedAcademicYearId) params.set('year', selectedAcademicYearId);
         
-        // Create workbook and worksheet
-        const workbook = XLSX.utils.book_new();
-        const worksheet = XLSX.utils.json_to_sheet(exportData);
-        
-        // Set column widths for better readability
-        const columnWidths = [
-            { wch: 8 },   // الرقم
-            { wch: 35 },  // اسم الطالب
-            { wch: 20 },  // رمز الطالب
-            { wch: 25 },  // الصف الدراسي
-            { wch: 12 },  // رقم القاعة
-            { wch: 20 },  // رقم ولي الأمر
-            { wch: 12 },  // فصيلة الدم
-            { wch: 25 },  // الأمراض المزمنة
-            { wch: 30 }   // الملاحظات
-        ];
-        worksheet['!cols'] = columnWidths;
-        
-        // Add worksheet to workbook
-        XLSX.utils.book_append_sheet(workbook, worksheet, 'بيانات الطلاب');
+        const response = await fetch(`/api/school/${currentSchool.id}/students/export?${params}`, {
+            headers: getAuthHeaders()
+        });
+        if (!response.ok) {
+            throw new Error(`Export failed with status ${response.status}`);
+        }
+        const blob = await response.blob();
         
         // Generate filename with school name and date
         const schoolName = currentSchool.name || 'المدرسة';
         const date = new Date();
         const dateStr = date.toISOString().split('T')[0]; // YYYY-MM-DD format
-        const filename = `${schoolName}_طلاب_${dateStr}.xlsx`;
+        const filename = `${schoolName}_طلاب_${dateStr}.${format}`;
         
         // Download the file
-        XLSX.writeFile(workbook, filename);
+        const url = URL.createObjectURL(blob);
+        const link = document.createElement('a');
+        link.href = url;
+        link.download = filename;
+        document.body.appendChild(link);
+        link.click();
+        link.remove();
+        URL.revokeObjectURL(url);
         
         showNotification(`تم تصدير ${students.length} طالب بنجاح`, 'success');
-        console.log(`Exported ${students.length} students to ${filename}`);
+        console.log(`Exported students to ${filename}`);
         
     } catch (error) {
         console.error('Error exporting students to Excel:', error);
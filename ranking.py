@@ -0,0 +1,121 @@
+import numpy as np
+from database import GRADE_PERIODS, supports_window_functions
+from trends import load_grade_tensor
+
+# A student's subject score is one period's score, or the average of the graded
+# (> 0) periods; the overall score is the average of the subject scores.
+# Ranks follow SQL: rank leaves gaps after ties, dense_rank does not, and
+# percentile = 100 * (1 - PERCENT_RANK()) so the top student is at 100.
+
+def _subject_score_sql(period):
+    if period:
+        return f'sg.{period}'
+    total = ' + '.join(f'CASE WHEN sg.{p} > 0 THEN sg.{p} ELSE 0 END' for p in GRADE_PERIODS)
+    count = ' + '.join(f'CASE WHEN sg.{p} > 0 THEN 1 ELSE 0 END' for p in GRADE_PERIODS)
+    return f'ROUND(({total}) * 1.0 / NULLIF({count}, 0), 2)'
+
+def _window_columns():
+    window = 'OVER (PARTITION BY subject_name ORDER BY score DESC)'
+    return (f'RANK() {window} AS score_rank, DENSE_RANK() {window} AS score_dense_rank, '
+            f'PERCENT_RANK() {window} AS score_percent_rank')
+
+def _rank_with_window_functions(cur, school_id, grade, academic_year_id, period, room):
+    """Rows of (student_id, subject_name or None for overall, score, rank, dense_rank, percent_rank)"""
+    filters = ' AND s.room = %s' if room else ''
+    query = f'''WITH subject_scores AS (
+                    SELECT sg.student_id, sg.subject_name, {_subject_score_sql(period)} AS score
+                    FROM student_grades sg
+                    JOIN students s ON s.id = sg.student_id
+                    WHERE s.school_id = %s AND s.grade = %s AND sg.academic_year_id = %s{filters}
+                ), graded AS (
+                    SELECT student_id, subject_name, score FROM subject_scores WHERE score > 0
+                ), overall AS (
+                    SELECT student_id, NULL AS subject_name, ROUND(AVG(score), 2) AS score
+                    FROM graded GROUP BY student_id
+                )
+                SELECT student_id, subject_name, score, {_window_columns()} FROM graded
+                UNION ALL
+                SELECT student_id, subject_name, score, {_window_columns()} FROM overall'''
+    params = (school_id, grade, academic_year_id) + ((room,) if room else ())
+    cur.execute(query, params)
+    return [(row['student_id'], row['subject_name'], float(row['score']), int(row['score_rank']),
+             int(row['score_dense_rank']), float(row['score_percent_rank'])) for row in cur.fetchall()]
+
+def round_half_away(values, decimals=2):
+    """Round like SQL ROUND: halves go away from zero (np.round rounds them to even).
+
+    The small epsilon absorbs binary error in averages such as 8.125 * 100, which
+    the database computes exactly in DECIMAL.
+    """
+    scale = 10 ** decimals
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5 + 1e-9) / scale
+
+def rank_scores(scores):
+    """Vectorized RANK(), DENSE_RANK() and PERCENT_RANK() of scores ordered highest first"""
+    descending = np.sort(scores)[::-1]
+    ranks = np.searchsorted(-descending, -scores, side='left') + 1
+    distinct = np.unique(scores)[::-1]
+    dense_ranks = np.searchsorted(-distinct, -scores, side='left') + 1
+    percent_ranks = (ranks - 1) / (len(scores) - 1) if len(scores) > 1 else np.zeros(len(scores))
+    return ranks, dense_ranks, percent_ranks
+
+def _rank_vectorized(cur, school_id, grade, academic_year_id, period, room):
+    """Same rows as _rank_with_window_functions, computed with NumPy for older backends"""
+    tensor = load_grade_tensor(cur, school_id, academic_year_id, grade, room=room)
+    if not tensor.student_ids:
+        return []
+    scores = tensor.scores.astype(np.float64)
+    if period:
+        subject_scores = scores[..., GRADE_PERIODS.index(period)]
+    else:
+        graded = scores > 0
+        counts = graded.sum(axis=-1)
+        subject_scores = round_half_away(np.where(graded, scores, 0).sum(axis=-1) / np.maximum(counts, 1))
+    has_score = subject_scores > 0
+
+    rows = []
+    columns = [(name, subject_scores[:, j], has_score[:, j]) for j, name in enumerate(tensor.subjects)]
+    overall_counts = has_score.sum(axis=-1)
+    overall = round_half_away(np.where(has_score, subject_scores, 0).sum(axis=-1) / np.maximum(overall_counts, 1))
+    columns.append((None, overall, overall_counts > 0))
+    for name, column, mask in columns:
+        indexes = np.flatnonzero(mask)
+        if not len(indexes):
+            continue
+        values = column[indexes]
+        ranks, dense_ranks, percent_ranks = rank_scores(values)
+        for index, value, rank, dense_rank, percent_rank in zip(
+                indexes.tolist(), values.tolist(), ranks.tolist(), dense_ranks.tolist(), percent_ranks.tolist()):
+            rows.append((tensor.student_ids[index], name, value, rank, dense_rank, percent_rank))
+    return rows
+
+def compute_ranking(conn, school_id, grade, academic_year_id, period=None, room=None):
+    """Per-subject and overall rank, dense rank and percentile of every graded student of a grade.
+
+    Returns (students ordered by overall rank, engine) where engine is 'window'
+    or 'vectorized' depending on the backend.
+    """
+    cur = conn.cursor(dictionary=True)
+    if supports_window_functions(cur):
+        engine = 'window'
+        rows = _rank_with_window_functions(cur, school_id, grade, academic_year_id, period, room)
+    else:
+        engine = 'vectorized'
+        rows = _rank_vectorized(conn.cursor(), school_id, grade, academic_year_id, period, room)
+
+    students = {}
+    for student_id, subject_name, score, rank, dense_rank, percent_rank in rows:
+        student = students.setdefault(student_id, {'student_id': student_id, 'overall': None, 'subjects': {}})
+        entry = {
+            'score': round(score, 2),
+            'rank': rank,
+            'dense_rank': dense_rank,
+            'percentile': round((1 - percent_rank) * 100, 1),
+        }
+        if subject_name is None:
+            student['overall'] = entry
+        else:
+            student['subjects'][subject_name] = entry
+
+    ranked = sorted(students.values(), key=lambda student: (student['overall']['rank'], student['student_id']))
+    return ranked, engine
@@ -0,0 +1,101 @@
+# Printable HTML report cards. Rendering runs in worker processes (see
+# jobs.run_report_card_job), so this module must not import the database or the app.
+import re
+from jinja2 import Environment
+
+PERIOD_NAMES = {
+    'month1': 'شهر الأول',
+    'month2': 'شهر الثاني',
+    'midterm': 'نصف السنة',
+    'month3': 'شهر الثالث',
+    'month4': 'شهر الرابع',
+    'final': 'نهاية السنة',
+}
+ATTENDANCE_NAMES = {'present': 'حاضر', 'absent': 'غائب', 'late': 'متأخر', 'excused': 'إجازة'}
+
+_TEMPLATE = Environment(autoescape=True).from_string('''<!DOCTYPE html>
+<html lang="ar" dir="rtl">
+<head>
+<meta charset="utf-8">
+<title>{{ student.full_name }} - {{ year_name }}</title>
+<style>
+  body { font-family: "Tahoma", "Arial", sans-serif; margin: 2rem; color: #222; }
+  h1, h2 { margin: 0 0 .5rem; }
+  .meta { margin-bottom: 1rem; }
+  .meta span { display: inline-block; margin-left: 2rem; }
+  table { border-collapse: collapse; width: 100%; margin-bottom: 1rem; }
+  th, td { border: 1px solid #999; padding: .35rem .5rem; text-align: center; }
+  th { background: #eee; }
+  .fail { color: #b00020; font-weight: bold; }
+  @media print { body { margin: 0; } @page { size: A4; margin: 1.5cm; } }
+</style>
+</head>
+<body>
+<h1>{{ school_name }}</h1>
+<h2>بطاقة درجات - {{ year_name }}</h2>
+<div class="meta">
+  <span>الطالب: <strong>{{ student.full_name }}</strong></span>
+  <span>الرمز: {{ student.student_code }}</span>
+  <span>الصف: {{ grade }}</span>
+  <span>الشعبة: {{ student.room }}</span>
+</div>
+<table>
+  <thead>
+    <tr><th>المادة</th>{% for period in periods %}<th>{{ period_names[period] }}</th>{% endfor %}<th>المعدل</th></tr>
+  </thead>
+  <tbody>
+  {% for subject in subjects %}
+    <tr>
+      <td>{{ subject.name }}</td>
+      {% for score in subject.scores %}<td{% if score and score < pass_threshold %} class="fail"{% endif %}>{{ score or '-' }}</td>{% endfor %}
+      <td{% if subject.average is not none and subject.average < pass_threshold %} class="fail"{% endif %}>{{ subject.average if subject.average is not none else '-' }}</td>
+    </tr>
+  {% else %}
+    <tr><td colspan="{{ periods|length + 2 }}">لا توجد درجات مسجلة</td></tr>
+  {% endfor %}
+  </tbody>
+</table>
+<p>المعدل العام: <strong>{{ overall if overall is not none else '-' }}</strong> / {{ max_score }}</p>
+<table>
+  <thead><tr>{% for status in attendance_names %}<th>{{ attendance_names[status] }}</th>{% endfor %}</tr></thead>
+  <tbody><tr>{% for status in attendance_names %}<td>{{ attendance.get(status, 0) }}</td>{% endfor %}</tr></tbody>
+</table>
+</body>
+</html>
+''')
+
+def report_card_filename(card):
+    """'<room>/<student_code>-<name>.html' with path separators and control characters removed"""
+    student = card['student']
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', '_', f"{student['student_code']}-{student['full_name']}")
+    room = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', '_', str(student.get('room') or '-'))
+    return f'{room}/{name}.html'
+
+def render_report_card(card):
+    """Render one card. Returns (filename inside the zip, UTF-8 HTML bytes)."""
+    periods = card['periods']
+    subjects = []
+    averages = []
+    for name in sorted(card['subjects']):
+        scores = [card['subjects'][name].get(period) or 0 for period in periods]
+        graded = [score for score in scores if score > 0]
+        average = round(sum(graded) / len(graded), 1) if graded else None
+        if average is not None:
+            averages.append(average)
+        subjects.append({'name': name, 'scores': scores, 'average': average})
+
+    html = _TEMPLATE.render(
+        school_name=card['school_name'],
+        year_name=card['year_name'],
+        grade=card['grade'],
+        student=card['student'],
+        periods=periods,
+        period_names=PERIOD_NAMES,
+        subjects=subjects,
+        overall=round(sum(averages) / len(averages), 1) if averages else None,
+        max_score=card['max_score'],
+        pass_threshold=card['pass_threshold'],
+        attendance=card['attendance'],
+        attendance_names=ATTENDANCE_NAMES,
+    )
+    return report_card_filename(card), html.encode('utf-8')
@@ -1,26 +1,74 @@
 import os
+import time
 import datetime
 import secrets
+import math
 import jwt
-import bcrypt
 import json
 from functools import wraps
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
-from database import init_db, get_mysql_pool, get_unique_school_code
+from database import (init_db, get_mysql_pool, get_pool_stats, get_unique_school_code, iter_cursor_rows,
+                      GRADE_PERIODS, upsert_student_grades, upsert_student_attendance,
+                      resolve_current_academic_year_id, touch_school, touch_schools_of, get_school_version,
+                      get_school_change_info, get_schools_fingerprint)
+from grading import is_elementary_grades_1_to_4, get_max_score
+from promotion import promote_students
+from summaries import SUMMARY_COLUMNS, ensure_student_summaries, ensure_school_summaries, refresh_student_summaries
+from jobs import (create_rollover_job, get_job, resume_rollover_job, recover_rollover_jobs, RolloverPlanError,
+                  create_report_card_job, get_report_card_job, recover_report_card_jobs,
+                  expire_report_card_archives, REPORT_CARD_FORMATS)
+from analytics import compute_school_analytics
+from trends import SIGNIFICANT_CHANGE_PERCENT, load_grade_tensor, find_at_risk
+from ranking import compute_ranking
+from exports import EXPORT_FORMATS, iter_student_export_rows, iter_csv, iter_xlsx
+from importer import IMPORT_KINDS, FileImport, ImportFileError, iter_upload_rows
+from cache import VersionedCache
+from assets import AssetManifest
+from compression import (API_COMPRESSION_MIN_BYTES, is_compressible, choose_encoding, compress_bytes,
+                         compress_stream)
+from academic_years import academic_years, get_current_academic_year_name, current_academic_year_id
+from auth import (TokenAuthority, TokenRevokedError, TokenBucketLimiter, PasswordVerifier, LoginBusyError,
+                  LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE, LOGIN_USER_BURST, LOGIN_USER_PER_MINUTE)
 
 load_dotenv()
 
 app = Flask(__name__, static_folder='public')
 CORS(app, supports_credentials=True)
 
+# Number of reverse proxies in front of the app (Render, nginx...), so
+# request.remote_addr is the real client address used for login throttling
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 0))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
 PORT = int(os.getenv('PORT', 1111))
 JWT_SECRET = os.getenv('JWT_SECRET', secrets.token_hex(32))
 NODE_ENV = os.getenv('NODE_ENV', 'development')
 
+tokens = TokenAuthority(JWT_SECRET)
+password_verifier = PasswordVerifier()
+login_ip_limiter = TokenBucketLimiter(LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE)
+login_user_limiter = TokenBucketLimiter(LOGIN_USER_BURST, LOGIN_USER_PER_MINUTE)
+
+# Report-card render processes (forkserver/spawn) re-import this file as
+# __mp_main__; they only need report_cards, so skip the startup work there
+IS_WORKER_PROCESS = __name__ == '__mp_main__'
+
+# Static files are read, fingerprinted and compressed once; development re-reads them on change
+asset_manifest = None if IS_WORKER_PROCESS else AssetManifest(
+    app.static_folder, reload=os.getenv('ASSET_RELOAD', str(NODE_ENV != 'production')).lower() == 'true')
+
 # Initialize database
-init_db()
+if not IS_WORKER_PROCESS:
+    init_db()
+    ensure_student_summaries()
+    # Resume background jobs interrupted by a restart and drop expired archives
+    recover_rollover_jobs()
+    recover_report_card_jobs()
+    expire_report_card_archives()
 
 # Uploads directory configuration
 if NODE_ENV == 'production':
@@ -31,44 +79,53 @@ else:
 if not os.path.exists(UPLOADS_DIR):
     os.makedirs(UPLOADS_DIR, mode=0o755, exist_ok=True)
 
-# Helper function to determine if a grade is elementary grades 1-4
-def is_elementary_grades_1_to_4(grade_string):
-    """
-    Check if a grade string represents elementary (ابتدائي) grades 1-4.
-    These grades use a 10-point scale, while all others use 100-point scale.
-    
-    Args:
-        grade_string: Full grade string like "ابتدائي - الأول الابتدائي"
-    Returns:
-        bool: True if grade is elementary 1-4, False otherwise
-    """
-    if not grade_string:
-        return False
-    
-    grade_parts = grade_string.split(' - ')
-    if len(grade_parts) < 2:
-        return False
-    
-    educational_level = grade_parts[0].strip()  # e.g., "ابتدائي"
-    grade_level = grade_parts[1].strip()  # e.g., "الأول الابتدائي"
-    
-    # Check if this is an elementary (ابتدائي) school level
-    is_elementary = ('ابتدائي' in educational_level or 
-                     'ابتدائي' in grade_level or 
-                     'الابتدائي' in grade_level)
-    
-    if not is_elementary:
-        return False
-    
-    # Check if grade is first, second, third, or fourth
-    grades_1_to_4 = ['الأول', 'الثاني', 'الثالث', 'الرابع', 'اول', 'ثاني', 'ثالث', 'رابع', 'الاول']
-    is_grades_1_to_4 = any(x in grade_level for x in grades_1_to_4)
-    
-    # Make sure it's NOT fifth or sixth grade (which should use 100-point scale)
-    grades_5_or_6 = ['الخامس', 'السادس', 'خامس', 'سادس']
-    is_grades_5_or_6 = any(x in grade_level for x in grades_5_or_6)
-    
-    return is_grades_1_to_4 and not is_grades_5_or_6
+def record_timing(name, seconds, description=None):
+    """Add a slice to this request's Server-Timing header"""
+    g.setdefault('server_timing', []).append((name, seconds * 1000, description))
+
+@app.after_request
+def add_server_timing(response):
+    timings = g.get('server_timing')
+    if timings:
+        response.headers['Server-Timing'] = ', '.join(
+            f'{name};dur={ms:.2f}' + (f';desc="{description}"' if description else '')
+            for name, ms, description in timings)
+    return response
+
+# Registered after add_server_timing so it runs first and its slice makes it into the header
+@app.after_request
+def compress_api_response(response):
+    """gzip/brotli-encode /api/ responses the client accepts, buffered or streamed"""
+    if (not request.path.startswith('/api/') or request.method == 'HEAD'
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or not is_compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+    
+    if response.is_streamed:
+        # Size is unknown up front; chunks are compressed as they are produced
+        source = response.response
+        response.response = compress_stream(source, encoding)
+        # Closing the wrapper only reaches the source once it has started iterating
+        if hasattr(source, 'close'):
+            response.call_on_close(source.close)
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        return response
+    
+    data = response.get_data()
+    if len(data) < API_COMPRESSION_MIN_BYTES:
+        return response
+    started = time.perf_counter()
+    compressed = compress_bytes(data, encoding)
+    record_timing('compress', time.perf_counter() - started, f'{encoding} {len(data)}->{len(compressed)}')
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
 
 # Authentication Decorator
 def authenticate_token(f):
@@ -86,19 +143,30 @@ def authenticate_token(f):
                 'error_ar': 'مطلوب رمز الوصول'
             }), 401
         
+        started = time.perf_counter()
+        cached = False
         try:
-            data = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+            data, cached = tokens.verify(token)
             request.user = data
+            request.token = token
         except jwt.ExpiredSignatureError:
             return jsonify({
                 'error': 'Token expired',
                 'error_ar': 'انتهت صلاحية الرمز'
             }), 403
+        except TokenRevokedError:
+            return jsonify({
+                'error': 'Token has been revoked',
+                'error_ar': 'تم إلغاء الرمز'
+            }), 403
         except jwt.InvalidTokenError:
             return jsonify({
                 'error': 'Invalid token',
                 'error_ar': 'رمز غير صالح'
             }), 403
+        finally:
+            # Auth cost gets its own slice so cache misses show up in latency numbers
+            record_timing('auth', time.perf_counter() - started, 'cached' if cached else 'verified')
             
         return f(*args, **kwargs)
     return decorated
@@ -108,7 +176,7 @@ def authenticate_token(f):
 def not_found_error(error):
     if request.path.startswith('/api/'):
         return jsonify({'error': 'Not Found', 'error_ar': 'غير موجود'}), 404
-    return send_from_directory(app.static_folder, 'index.html')
+    return send_asset('index.html')
 
 @app.errorhandler(500)
 def internal_error(error):
@@ -133,6 +201,118 @@ def roles_required(*roles):
         return decorated
     return decorator
 
+# ------ Streaming (NDJSON) responses ------
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def wants_stream():
+    """True when the client asked for a streamed NDJSON response"""
+    if request.args.get('stream') in ('1', 'true'):
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+def ndjson_line(obj):
+    return app.json.dumps(obj) + '\n'
+
+def release_once(conn):
+    """Return a callable that returns conn to the pool the first time it is called"""
+    released = []
+    def release():
+        if not released:
+            released.append(True)
+            conn.close()
+    return release
+
+def stream_ndjson(pool, produce):
+    """Stream NDJSON lines from produce(cur), a generator of objects.
+    
+    The connection is held for the lifetime of the response and returned to
+    the pool when the last line is written or the client goes away. It is
+    also released when the response is closed without its body being read
+    (HEAD, 304), since a generator that never started never runs its finally.
+    """
+    conn = pool.get_connection()
+    release = release_once(conn)
+    
+    def generate():
+        try:
+            cur = conn.cursor(dictionary=True)
+            for obj in produce(cur):
+                yield ndjson_line(obj)
+        finally:
+            release()
+    
+    response = Response(generate(), mimetype=NDJSON_MIMETYPE)
+    response.call_on_close(release)
+    return response
+
+def stream_query(pool, query, params=(), transform=None):
+    """Stream each row of a query as one NDJSON line"""
+    def produce(cur):
+        cur.execute(query, params)
+        for row in iter_cursor_rows(cur):
+            yield transform(row) if transform else row
+    return stream_ndjson(pool, produce)
+
+def stream_download(pool, produce, mimetype, filename):
+    """Stream a file download from produce(cur), a generator of bytes chunks, holding one connection"""
+    conn = pool.get_connection()
+    release = release_once(conn)
+    
+    def generate():
+        try:
+            cur = conn.cursor(dictionary=True)
+            yield from produce(cur)
+        finally:
+            release()
+    
+    try:
+        response = Response(generate(), mimetype=mimetype,
+                            headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    except Exception:
+        release()
+        raise
+    # HEAD requests close the response without starting the generator
+    response.call_on_close(release)
+    return response
+
+# ------ Conditional GET (ETag / Last-Modified) ------
+# Catalog responses carry validators derived from a change version, so a
+# client revalidating with If-None-Match / If-Modified-Since gets a 304
+# after one cheap version lookup instead of the full query and serialization.
+
+def school_validators(cur, resource, school_id):
+    """(etag, last_modified) of a per-school resource from the school's data_version; (None, None) if unknown"""
+    info = get_school_change_info(cur, school_id)
+    if info is None:
+        return None, None
+    version, changed_at = info
+    last_modified = datetime.datetime.fromtimestamp(changed_at, datetime.timezone.utc) if changed_at else None
+    return f'{resource}-{school_id}-{version}', last_modified
+
+def check_not_modified(etag, last_modified=None):
+    """Return a 304 response when the client's copy is still current, else None"""
+    if etag is None:
+        return None
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        fresh = bool(last_modified and request.if_modified_since
+                     and last_modified.replace(microsecond=0) <= request.if_modified_since)
+    if not fresh:
+        return None
+    return with_validators(Response(status=304), etag, last_modified)
+
+def with_validators(response, etag, last_modified=None):
+    if etag is None:
+        return response
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    # Browsers may keep the copy but must revalidate it on every use
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/health', methods=['GET'])
 def health_check():
     health_status = {
@@ -153,6 +333,14 @@ def health_check():
             'hasJWTSecret': bool(os.getenv('JWT_SECRET')),
             'isProduction': NODE_ENV == 'production'
         },
+        'pool': get_pool_stats(),
+        'auth': tokens.stats(),
+        'assets': asset_manifest.stats(),
+        'login': {
+            'checks': password_verifier.stats(),
+            'throttled_ips': login_ip_limiter.stats(),
+            'throttled_usernames': login_user_limiter.stats(),
+        },
         'warnings': []
     }
     
@@ -164,19 +352,32 @@ def health_check():
         
     return jsonify(health_status)
 
+def retry_later(status, error, error_ar, seconds):
+    response = jsonify({'error': error, 'error_ar': error_ar})
+    response.headers['Retry-After'] = str(max(1, math.ceil(seconds)))
+    return response, status
+
 # API Routes
 @app.route('/api/admin/login', methods=['POST'])
 def admin_login():
-    data = request.json
+    data = request.json if isinstance(request.json, dict) else {}
     username = data.get('username')
     password = data.get('password')
     
-    if not username or not password:
+    # Non-string values would fail in the throttle key or bcrypt with a 500
+    if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
         return jsonify({
             'error': 'Username and password required',
             'error_ar': 'اسم المستخدم وكلمة المرور مطلوبان'
         }), 400
     
+    # Throttle before any database or bcrypt work
+    wait = max(login_ip_limiter.acquire(request.remote_addr),
+               login_user_limiter.acquire(username.strip().lower()))
+    if wait:
+        return retry_later(429, 'Too many login attempts, try again later',
+                           'محاولات تسجيل دخول كثيرة، حاول لاحقاً', wait)
+    
     query = 'SELECT * FROM users WHERE username = %s AND role = %s'
     params = (username, 'admin')
     
@@ -193,18 +394,34 @@ def admin_login():
     finally:
         conn.close()
         
-    if not user or not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+    try:
+        matches, new_hash = password_verifier.check(password, user['password_hash'] if user else None)
+    except LoginBusyError:
+        return retry_later(503, 'Login service is busy, try again shortly',
+                           'خدمة تسجيل الدخول مشغولة، حاول بعد قليل', 1)
+    
+    if not matches:
         return jsonify({
             'error': 'Invalid credentials',
             'error_ar': 'بيانات دخول غير صحيحة'
         }), 401
     
-    token = jwt.encode({
+    if new_hash:
+        # The stored hash used another cost factor; upgrade it now that we have the password
+        conn = pool.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute('UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s',
+                        (new_hash, user['id'], user['password_hash']))
+            conn.commit()
+        finally:
+            conn.close()
+    
+    token = tokens.issue({
         'id': user['id'],
         'username': user['username'],
-        'role': user['role'],
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-    }, JWT_SECRET, algorithm='HS256')
+        'role': user['role']
+    })
     
     return jsonify({
         'success': True,
@@ -244,13 +461,12 @@ def school_login():
             'error_ar': 'لم يتم العثور على المدرسة'
         }), 404
     
-    token = jwt.encode({
+    token = tokens.issue({
         'id': school['id'],
         'code': school['code'],
         'name': school['name'],
-        'role': 'school',
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-    }, JWT_SECRET, algorithm='HS256')
+        'role': 'school'
+    })
     
     return jsonify({
         'success': True,
@@ -292,13 +508,12 @@ def student_login():
             'error_ar': 'لم يتم العثور على الطالب'
         }), 404
         
-    token = jwt.encode({
+    token = tokens.issue({
         'id': student['id'],
         'code': student['student_code'],
         'name': student['full_name'],
-        'role': 'student',
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-    }, JWT_SECRET, algorithm='HS256')
+        'role': 'student'
+    })
     
     return jsonify({
         'success': True,
@@ -306,6 +521,24 @@ def student_login():
         'student': dict(student)
     })
 
+@app.route('/api/logout', methods=['POST'])
+@authenticate_token
+def logout():
+    pool = get_mysql_pool()
+    if not pool:
+        return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
+
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor()
+        apply_revocation = tokens.revoke_token(cur, request.token, request.user)
+        conn.commit()
+        apply_revocation()
+    finally:
+        conn.close()
+
+    return jsonify({'success': True, 'message': 'تم تسجيل الخروج بنجاح'})
+
 @app.route('/api/schools', methods=['GET'])
 def get_schools():
     query = 'SELECT * FROM schools ORDER BY created_at DESC'
@@ -313,15 +546,22 @@ def get_schools():
     pool = get_mysql_pool()
     if not pool:
         return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
+    
+    if wants_stream():
+        return stream_query(pool, query)
         
     conn = pool.get_connection()
     try:
         cur = conn.cursor(dictionary=True)
+        etag = f'schools-{get_schools_fingerprint(cur)}'
+        not_modified = check_not_modified(etag)
+        if not_modified:
+            return not_modified
         cur.execute(query)
         schools = cur.fetchall()
     finally:
         conn.close()
-    return jsonify({'success': True, 'schools': schools})
+    return with_validators(jsonify({'success': True, 'schools': schools}), etag)
 
 STAGE_TO_LEVEL_MAPPING = {
     "ابتدائي": "ابتدائي",
@@ -401,6 +641,7 @@ def update_school(school_id):
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute(query, params)
+        touch_school(cur, school_id)
         conn.commit()
         cur.execute('SELECT * FROM schools WHERE id = %s', (school_id,))
         school = cur.fetchone()
@@ -428,7 +669,10 @@ def delete_school(school_id):
         cur = conn.cursor()
         cur.execute('DELETE FROM schools WHERE id = %s', (school_id,))
         row_count = cur.rowcount
+        apply_revocation = tokens.revoke_subject(cur, 'school', school_id) if row_count else None
         conn.commit()
+        if apply_revocation:
+            apply_revocation()
     finally:
         conn.close()
         
@@ -441,73 +685,241 @@ def delete_school(school_id):
         'deleted': row_count
     })
 
+STUDENT_COLUMNS = (
+    'id', 'school_id', 'full_name', 'student_code', 'grade', 'branch', 'room', 'enrollment_date',
+    'parent_contact', 'blood_type', 'chronic_disease', 'detailed_scores', 'daily_attendance',
+    'created_at', 'updated_at'
+)
+STUDENT_BLOB_COLUMNS = ('detailed_scores', 'daily_attendance')
+MAX_STUDENTS_PAGE_SIZE = 1000
+
+def escape_like(value):
+    """Escape LIKE wildcards; use with ESCAPE '!'"""
+    return value.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+def decode_student_json_columns(student):
+    """MySQL JSON type might be returned as string or dict depending on driver/version"""
+    for col in STUDENT_BLOB_COLUMNS:
+        if col not in student:
+            continue
+        if isinstance(student.get(col), str):
+            try:
+                student[col] = json.loads(student[col])
+            except:
+                student[col] = {}
+        elif student.get(col) is None:
+            student[col] = {}
+    return student
+
 @app.route('/api/school/<int:school_id>/students', methods=['GET'])
 @roles_required('admin', 'school')
 def get_students(school_id):
-    query = 'SELECT * FROM students WHERE school_id = %s ORDER BY created_at DESC'
+    """List the students of a school, newest first.
+    
+    Query parameters (all optional):
+        limit, after   keyset pagination; pass the returned next_after as after
+        grade, room    exact-match filters
+        name           full_name prefix filter
+        fields         comma-separated columns; detailed_scores and daily_attendance
+                       are only returned when listed (or with fields=*)
+        sort           a summary column or full_name, prefixed with '-' for descending;
+                       returns the first page only (cannot be combined with after)
+    """
+    available_fields = STUDENT_COLUMNS + SUMMARY_COLUMNS
+    fields_param = request.args.get('fields')
+    if fields_param == '*':
+        fields = list(available_fields)
+    elif fields_param:
+        fields = [f.strip() for f in fields_param.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in available_fields]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}", 'error_ar': 'حقول غير معروفة'}), 400
+        if 'id' not in fields:
+            fields.insert(0, 'id')
+    else:
+        fields = [col for col in available_fields if col not in STUDENT_BLOB_COLUMNS]
+    
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after', type=int)
+    if limit is not None and (limit < 1 or limit > MAX_STUDENTS_PAGE_SIZE):
+        return jsonify({
+            'error': f'limit must be between 1 and {MAX_STUDENTS_PAGE_SIZE}',
+            'error_ar': f'يجب أن يكون الحد بين 1 و {MAX_STUDENTS_PAGE_SIZE}'
+        }), 400
+    
+    sort = request.args.get('sort')
+    order_by = 's.id DESC'
+    if sort:
+        sort_column = sort.lstrip('-')
+        if sort_column not in SUMMARY_COLUMNS + ('full_name',) or after is not None:
+            return jsonify({'error': 'Invalid sort', 'error_ar': 'ترتيب غير صالح'}), 400
+        table_alias = 's' if sort_column == 'full_name' else 'ss'
+        order_by = f"{table_alias}.{sort_column} {'DESC' if sort.startswith('-') else 'ASC'}, s.id DESC"
+    
+    conditions = ['s.school_id = %s']
+    params = [school_id]
+    if after is not None:
+        conditions.append('s.id < %s')
+        params.append(after)
+    for column in ('grade', 'room'):
+        value = request.args.get(column)
+        if value:
+            conditions.append(f's.{column} = %s')
+            params.append(value)
+    name_prefix = request.args.get('name')
+    if name_prefix:
+        conditions.append("s.full_name LIKE %s ESCAPE '!'")
+        params.append(escape_like(name_prefix) + '%')
+    
+    columns = [f"{'ss' if f in SUMMARY_COLUMNS else 's'}.{f}" for f in fields]
+    query = f"SELECT {', '.join(columns)} FROM students s"
+    if sort or any(f in SUMMARY_COLUMNS for f in fields):
+        query += ' LEFT JOIN student_summaries ss ON ss.student_id = s.id'
+    query += f" WHERE {' AND '.join(conditions)} ORDER BY {order_by}"
+    stream = wants_stream()
+    if limit is not None:
+        # Fetch one extra row to know whether another page exists (streamed pages end when short)
+        query += ' LIMIT %s'
+        params.append(limit if stream else limit + 1)
+    
     students = []
     pool = get_mysql_pool()
     if not pool:
         return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
+    if sort or any(f in SUMMARY_COLUMNS for f in fields):
+        # Summaries of a new academic year are built on first use
+        ensure_school_summaries(school_id)
+    
+    if stream:
+        return stream_query(pool, query, tuple(params), decode_student_json_columns)
         
     conn = pool.get_connection()
     try:
         cur = conn.cursor(dictionary=True)
-        cur.execute(query, (school_id,))
+        cur.execute(query, tuple(params))
         students = cur.fetchall()
-        for s in students:
-            # MySQL JSON type might be returned as string or dict depending on driver/version
-            for col in ['detailed_scores', 'daily_attendance']:
-                if isinstance(s.get(col), str):
-                    try:
-                        s[col] = json.loads(s[col])
-                    except:
-                        s[col] = {}
-                elif s.get(col) is None:
-                    s[col] = {}
     finally:
         conn.close()
-    return jsonify({'success': True, 'students': students})
+    
+    has_more = limit is not None and len(students) > limit
+    if has_more:
+        students = students[:limit]
+    for s in students:
+        decode_student_json_columns(s)
+    
+    response = {'success': True, 'students': students}
+    if limit is not None:
+        response['has_more'] = has_more
+        response['next_after'] = students[-1]['id'] if has_more and not sort else None
+    return jsonify(response)
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
 
-@app.route('/api/school/<int:school_id>/student', methods=['POST'])
+@app.route('/api/school/<int:school_id>/students/export', methods=['GET'])
 @roles_required('admin', 'school')
-def add_student(school_id):
-    data = request.json
-    full_name = data.get('full_name')
-    grade = data.get('grade')
-    room = data.get('room')
-    enrollment_date = data.get('enrollment_date')
-    parent_contact = data.get('parent_contact')  # New field: one or two phone numbers
-    blood_type = data.get('blood_type')  # New field: blood type selection
-    chronic_disease = data.get('chronic_disease')  # New field: optional medical conditions
+def export_students(school_id):
+    """Download the student list as CSV or XLSX, streamed from the database.
+    
+    Query parameters: format (csv or xlsx, default xlsx), grade, room,
+    include (comma-separated: grades, attendance) and year (academic_year_id
+    for the included columns, defaults to the current year).
+    """
+    export_format = request.args.get('format', 'xlsx')
+    grade = request.args.get('grade') or None
+    room = request.args.get('room') or None
+    include = {part.strip() for part in request.args.get('include', '').split(',') if part.strip()}
+    academic_year_id = request.args.get('year', type=int)
+    
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Format must be one of: {", ".join(EXPORT_FORMATS)}', 'error_ar': 'صيغة التصدير غير مدعومة'}), 400
+    unknown = include - {'grades', 'attendance'}
+    if unknown:
+        return jsonify({'error': f'Unknown include: {", ".join(sorted(unknown))}', 'error_ar': 'أعمدة إضافية غير معروفة'}), 400
+    
+    pool = get_mysql_pool()
+    if not pool:
+        return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
+    
+    if include and not academic_year_id:
+        conn = pool.get_connection()
+        try:
+            academic_year_id = resolve_current_academic_year_id(conn.cursor(dictionary=True))
+        finally:
+            conn.close()
+        if not academic_year_id:
+            return jsonify({'error': 'No academic year found', 'error_ar': 'لم يتم العثور على سنة دراسية'}), 400
     
+    def produce(cur):
+        rows = iter_student_export_rows(cur, school_id, academic_year_id, 'grades' in include,
+                                        'attendance' in include, grade, room)
+        return iter_csv(rows) if export_format == 'csv' else iter_xlsx(rows)
+    
+    filename = f'students-{school_id}-{datetime.date.today().isoformat()}.{export_format}'
+    return stream_download(pool, produce, EXPORT_MIMETYPES[export_format], filename)
+
+VALID_EDUCATIONAL_LEVELS = ['ابتدائي', 'متوسطة', 'ثانوية', 'إعدادية']
+VALID_BLOOD_TYPES = ['O+', 'O-', 'A+', 'A-', 'B+', 'B-', 'AB+', 'AB-']
+
+def validate_new_student(full_name, grade, room, blood_type=None):
+    """Return an {'error', 'error_ar'} dict for invalid student fields, or None"""
     if not all([full_name, grade, room]):
-        return jsonify({
+        return {
             'error': 'Full name, grade, and room are required',
             'error_ar': 'الاسم الكامل والصف والغرفة مطلوبة'
-        }), 400
-        
+        }
+    if not all(isinstance(value, str) for value in (full_name, grade, room)) or (
+            blood_type is not None and not isinstance(blood_type, str)):
+        return {
+            'error': 'Full name, grade, room and blood type must be text',
+            'error_ar': 'يجب أن يكون الاسم الكامل والصف والغرفة وفصيلة الدم نصوصاً'
+        }
+    
     grade_parts = grade.split(' - ')
     if len(grade_parts) < 2:
-        return jsonify({
+        return {
             'error': 'Invalid grade format',
             'error_ar': 'تنسيق الصف غير صحيح'
-        }), 400
-        
+        }
+    
     level = grade_parts[0].strip()
-    if level not in ['ابتدائي', 'متوسطة', 'ثانوية', 'إعدادية']:
-        return jsonify({
+    if level not in VALID_EDUCATIONAL_LEVELS:
+        return {
             'error': 'Invalid educational level',
             'error_ar': 'مستوى تعليمي غير صحيح'
-        }), 400
+        }
     
     # Validate blood type if provided
-    valid_blood_types = ['O+', 'O-', 'A+', 'A-', 'B+', 'B-', 'AB+', 'AB-']
-    if blood_type and blood_type not in valid_blood_types:
-        return jsonify({
+    if blood_type and blood_type not in VALID_BLOOD_TYPES:
+        return {
             'error': 'Invalid blood type',
             'error_ar': 'فصيلة دم غير صالحة'
-        }), 400
+        }
+    return None
+
+def generate_student_code():
+    return f"STD-{int(datetime.datetime.now().timestamp() * 1000)}-{secrets.token_hex(2).upper()}"
+
+@app.route('/api/school/<int:school_id>/student', methods=['POST'])
+@roles_required('admin', 'school')
+def add_student(school_id):
+    data = request.json
+    full_name = data.get('full_name')
+    # Stripped like bulk rows, so both paths see the same name in the duplicate check
+    if isinstance(full_name, str):
+        full_name = full_name.strip()
+    grade = data.get('grade')
+    room = data.get('room')
+    enrollment_date = data.get('enrollment_date')
+    parent_contact = data.get('parent_contact')  # New field: one or two phone numbers
+    blood_type = data.get('blood_type')  # New field: blood type selection
+    chronic_disease = data.get('chronic_disease')  # New field: optional medical conditions
+    
+    error = validate_new_student(full_name, grade, room, blood_type)
+    if error:
+        return jsonify(error), 400
 
     # Duplicate check
     check_query = "SELECT COUNT(*) FROM students WHERE full_name = %s AND grade = %s AND school_id = %s"
@@ -531,7 +943,7 @@ def add_student(school_id):
             'error_ar': 'طالب بنفس الاسم موجود بالفعل في هذا الصف'
         }), 400
         
-    student_code = f"STD-{int(datetime.datetime.now().timestamp() * 1000)}-{secrets.token_hex(2).upper()}"
+    student_code = generate_student_code()
     
     query = """INSERT INTO students (school_id, full_name, student_code, grade, room, enrollment_date, 
                parent_contact, blood_type, chronic_disease, detailed_scores, daily_attendance) 
@@ -549,6 +961,8 @@ def add_student(school_id):
         cur = conn.cursor(dictionary=True)
         cur.execute(query, params)
         last_id = cur.lastrowid
+        touch_school(cur, school_id)
+        refresh_student_summaries(conn, [last_id])
         conn.commit()
         cur.execute('SELECT * FROM students WHERE id = %s', (last_id,))
         student = cur.fetchone()
@@ -561,6 +975,125 @@ def add_student(school_id):
         'student': dict(student)
     }), 201
 
+MAX_BULK_STUDENTS = 1000
+STUDENT_INSERT_COLUMNS = ['school_id', 'full_name', 'student_code', 'grade', 'room', 'enrollment_date',
+                          'parent_contact', 'blood_type', 'chronic_disease', 'detailed_scores', 'daily_attendance']
+
+@app.route('/api/school/<int:school_id>/students/bulk', methods=['POST'])
+@roles_required('admin', 'school')
+def add_students_bulk(school_id):
+    """Register many students in one request and one transaction.
+    
+    Payload: {"grade": "...", "room": "...", "students": [{"full_name": "...", ...}, ...]}
+    Top-level grade/room apply to rows that do not set their own. Duplicates are
+    checked against the batch and the roster with one query, and rows are
+    inserted with one executemany. Returns one result per input row.
+    """
+    data = request.json or {}
+    rows = data.get('students')
+    if not isinstance(rows, list) or not rows:
+        return jsonify({'error': 'Students list is required', 'error_ar': 'قائمة الطلاب مطلوبة'}), 400
+    if len(rows) > MAX_BULK_STUDENTS:
+        return jsonify({
+            'error': f'At most {MAX_BULK_STUDENTS} students per request',
+            'error_ar': f'الحد الأقصى {MAX_BULK_STUDENTS} طالب في الطلب الواحد'
+        }), 400
+    
+    results = [None] * len(rows)
+    candidates = []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results[index] = {'index': index, 'success': False, 'error': 'Invalid student entry', 'error_ar': 'بيانات طالب غير صالحة'}
+            continue
+        full_name = row.get('full_name')
+        student = {
+            'full_name': full_name.strip() if isinstance(full_name, str) else full_name,
+            'grade': row.get('grade') or data.get('grade'),
+            'room': row.get('room') or data.get('room'),
+            'enrollment_date': row.get('enrollment_date'),
+            'parent_contact': row.get('parent_contact'),
+            'blood_type': row.get('blood_type'),
+            'chronic_disease': row.get('chronic_disease'),
+        }
+        error = validate_new_student(student['full_name'], student['grade'], student['room'], student['blood_type'])
+        if error:
+            results[index] = {'index': index, 'success': False, **error}
+            continue
+        candidates.append((index, student))
+    
+    pool = get_mysql_pool()
+    if not pool:
+        return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
+    
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        
+        existing = set()
+        names = sorted({student['full_name'] for _, student in candidates})
+        if names:
+            placeholders = ', '.join(['%s'] * len(names))
+            cur.execute(f'SELECT full_name, grade FROM students WHERE school_id = %s AND full_name IN ({placeholders})',
+                        (school_id, *names))
+            existing = {(row['full_name'], row['grade']) for row in cur.fetchall()}
+        
+        to_insert = []
+        codes = set()
+        for index, student in candidates:
+            key = (student['full_name'], student['grade'])
+            if key in existing:
+                results[index] = {
+                    'index': index, 'success': False,
+                    'error': 'A student with the same name already exists in this grade',
+                    'error_ar': 'طالب بنفس الاسم موجود بالفعل في هذا الصف'
+                }
+                continue
+            # Later rows with the same name and grade are duplicates of the first one
+            existing.add(key)
+            code = generate_student_code()
+            while code in codes:
+                code = generate_student_code()
+            codes.add(code)
+            student['student_code'] = code
+            to_insert.append((index, student))
+        
+        if to_insert:
+            placeholders = ', '.join(['%s'] * len(STUDENT_INSERT_COLUMNS))
+            cur.executemany(f"INSERT INTO students ({', '.join(STUDENT_INSERT_COLUMNS)}) VALUES ({placeholders})",
+                            [(school_id, student['full_name'], student['student_code'], student['grade'], student['room'],
+                              student['enrollment_date'], student['parent_contact'], student['blood_type'],
+                              student['chronic_disease'], '{}', '{}') for _, student in to_insert])
+            
+            placeholders = ', '.join(['%s'] * len(to_insert))
+            cur.execute(f'SELECT id, student_code FROM students WHERE student_code IN ({placeholders})',
+                        tuple(student['student_code'] for _, student in to_insert))
+            ids = {row['student_code']: row['id'] for row in cur.fetchall()}
+            
+            touch_school(cur, school_id)
+            refresh_student_summaries(conn, list(ids.values()))
+            conn.commit()
+            
+            for index, student in to_insert:
+                results[index] = {
+                    'index': index,
+                    'success': True,
+                    'student': {'id': ids[student['student_code']], **student}
+                }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
+    created = len(to_insert)
+    return jsonify({
+        'success': created > 0,
+        'message': f'تم تسجيل {created} طالب بنجاح',
+        'created_count': created,
+        'failed_count': len(rows) - created,
+        'results': results
+    }), 201 if created else 400
+
 # Add more routes as needed (this covers the main ones from server.js first 1000 lines)
 # For the sake of the task, I will continue with the rest of the routes logic...
 
@@ -643,6 +1176,8 @@ def update_student(student_id):
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute(query, params)
+        touch_schools_of(cur, 'students', [student_id])
+        refresh_student_summaries(conn, [student_id])
         conn.commit()
         cur.execute('SELECT * FROM students WHERE id = %s', (student_id,))
         student = cur.fetchone()
@@ -668,9 +1203,14 @@ def delete_student(student_id):
     conn = pool.get_connection()
     try:
         cur = conn.cursor()
+        # Look the owning school up before the row is gone
+        touch_schools_of(cur, 'students', [student_id])
         cur.execute('DELETE FROM students WHERE id = %s', (student_id,))
         row_count = cur.rowcount
+        apply_revocation = tokens.revoke_subject(cur, 'student', student_id) if row_count else None
         conn.commit()
+        if apply_revocation:
+            apply_revocation()
     finally:
         conn.close()
         
@@ -762,6 +1302,8 @@ def update_student_detailed(student_id):
     try:
         cur = conn.cursor()
         cur.execute(query_update, tuple(params))
+        touch_schools_of(cur, 'students', [student_id])
+        refresh_student_summaries(conn, [student_id])
         conn.commit()
     finally:
         conn.close()
@@ -781,11 +1323,15 @@ def get_subjects(school_id):
     conn = pool.get_connection()
     try:
         cur = conn.cursor(dictionary=True)
+        validators = school_validators(cur, 'subjects', school_id)
+        not_modified = check_not_modified(*validators)
+        if not_modified:
+            return not_modified
         cur.execute(query, (school_id,))
         subjects = cur.fetchall()
     finally:
         conn.close()
-    return jsonify({'success': True, 'subjects': subjects})
+    return with_validators(jsonify({'success': True, 'subjects': subjects}), *validators)
 
 @app.route('/api/school/<int:school_id>/subject', methods=['POST'])
 @roles_required('admin', 'school')
@@ -810,6 +1356,7 @@ def add_subject(school_id):
         cur = conn.cursor(dictionary=True)
         cur.execute(query, params)
         last_id = cur.lastrowid
+        touch_school(cur, school_id)
         conn.commit()
         cur.execute('SELECT * FROM subjects WHERE id = %s', (last_id,))
         subject = cur.fetchone()
@@ -837,6 +1384,7 @@ def update_subject(subject_id):
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute(query, params)
+        touch_schools_of(cur, 'subjects', [subject_id])
         conn.commit()
         cur.execute('SELECT * FROM subjects WHERE id = %s', (subject_id,))
         subject = cur.fetchone()
@@ -858,6 +1406,8 @@ def delete_subject(subject_id):
     conn = pool.get_connection()
     try:
         cur = conn.cursor()
+        # Look the owning school up before the row is gone
+        touch_schools_of(cur, 'subjects', [subject_id])
         cur.execute('DELETE FROM subjects WHERE id = %s', (subject_id,))
         row_count = cur.rowcount
         conn.commit()
@@ -882,11 +1432,15 @@ def get_grade_levels(school_id):
     conn = pool.get_connection()
     try:
         cur = conn.cursor(dictionary=True)
+        validators = school_validators(cur, 'grade-levels', school_id)
+        not_modified = check_not_modified(*validators)
+        if not_modified:
+            return not_modified
         cur.execute(query, (school_id,))
         grade_levels = cur.fetchall()
     finally:
         conn.close()
-    return jsonify({'success': True, 'grade_levels': grade_levels})
+    return with_validators(jsonify({'success': True, 'grade_levels': grade_levels}), *validators)
 
 @app.route('/api/school/<int:school_id>/grade-level', methods=['POST'])
 @roles_required('admin', 'school')
@@ -915,6 +1469,7 @@ def add_grade_level(school_id):
         query = 'INSERT INTO grade_levels (school_id, name, display_order) VALUES (%s, %s, %s)'
         cur.execute(query, (school_id, name, display_order))
         last_id = cur.lastrowid
+        touch_school(cur, school_id)
         conn.commit()
         cur.execute('SELECT * FROM grade_levels WHERE id = %s', (last_id,))
         grade_level = cur.fetchone()
@@ -945,6 +1500,7 @@ def update_grade_level(grade_level_id):
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute(query, params)
+        touch_schools_of(cur, 'grade_levels', [grade_level_id])
         conn.commit()
         cur.execute('SELECT * FROM grade_levels WHERE id = %s', (grade_level_id,))
         grade_level = cur.fetchone()
@@ -967,6 +1523,8 @@ def delete_grade_level(grade_level_id):
     conn = pool.get_connection()
     try:
         cur = conn.cursor()
+        # Look the owning school up before the row is gone
+        touch_schools_of(cur, 'grade_levels', [grade_level_id])
         cur.execute('DELETE FROM grade_levels WHERE id = %s', (grade_level_id,))
         row_count = cur.rowcount
         conn.commit()
@@ -1012,6 +1570,7 @@ def add_bulk_grade_levels(school_id):
             last_id = cur.lastrowid
             cur.execute('SELECT * FROM grade_levels WHERE id = %s', (last_id,))
             added.append(dict(cur.fetchone()))
+        touch_school(cur, school_id)
         conn.commit()
     finally:
         conn.close()
@@ -1048,11 +1607,15 @@ def get_teachers(school_id):
     conn = pool.get_connection()
     try:
         cur = conn.cursor(dictionary=True)
+        validators = school_validators(cur, 'teachers', school_id)
+        not_modified = check_not_modified(*validators)
+        if not_modified:
+            return not_modified
         cur.execute(query, params)
         teachers = cur.fetchall()
     finally:
         conn.close()
-    return jsonify({'success': True, 'teachers': teachers})
+    return with_validators(jsonify({'success': True, 'teachers': teachers}), *validators)
 
 @app.route('/api/school/<int:school_id>/teacher', methods=['POST'])
 @roles_required('admin', 'school')
@@ -1086,6 +1649,7 @@ def add_teacher(school_id):
         cur = conn.cursor(dictionary=True)
         cur.execute(query, params)
         last_id = cur.lastrowid
+        touch_school(cur, school_id)
         conn.commit()
         # Fetch the created teacher with subject name
         cur.execute('''SELECT t.*, s.name as subject_name 
@@ -1134,6 +1698,7 @@ def update_teacher(teacher_id):
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute(query, params)
+        touch_schools_of(cur, 'teachers', [teacher_id])
         conn.commit()
         # Fetch the updated teacher with subject name
         cur.execute('''SELECT t.*, s.name as subject_name 
@@ -1164,6 +1729,8 @@ def delete_teacher(teacher_id):
     conn = pool.get_connection()
     try:
         cur = conn.cursor()
+        # Look the owning school up before the row is gone
+        touch_schools_of(cur, 'teachers', [teacher_id])
         cur.execute('DELETE FROM teachers WHERE id = %s', (teacher_id,))
         row_count = cur.rowcount
         conn.commit()
@@ -1177,71 +1744,28 @@ def delete_teacher(teacher_id):
 
 # ------ Academic Years Routes ------
 
-def get_current_academic_year_name():
-    """Calculate the current academic year based on the current date.
-    Academic year starts in September and ends in June.
-    For example: If current date is between Sep 2025 - June 2026, the year is 2025/2026
-    """
-    now = datetime.datetime.now()
-    current_month = now.month
-    current_year = now.year
-    
-    # If we're between September and December, the academic year is current_year/next_year
-    # If we're between January and August, the academic year is previous_year/current_year
-    if current_month >= 9:  # September to December
-        start_year = current_year
-        end_year = current_year + 1
-    else:  # January to August
-        start_year = current_year - 1
-        end_year = current_year
-    
-    return f"{start_year}/{end_year}", start_year, end_year
+def academic_years_etag(resource):
+    fingerprint = academic_years.fingerprint()
+    return f'{resource}-{fingerprint}' if fingerprint else None
 
 @app.route('/api/academic-year/current', methods=['GET'])
 def get_current_academic_year_info():
     """Get the current academic year information - automatically calculated from system date"""
-    # Calculate the current academic year based on the current date
-    name, start_year, end_year = get_current_academic_year_name()
-    
-    pool = get_mysql_pool()
-    if pool:
-        conn = pool.get_connection()
-        try:
-            cur = conn.cursor(dictionary=True)
-            # Try to find the calculated year in the database
-            cur.execute('SELECT * FROM system_academic_years WHERE name = %s', (name,))
-            current_year = cur.fetchone()
-            
-            if current_year:
-                return jsonify({
-                    'success': True,
-                    'academic_year_id': current_year['id'],
-                    'academic_year_name': current_year['name'],
-                    'current_academic_year': current_year
-                })
-            else:
-                # Create the academic year if it doesn't exist
-                start_date = f"{start_year}-09-01"
-                end_date = f"{end_year}-06-30"
-                cur.execute('''INSERT INTO system_academic_years (name, start_year, end_year, start_date, end_date, is_current) 
-                               VALUES (%s, %s, %s, %s, %s, 1)''',
-                           (name, start_year, end_year, start_date, end_date))
-                last_id = cur.lastrowid
-                conn.commit()
-                
-                cur.execute('SELECT * FROM system_academic_years WHERE id = %s', (last_id,))
-                current_year = cur.fetchone()
-                
-                return jsonify({
-                    'success': True,
-                    'academic_year_id': current_year['id'],
-                    'academic_year_name': current_year['name'],
-                    'current_academic_year': current_year
-                })
-        finally:
-            conn.close()
+    etag = academic_years_etag('current-academic-year')
+    not_modified = check_not_modified(etag)
+    if not_modified:
+        return not_modified
+    current_year = academic_years.current()
+    if current_year:
+        return with_validators(jsonify({
+            'success': True,
+            'academic_year_id': current_year['id'],
+            'academic_year_name': current_year['name'],
+            'current_academic_year': current_year
+        }), etag)
     
     # Fall back to calculated year without database
+    name, start_year, end_year = get_current_academic_year_name()
     start_date = f"{start_year}-09-01"
     end_date = f"{end_year}-06-30"
     
@@ -1266,25 +1790,16 @@ def get_system_academic_years():
     """Get all system-wide academic years (applies to all schools)
     Automatically marks the current year based on the present date.
     """
-    # Calculate the current academic year name based on date
-    current_year_name, _, _ = get_current_academic_year_name()
-    
-    pool = get_mysql_pool()
-    if not pool:
+    etag = academic_years_etag('academic-years')
+    not_modified = check_not_modified(etag)
+    if not_modified:
+        return not_modified
+    years = academic_years.years()
+    if years is None:
         return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
-        
-    conn = pool.get_connection()
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute('SELECT * FROM system_academic_years ORDER BY start_year DESC')
-        academic_years = cur.fetchall()
-        
-        # Mark the current year based on date calculation (override database is_current)
-        for year in academic_years:
-            year['is_current'] = 1 if year['name'] == current_year_name else 0
-    finally:
-        conn.close()
-    return jsonify({'success': True, 'academic_years': academic_years, 'current_year_name': current_year_name})
+    current_year_name, _, _ = get_current_academic_year_name()
+    return with_validators(jsonify({'success': True, 'academic_years': years, 'current_year_name': current_year_name}),
+                           etag)
 
 @app.route('/api/system/academic-year', methods=['POST'])
 @roles_required('admin')
@@ -1342,6 +1857,7 @@ def add_system_academic_year():
         cur.execute(query, (name, start_year, end_year, start_date, end_date, 1 if is_current else 0))
         last_id = cur.lastrowid
         conn.commit()
+        academic_years.invalidate()
         
         cur.execute('SELECT * FROM system_academic_years WHERE id = %s', (last_id,))
         academic_year = cur.fetchone()
@@ -1377,6 +1893,7 @@ def set_system_current_academic_year(year_id):
         # Set this year as current
         cur.execute('UPDATE system_academic_years SET is_current = 1 WHERE id = %s', (year_id,))
         conn.commit()
+        academic_years.invalidate()
         
         cur.execute('SELECT * FROM system_academic_years WHERE id = %s', (year_id,))
         academic_year = cur.fetchone()
@@ -1409,6 +1926,7 @@ def delete_system_academic_year(year_id):
         cur.execute('DELETE FROM system_academic_years WHERE id = %s', (year_id,))
         row_count = cur.rowcount
         conn.commit()
+        academic_years.invalidate()
     except Exception as e:
         conn.rollback()
         conn.close()
@@ -1466,6 +1984,7 @@ def generate_system_academic_years():
             added.append(dict(cur.fetchone()))
         
         conn.commit()
+        academic_years.invalidate()
     finally:
         conn.close()
         
@@ -1483,62 +2002,26 @@ def generate_system_academic_years():
 @app.route('/api/school/<int:school_id>/academic-years', methods=['GET'])
 def get_academic_years(school_id):
     """Get all academic years (now returns system-wide years for all schools)"""
-    # Redirect to system-wide academic years
-    pool = get_mysql_pool()
-    if not pool:
+    etag = academic_years_etag('academic-years')
+    not_modified = check_not_modified(etag)
+    if not_modified:
+        return not_modified
+    years = academic_years.years()
+    if years is None:
         return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
-        
-    conn = pool.get_connection()
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute('SELECT * FROM system_academic_years ORDER BY start_year DESC')
-        academic_years = cur.fetchall()
-        
-        # Mark current year based on date calculation
-        current_year_name, _, _ = get_current_academic_year_name()
-        for year in academic_years:
-            year['is_current'] = 1 if year['name'] == current_year_name else 0
-    finally:
-        conn.close()
-    return jsonify({'success': True, 'academic_years': academic_years})
+    return with_validators(jsonify({'success': True, 'academic_years': years}), etag)
 
 @app.route('/api/school/<int:school_id>/academic-year/current', methods=['GET'])
 def get_school_current_academic_year(school_id):
     """Get the current academic year - automatically calculated from system date"""
-    # Calculate the current academic year based on the current date
-    name, start_year, end_year = get_current_academic_year_name()
-    
-    pool = get_mysql_pool()
-    if not pool:
+    etag = academic_years_etag('current-academic-year')
+    not_modified = check_not_modified(etag)
+    if not_modified:
+        return not_modified
+    academic_year = academic_years.current()
+    if not academic_year:
         return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
-        
-    conn = pool.get_connection()
-    try:
-        cur = conn.cursor(dictionary=True)
-        # Try to find the calculated year in the database
-        cur.execute('SELECT * FROM system_academic_years WHERE name = %s', (name,))
-        academic_year = cur.fetchone()
-        
-        # If not found, create it automatically
-        if not academic_year:
-            start_date = f"{start_year}-09-01"
-            end_date = f"{end_year}-06-30"
-            
-            cur.execute('''INSERT INTO system_academic_years (name, start_year, end_year, start_date, end_date, is_current) 
-                           VALUES (%s, %s, %s, %s, %s, 1)''',
-                       (name, start_year, end_year, start_date, end_date))
-            last_id = cur.lastrowid
-            conn.commit()
-            
-            cur.execute('SELECT * FROM system_academic_years WHERE id = %s', (last_id,))
-            academic_year = cur.fetchone()
-        
-        # Ensure is_current is set correctly
-        academic_year['is_current'] = 1
-    finally:
-        conn.close()
-        
-    return jsonify({'success': True, 'academic_year': academic_year})
+    return with_validators(jsonify({'success': True, 'academic_year': academic_year}), etag)
 
 # Legacy endpoint - academic year creation is now admin-only via /api/system/academic-year
 # This endpoint is kept for backward compatibility but redirects to error
@@ -1633,40 +2116,198 @@ def update_student_grades_by_year(student_id, academic_year_id):
     try:
         cur = conn.cursor(dictionary=True)
         
+        rows = []
         for subject_name, subject_grades in grades.items():
             if subject_name == '[object Object]' or not subject_name:
                 continue
-                
-            # Check if grade record exists
-            cur.execute('SELECT id FROM student_grades WHERE student_id = %s AND academic_year_id = %s AND subject_name = %s',
-                       (student_id, academic_year_id, subject_name))
-            existing = cur.fetchone()
-            
-            month1 = int(subject_grades.get('month1', 0) or 0)
-            month2 = int(subject_grades.get('month2', 0) or 0)
-            midterm = int(subject_grades.get('midterm', 0) or 0)
-            month3 = int(subject_grades.get('month3', 0) or 0)
-            month4 = int(subject_grades.get('month4', 0) or 0)
-            final = int(subject_grades.get('final', 0) or 0)
-            
-            if existing:
-                cur.execute('''UPDATE student_grades SET 
-                               month1 = %s, month2 = %s, midterm = %s, month3 = %s, month4 = %s, final = %s,
-                               updated_at = CURRENT_TIMESTAMP
-                               WHERE id = %s''',
-                           (month1, month2, midterm, month3, month4, final, existing['id']))
-            else:
-                cur.execute('''INSERT INTO student_grades 
-                               (student_id, academic_year_id, subject_name, month1, month2, midterm, month3, month4, final)
-                               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)''',
-                           (student_id, academic_year_id, subject_name, month1, month2, midterm, month3, month4, final))
+            rows.append((student_id, academic_year_id, subject_name) +
+                        tuple(int(subject_grades.get(period, 0) or 0) for period in GRADE_PERIODS))
         
+        # One INSERT ... ON DUPLICATE KEY / ON CONFLICT statement for the whole payload
+        upsert_student_grades(cur, rows)
+        touch_schools_of(cur, 'students', [student_id])
+        refresh_student_summaries(conn, [student_id], academic_year_id)
         conn.commit()
     finally:
         conn.close()
         
     return jsonify({'success': True, 'message': 'تم حفظ الدرجات بنجاح'})
 
+@app.route('/api/school/<int:school_id>/grade-sheet', methods=['GET'])
+@roles_required('admin', 'school')
+def get_grade_sheet(school_id):
+    """Get a students x periods grade matrix for one grade, subject and academic year.
+    
+    Query parameters: grade, subject, academic_year_id and optional room.
+    """
+    grade = request.args.get('grade')
+    subject = request.args.get('subject')
+    academic_year_id = request.args.get('academic_year_id', type=int)
+    room = request.args.get('room')
+    
+    if not grade or not subject or not academic_year_id:
+        return jsonify({
+            'error': 'Grade, subject and academic_year_id are required',
+            'error_ar': 'الصف والمادة والسنة الدراسية مطلوبة'
+        }), 400
+    
+    period_columns = ', '.join(f'sg.{period}' for period in GRADE_PERIODS)
+    query = f'''SELECT s.id AS student_id, s.full_name, s.student_code, s.room,
+                       sg.id AS grade_id, {period_columns}
+                FROM students s
+                LEFT JOIN student_grades sg
+                  ON sg.student_id = s.id AND sg.academic_year_id = %s AND sg.subject_name = %s
+                WHERE s.school_id = %s AND s.grade = %s'''
+    params = [academic_year_id, subject, school_id, grade]
+    if room:
+        query += ' AND s.room = %s'
+        params.append(room)
+    query += ' ORDER BY s.room, s.full_name'
+    
+    pool = get_mysql_pool()
+    if not pool:
+        return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
+    
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(query, tuple(params))
+        rows = cur.fetchall()
+    finally:
+        conn.close()
+    
+    sheet = []
+    for row in rows:
+        sheet.append({
+            'student_id': row['student_id'],
+            'full_name': row['full_name'],
+            'student_code': row['student_code'],
+            'room': row['room'],
+            'has_grades': row['grade_id'] is not None,
+            'grades': {period: row[period] or 0 for period in GRADE_PERIODS}
+        })
+    
+    return jsonify({
+        'success': True,
+        'grade': grade,
+        'subject': subject,
+        'academic_year_id': academic_year_id,
+        'periods': GRADE_PERIODS,
+        'max_score': get_max_score(grade),
+        'students': sheet
+    })
+
+@app.route('/api/school/<int:school_id>/grade-sheet', methods=['PUT'])
+@roles_required('admin', 'school')
+def update_grade_sheet(school_id):
+    """Save a whole grade sheet (students x periods) for one grade, subject and academic year.
+    
+    Expected payload:
+        {"grade": "...", "subject": "...", "academic_year_id": 1,
+         "students": [{"student_id": 1, "grades": {"month1": 90, ...}}, ...]}
+    Periods missing from a student's grades are saved as 0, matching the per-student save.
+    """
+    data = request.json or {}
+    grade = data.get('grade')
+    subject = data.get('subject')
+    academic_year_id = data.get('academic_year_id')
+    entries = data.get('students') or []
+    
+    if not grade or not subject or not academic_year_id or not entries:
+        return jsonify({
+            'error': 'Grade, subject, academic_year_id and students are required',
+            'error_ar': 'الصف والمادة والسنة الدراسية وقائمة الطلاب مطلوبة'
+        }), 400
+    
+    if not isinstance(academic_year_id, int) or isinstance(academic_year_id, bool) or not isinstance(entries, list):
+        return jsonify({
+            'error': 'academic_year_id must be a number and students a list',
+            'error_ar': 'يجب أن تكون السنة الدراسية رقماً وقائمة الطلاب مصفوفة'
+        }), 400
+    
+    # Reject malformed entries the same way roll call does, before looking at scores
+    invalid_entries = []
+    seen_ids = set()
+    for index, entry in enumerate(entries):
+        student_id = entry.get('student_id') if isinstance(entry, dict) else None
+        if not isinstance(student_id, int) or isinstance(student_id, bool):
+            invalid_entries.append({'index': index, 'entry': entry, 'reason': 'Missing or invalid student_id'})
+        elif student_id in seen_ids:
+            invalid_entries.append({'index': index, 'student_id': student_id, 'reason': 'Duplicate student'})
+        elif not isinstance(entry.get('grades') or {}, dict):
+            invalid_entries.append({'index': index, 'entry': entry, 'reason': 'grades must be an object'})
+        else:
+            seen_ids.add(student_id)
+    if invalid_entries:
+        return jsonify({
+            'error': 'Invalid grade sheet entries',
+            'error_ar': 'بيانات كشف الدرجات غير صالحة',
+            'invalid_entries': invalid_entries
+        }), 400
+    
+    # Validate every score in the sheet against the grade's scale in one pass
+    max_score = get_max_score(grade)
+    invalid_scores = []
+    rows = []
+    for entry in entries:
+        student_id = entry['student_id']
+        grades = entry.get('grades') or {}
+        scores = []
+        for period in GRADE_PERIODS:
+            value = grades.get(period, 0) or 0
+            try:
+                # Whole numbers only: 7.9 is rejected rather than truncated to 7, as in file imports
+                if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+                    raise ValueError(value)
+                score = int(value)
+            except (ValueError, TypeError, OverflowError):
+                invalid_scores.append({'student_id': student_id, 'period': period, 'value': str(grades.get(period))})
+                continue
+            if score < 0 or score > max_score:
+                invalid_scores.append({'student_id': student_id, 'period': period, 'value': score})
+            scores.append(score)
+        rows.append((student_id, academic_year_id, subject) + tuple(scores))
+    
+    if invalid_scores:
+        if max_score == 10:
+            error = {'error': 'For grades 1-4, scores must be whole numbers between 0 and 10',
+                     'error_ar': 'للصفوف 1-4، يجب أن تكون الدرجات أعداداً صحيحة بين 0 و 10'}
+        else:
+            error = {'error': 'Scores must be whole numbers between 0 and 100',
+                     'error_ar': 'يجب أن تكون الدرجات أعداداً صحيحة بين 0 و 100'}
+        return jsonify({**error, 'invalid_scores': invalid_scores}), 400
+    
+    pool = get_mysql_pool()
+    if not pool:
+        return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
+    
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute('SELECT id FROM students WHERE school_id = %s AND grade = %s', (school_id, grade))
+        grade_student_ids = {row['id'] for row in cur.fetchall()}
+        
+        unknown_ids = sorted({row[0] for row in rows if row[0] not in grade_student_ids}, key=str)
+        if unknown_ids:
+            return jsonify({
+                'error': 'Some students do not belong to this grade',
+                'error_ar': 'بعض الطلاب لا ينتمون إلى هذا الصف',
+                'unknown_student_ids': unknown_ids
+            }), 400
+        
+        try:
+            upsert_student_grades(cur, rows)
+            touch_school(cur, school_id)
+            refresh_student_summaries(conn, [row[0] for row in rows], academic_year_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
+    
+    return jsonify({'success': True, 'message': 'تم حفظ الدرجات بنجاح', 'saved': len(rows)})
+
 @app.route('/api/student/<int:student_id>/attendance/<int:academic_year_id>', methods=['GET'])
 @roles_required('admin', 'school', 'student')
 def get_student_attendance_by_year(student_id, academic_year_id):
@@ -1711,28 +2352,16 @@ def update_student_attendance_by_year(student_id, academic_year_id):
     try:
         cur = conn.cursor(dictionary=True)
         
-        for date_str, record in attendance.items():
-            status = record.get('status', 'present')
-            notes = record.get('notes', '')
-            
-            # Check if attendance record exists
-            cur.execute('SELECT id FROM student_attendance WHERE student_id = %s AND academic_year_id = %s AND attendance_date = %s',
-                       (student_id, academic_year_id, date_str))
-            existing = cur.fetchone()
-            
-            if existing:
-                cur.execute('UPDATE student_attendance SET status = %s, notes = %s WHERE id = %s',
-                           (status, notes, existing['id']))
-            else:
-                cur.execute('''INSERT INTO student_attendance (student_id, academic_year_id, attendance_date, status, notes)
-                               VALUES (%s, %s, %s, %s, %s)''',
-                           (student_id, academic_year_id, date_str, status, notes))
-        
+        rows = [(student_id, academic_year_id, date_str, record.get('status', 'present'), record.get('notes', ''))
+                for date_str, record in attendance.items()]
+        counts = upsert_student_attendance(cur, rows)
+        touch_schools_of(cur, 'students', [student_id])
+        refresh_student_summaries(conn, [student_id], academic_year_id)
         conn.commit()
     finally:
         conn.close()
         
-    return jsonify({'success': True, 'message': 'تم حفظ سجل الحضور بنجاح'})
+    return jsonify({'success': True, 'message': 'تم حفظ سجل الحضور بنجاح', **counts})
 
 @app.route('/api/student/<int:student_id>/attendance/<int:academic_year_id>/add', methods=['POST'])
 @roles_required('admin', 'school')
@@ -1754,24 +2383,350 @@ def add_student_attendance_record(student_id, academic_year_id):
     try:
         cur = conn.cursor(dictionary=True)
         
-        # Check if attendance record exists
-        cur.execute('SELECT id FROM student_attendance WHERE student_id = %s AND academic_year_id = %s AND attendance_date = %s',
-                   (student_id, academic_year_id, date_str))
-        existing = cur.fetchone()
+        counts = upsert_student_attendance(cur, [(student_id, academic_year_id, date_str, status, notes)])
+        touch_schools_of(cur, 'students', [student_id])
+        refresh_student_summaries(conn, [student_id], academic_year_id)
+        conn.commit()
+    finally:
+        conn.close()
         
-        if existing:
-            cur.execute('UPDATE student_attendance SET status = %s, notes = %s WHERE id = %s',
-                       (status, notes, existing['id']))
+    return jsonify({'success': True, 'message': 'تم إضافة سجل الحضور بنجاح', **counts})
+
+VALID_ATTENDANCE_STATUSES = ('present', 'absent', 'late', 'excused')
+
+@app.route('/api/school/<int:school_id>/attendance/roll-call', methods=['POST'])
+@roles_required('admin', 'school')
+def record_roll_call(school_id):
+    """Record attendance for a whole class (grade + room) for one date in a single transaction.
+    
+    Expected payload:
+        {"grade": "...", "room": "...", "date": "YYYY-MM-DD", "academic_year_id": 1 (optional),
+         "records": [{"student_id": 1, "status": "present", "notes": ""}, ...]}
+    """
+    data = request.json or {}
+    grade = data.get('grade')
+    room = data.get('room')
+    date_str = data.get('date')
+    academic_year_id = data.get('academic_year_id')
+    records = data.get('records') or []
+    
+    if not grade or not room or not date_str or not records:
+        return jsonify({
+            'error': 'Grade, room, date and records are required',
+            'error_ar': 'الصف والشعبة والتاريخ وسجلات الحضور مطلوبة'
+        }), 400
+    
+    try:
+        datetime.datetime.strptime(date_str, '%Y-%m-%d')
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Date must be in YYYY-MM-DD format', 'error_ar': 'يجب أن يكون التاريخ بصيغة YYYY-MM-DD'}), 400
+    
+    if academic_year_id is not None and (not isinstance(academic_year_id, int) or isinstance(academic_year_id, bool)):
+        return jsonify({
+            'error': 'academic_year_id must be a number',
+            'error_ar': 'يجب أن تكون السنة الدراسية رقماً'
+        }), 400
+    
+    # Validate the records as a set before touching the database
+    invalid_records = []
+    seen_ids = set()
+    rows = []
+    for index, record in enumerate(records):
+        student_id = record.get('student_id') if isinstance(record, dict) else None
+        status = record.get('status', 'present') if isinstance(record, dict) else None
+        if not isinstance(student_id, int) or isinstance(student_id, bool):
+            invalid_records.append({'index': index, 'reason': 'Missing or invalid student_id'})
+        elif student_id in seen_ids:
+            invalid_records.append({'index': index, 'student_id': student_id, 'reason': 'Duplicate student'})
+        elif status not in VALID_ATTENDANCE_STATUSES:
+            invalid_records.append({'index': index, 'student_id': student_id, 'reason': f'Invalid status: {status}'})
         else:
-            cur.execute('''INSERT INTO student_attendance (student_id, academic_year_id, attendance_date, status, notes)
-                           VALUES (%s, %s, %s, %s, %s)''',
-                       (student_id, academic_year_id, date_str, status, notes))
+            seen_ids.add(student_id)
+            rows.append((student_id, status, record.get('notes', '')))
+    
+    if invalid_records:
+        return jsonify({
+            'error': 'Invalid attendance records',
+            'error_ar': 'سجلات حضور غير صالحة',
+            'invalid_records': invalid_records
+        }), 400
+    
+    pool = get_mysql_pool()
+    if not pool:
+        return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
+    
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
         
-        conn.commit()
+        if not academic_year_id:
+            academic_year_id = current_academic_year_id(cur)
+        else:
+            cur.execute('SELECT id FROM system_academic_years WHERE id = %s', (academic_year_id,))
+            if not cur.fetchone():
+                return jsonify({'error': 'Academic year not found', 'error_ar': 'لم يتم العثور على السنة الدراسية'}), 400
+        
+        cur.execute('SELECT id FROM students WHERE school_id = %s AND grade = %s AND room = %s',
+                    (school_id, grade, room))
+        class_ids = {row['id'] for row in cur.fetchall()}
+        
+        unknown_ids = sorted(seen_ids - class_ids)
+        if unknown_ids:
+            return jsonify({
+                'error': 'Some students do not belong to this class',
+                'error_ar': 'بعض الطلاب لا ينتمون إلى هذا الصف',
+                'unknown_student_ids': unknown_ids
+            }), 400
+        
+        try:
+            counts = upsert_student_attendance(
+                cur, [(student_id, academic_year_id, date_str, status, notes) for student_id, status, notes in rows])
+            touch_school(cur, school_id)
+            refresh_student_summaries(conn, [row[0] for row in rows], academic_year_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
+    
+    return jsonify({
+        'success': True,
+        'message': f'تم حفظ حضور {len(rows)} طالب بنجاح',
+        'academic_year_id': academic_year_id,
+        'date': date_str,
+        'recorded': len(rows),
+        'not_marked_student_ids': sorted(class_ids - seen_ids),
+        **counts
+    })
+
+@app.route('/api/school/<int:school_id>/import/<kind>', methods=['POST'])
+@roles_required('admin', 'school')
+def import_school_file(school_id, kind):
+    """Import a grade sheet or attendance file (CSV or XLSX, multipart field "file").
+    
+    grades columns: student_code, subject and any of month1 ... final (empty cells keep stored scores),
+                    or the student export's "<subject> - <period>" columns.
+    attendance columns: student_code, date (YYYY-MM-DD), status and optional notes.
+    Optional academic_year_id (form field or query string) defaults to the current year.
+    Rows are written in chunked transactions; the response lists the rejected lines. A file that
+    becomes unreadable part way through returns 400 with imported_rows and committed_through_line.
+    """
+    if kind not in IMPORT_KINDS:
+        return jsonify({'error': f'Import type must be one of: {", ".join(IMPORT_KINDS)}', 'error_ar': 'نوع الاستيراد غير مدعوم'}), 400
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'error': 'File is required', 'error_ar': 'الملف مطلوب'}), 400
+    academic_year_id = request.form.get('academic_year_id', type=int) or request.args.get('academic_year_id', type=int)
+    
+    pool = get_mysql_pool()
+    if not pool:
+        return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
+    
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        if not academic_year_id:
+            academic_year_id = current_academic_year_id(cur)
+        
+        try:
+            report = FileImport(conn, school_id, academic_year_id, kind).run(iter_upload_rows(upload, kind))
+        except ImportFileError as e:
+            conn.rollback()
+            error = {'error': str(e), 'error_ar': 'تعذر قراءة الملف'}
+            if e.report and e.report['imported_rows']:
+                # Chunks before an unreadable line stay saved; say which
+                error.update(e.report)
+            return jsonify(error), 400
+    finally:
+        conn.close()
+    
+    return jsonify({
+        'success': report['imported_rows'] > 0 or report['failed_rows'] == 0,
+        'message': f"تم استيراد {report['imported_rows']} سجل بنجاح",
+        'academic_year_id': academic_year_id,
+        **report
+    })
+
+# ============================================================================
+# PERFORMANCE ANALYTICS
+# ============================================================================
+
+# Results stay valid until the school's data_version changes (any write to its data)
+ANALYTICS_CACHE_SIZE = int(os.getenv('ANALYTICS_CACHE_SIZE', 256))
+analytics_cache = VersionedCache(ANALYTICS_CACHE_SIZE)
+
+@app.route('/api/school/<int:school_id>/analytics', methods=['GET'])
+@roles_required('admin', 'school')
+def get_school_analytics(school_id):
+    """Average grade, pass/excellence/attendance rates and distributions for the analytics tab.
+    
+    Query parameters (all optional): grade, subject, year (academic_year_id, defaults to the current year).
+    """
+    grade = request.args.get('grade') or None
+    subject = request.args.get('subject') or None
+    academic_year_id = request.args.get('year', type=int)
+    
+    pool = get_mysql_pool()
+    if not pool:
+        return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
+    
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        version = get_school_version(cur, school_id)
+        if version is None:
+            return jsonify({'error': 'School not found', 'error_ar': 'لم يتم العثور على المدرسة'}), 404
+        if not academic_year_id:
+            academic_year_id = current_academic_year_id(cur)
+            conn.commit()
+        
+        cache_key = (school_id, grade, subject, academic_year_id)
+        analytics = analytics_cache.get(cache_key, version)
+        cached = analytics is not None
+        if not cached:
+            analytics = compute_school_analytics(cur, school_id, academic_year_id, grade, subject)
+            analytics_cache.set(cache_key, version, analytics)
     finally:
         conn.close()
+    
+    return jsonify({
+        'success': True,
+        'academic_year_id': academic_year_id,
+        'grade': grade,
+        'subject': subject,
+        'cached': cached,
+        'analytics': analytics
+    })
+
+@app.route('/api/school/<int:school_id>/at-risk', methods=['GET'])
+@roles_required('admin', 'school')
+def get_at_risk_students(school_id):
+    """Students whose grades deteriorated, found with the vectorized trend engine.
+    
+    Query parameters (all optional): grade, subject, year (academic_year_id),
+    from and to (periods, e.g. from=month2&to=midterm) and min_drop (percent of the scale, default 30).
+    Without from/to, every significant deterioration or declining trend below the safe grade is reported.
+    """
+    grade = request.args.get('grade') or None
+    subject = request.args.get('subject') or None
+    academic_year_id = request.args.get('year', type=int)
+    from_period = request.args.get('from') or None
+    to_period = request.args.get('to') or None
+    min_drop = request.args.get('min_drop', SIGNIFICANT_CHANGE_PERCENT, type=float)
+    
+    if bool(from_period) != bool(to_period) or (from_period and (
+            from_period not in GRADE_PERIODS or to_period not in GRADE_PERIODS
+            or GRADE_PERIODS.index(from_period) >= GRADE_PERIODS.index(to_period))):
+        return jsonify({
+            'error': f'from and to must be two periods in order: {", ".join(GRADE_PERIODS)}',
+            'error_ar': 'يجب تحديد فترتين صحيحتين بالترتيب'
+        }), 400
+    
+    pool = get_mysql_pool()
+    if not pool:
+        return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
+    
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        version = get_school_version(cur, school_id)
+        if version is None:
+            return jsonify({'error': 'School not found', 'error_ar': 'لم يتم العثور على المدرسة'}), 404
+        if not academic_year_id:
+            academic_year_id = current_academic_year_id(cur)
+            conn.commit()
         
-    return jsonify({'success': True, 'message': 'تم إضافة سجل الحضور بنجاح'})
+        cache_key = ('at-risk', school_id, grade, subject, academic_year_id, from_period, to_period, min_drop)
+        students = analytics_cache.get(cache_key, version)
+        cached = students is not None
+        if not cached:
+            tensor = load_grade_tensor(conn.cursor(), school_id, academic_year_id, grade, subject)
+            students = find_at_risk(tensor, from_period, to_period, min_drop)
+            if students:
+                placeholders = ', '.join(['%s'] * len(students))
+                cur.execute(f'SELECT id, full_name, student_code, room FROM students WHERE id IN ({placeholders})',
+                            tuple(student['student_id'] for student in students))
+                details = {row['id']: row for row in cur.fetchall()}
+                for student in students:
+                    row = details[student['student_id']]
+                    student.update(full_name=row['full_name'], student_code=row['student_code'], room=row['room'])
+            analytics_cache.set(cache_key, version, students)
+    finally:
+        conn.close()
+    
+    return jsonify({
+        'success': True,
+        'academic_year_id': academic_year_id,
+        'cached': cached,
+        'count': len(students),
+        'students': students
+    })
+
+@app.route('/api/school/<int:school_id>/ranking', methods=['GET'])
+@roles_required('admin', 'school')
+def get_grade_ranking(school_id):
+    """Class/grade ranking with per-subject and overall rank, dense rank and percentile.
+    
+    Query parameters: grade (required), year (academic_year_id, defaults to the current year),
+    period (rank on one period instead of the average of graded periods) and room (rank one class).
+    """
+    grade = request.args.get('grade')
+    academic_year_id = request.args.get('year', type=int)
+    period = request.args.get('period') or None
+    room = request.args.get('room') or None
+    
+    if not grade:
+        return jsonify({'error': 'Grade is required', 'error_ar': 'الصف مطلوب'}), 400
+    if period and period not in GRADE_PERIODS:
+        return jsonify({
+            'error': f'Period must be one of: {", ".join(GRADE_PERIODS)}',
+            'error_ar': 'الفترة غير صحيحة'
+        }), 400
+    
+    pool = get_mysql_pool()
+    if not pool:
+        return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
+    
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        version = get_school_version(cur, school_id)
+        if version is None:
+            return jsonify({'error': 'School not found', 'error_ar': 'لم يتم العثور على المدرسة'}), 404
+        if not academic_year_id:
+            academic_year_id = current_academic_year_id(cur)
+            conn.commit()
+        
+        cache_key = ('ranking', school_id, grade, academic_year_id, period, room)
+        ranking = analytics_cache.get(cache_key, version)
+        cached = ranking is not None
+        if not cached:
+            students, engine = compute_ranking(conn, school_id, grade, academic_year_id, period, room)
+            if students:
+                placeholders = ', '.join(['%s'] * len(students))
+                cur.execute(f'SELECT id, full_name, student_code, room FROM students WHERE id IN ({placeholders})',
+                            tuple(student['student_id'] for student in students))
+                details = {row['id']: row for row in cur.fetchall()}
+                for student in students:
+                    row = details[student['student_id']]
+                    student.update(full_name=row['full_name'], student_code=row['student_code'], room=row['room'])
+            ranking = {'engine': engine, 'students': students}
+            analytics_cache.set(cache_key, version, ranking)
+    finally:
+        conn.close()
+    
+    return jsonify({
+        'success': True,
+        'grade': grade,
+        'academic_year_id': academic_year_id,
+        'period': period,
+        'room': room,
+        'max_score': get_max_score(grade),
+        'cached': cached,
+        'count': len(ranking['students']),
+        **ranking
+    })
 
 # ============================================================================
 # STUDENT PROMOTION FUNCTIONALITY
@@ -1850,6 +2805,8 @@ def promote_student(student_id):
                                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)''',
                                    (student_id, new_academic_year_id, subject_name, 0, 0, 0, 0, 0, 0))
         
+        touch_schools_of(cur, 'students', [student_id])
+        refresh_student_summaries(conn, [student_id])
         conn.commit()
         
         # Return updated student info
@@ -1895,67 +2852,11 @@ def promote_multiple_students():
         return jsonify({'error': 'Database connection failed', 'error_ar': 'فشل الاتصال بقاعدة البيانات'}), 500
     
     conn = pool.get_connection()
-    promoted_count = 0
-    failed_promotions = []
-    
     try:
-        cur = conn.cursor(dictionary=True)
-        
-        for student_id in student_ids:
-            try:
-                # Get current student data
-                cur.execute('SELECT * FROM students WHERE id = %s FOR UPDATE', (student_id,))
-                student = cur.fetchone()
-                
-                if not student:
-                    failed_promotions.append({'id': student_id, 'reason': 'Student not found'})
-                    continue
-                
-                # Get current academic year if not provided
-                current_academic_year_id = new_academic_year_id
-                if not current_academic_year_id:
-                    cur.execute('SELECT id FROM system_academic_years WHERE is_current = 1 ORDER BY start_year DESC LIMIT 1')
-                    current_year = cur.fetchone()
-                    if current_year:
-                        current_academic_year_id = current_year['id']
-                    else:
-                        # If no current year is set, get the latest academic year
-                        cur.execute('SELECT id FROM system_academic_years ORDER BY start_year DESC LIMIT 1')
-                        year = cur.fetchone()
-                        if year:
-                            current_academic_year_id = year['id']
-                
-                # Update the student's grade level
-                cur.execute('UPDATE students SET grade = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s', 
-                           (new_grade, student_id))
-                
-                # Handle grade copying for the new academic year if needed
-                if current_academic_year_id:
-                    if student.get('detailed_scores'):
-                        detailed_scores = json.loads(student['detailed_scores']) if isinstance(student['detailed_scores'], str) else student['detailed_scores']
-                        
-                        for subject_name, subject_grades in detailed_scores.items():
-                            # Check if this subject already exists for the new academic year
-                            cur.execute('''SELECT id FROM student_grades 
-                                           WHERE student_id = %s AND academic_year_id = %s AND subject_name = %s''',
-                                       (student_id, current_academic_year_id, subject_name))
-                            existing_grade = cur.fetchone()
-                            
-                            if not existing_grade:
-                                # Insert the subject grades for the new academic year
-                                cur.execute('''INSERT INTO student_grades 
-                                               (student_id, academic_year_id, subject_name, month1, month2, midterm, month3, month4, final) 
-                                               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)''',
-                                           (student_id, current_academic_year_id, subject_name, 0, 0, 0, 0, 0, 0))
-                
-                promoted_count += 1
-            except Exception as e:
-                failed_promotions.append({'id': student_id, 'reason': str(e)})
-        
-        conn.commit()
-        
+        promoted_ids, failed_promotions, _ = promote_students(conn, student_ids, new_grade, new_academic_year_id)
     finally:
         conn.close()
+    promoted_count = len(promoted_ids)
     
     return jsonify({
         'success': True,
@@ -1965,6 +2866,134 @@ def promote_multiple_students():
         'failed_promotions': failed_promotions
     })
 
+# ============================================================================
+# BACKGROUND JOBS (year-end rollover)
+# ============================================================================
+
+@app.route('/api/jobs/rollover', methods=['POST'])
+@roles_required('admin', 'school')
+def start_rollover_job():
+    """Queue a year-end rollover that promotes every grade of a school (or of all schools for admins).
+    
+    Optional payload: {"school_id": 1, "academic_year_id": 2, "progression": {"from level": "to level"}}
+    By default the progression follows each school's grade_levels.display_order.
+    Jobs interrupted by a restart are resumed at startup; failed jobs via /api/jobs/<id>/resume.
+    """
+    data = request.json or {}
+    school_id = data.get('school_id')
+    progression = data.get('progression')
+    
+    # School accounts may only roll over their own school
+    if request.user.get('role') == 'school':
+        school_id = request.user.get('id')
+    
+    if progression is not None and not isinstance(progression, dict):
+        return jsonify({'error': 'Progression must be an object mapping grade levels', 'error_ar': 'يجب أن يكون تسلسل الصفوف كائنًا'}), 400
+    
+    try:
+        job = create_rollover_job(school_id, data.get('academic_year_id'), progression)
+    except RolloverPlanError as e:
+        return jsonify({'error': str(e), 'error_ar': 'تسلسل الصفوف غير صالح'}), 400
+    
+    return jsonify({'success': True, 'message': 'تم بدء عملية الترحيل', 'job': job}), 202
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+@roles_required('admin', 'school')
+def get_job_status(job_id):
+    """Get the status and progress of a background job"""
+    job = get_job(job_id)
+    if not job or (request.user.get('role') == 'school' and job['school_id'] != request.user.get('id')):
+        return jsonify({'error': 'Job not found', 'error_ar': 'لم يتم العثور على المهمة'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/jobs/<int:job_id>/resume', methods=['POST'])
+@roles_required('admin', 'school')
+def resume_job(job_id):
+    """Resume a failed or interrupted job from where it stopped"""
+    job = get_job(job_id)
+    if not job or (request.user.get('role') == 'school' and job['school_id'] != request.user.get('id')):
+        return jsonify({'error': 'Job not found', 'error_ar': 'لم يتم العثور على المهمة'}), 404
+    if not resume_rollover_job(job_id):
+        return jsonify({'error': f"Job cannot be resumed while {job['status']}", 'error_ar': 'لا يمكن استئناف هذه المهمة'}), 409
+    return jsonify({'success': True, 'message': 'تم استئناف المهمة', 'job': get_job(job_id)}), 202
+
+@app.route('/api/school/<int:school_id>/report-cards', methods=['POST'])
+@roles_required('admin', 'school')
+def start_report_card_job(school_id):
+    """Queue printable report cards for every student of a grade; poll the job, then download the zip.
+    
+    Payload: {"grade": "...", "academic_year_id": 2 (optional, current year by default), "format": "html"}
+    """
+    data = request.json or {}
+    grade = data.get('grade')
+    report_format = data.get('format', 'html')
+    
+    if request.user.get('role') == 'school' and school_id != request.user.get('id'):
+        return jsonify({'error': 'Unauthorized access', 'error_ar': 'دخول غير مصرح به'}), 403
+    if not grade:
+        return jsonify({'error': 'Grade is required', 'error_ar': 'الصف مطلوب'}), 400
+    if report_format not in REPORT_CARD_FORMATS:
+        return jsonify({
+            'error': f'Format must be one of: {", ".join(REPORT_CARD_FORMATS)}',
+            'error_ar': 'صيغة التقرير غير مدعومة'
+        }), 400
+    
+    job = create_report_card_job(school_id, grade, data.get('academic_year_id'), report_format)
+    job.pop('file_path', None)
+    return jsonify({'success': True, 'message': 'تم بدء إنشاء بطاقات الدرجات', 'job': job}), 202
+
+def find_report_card_job(school_id, job_id):
+    job = get_report_card_job(job_id)
+    if not job or job['school_id'] != school_id or (
+            request.user.get('role') == 'school' and school_id != request.user.get('id')):
+        return None
+    return job
+
+@app.route('/api/school/<int:school_id>/report-cards/<int:job_id>', methods=['GET'])
+@roles_required('admin', 'school')
+def get_report_card_job_status(school_id, job_id):
+    job = find_report_card_job(school_id, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found', 'error_ar': 'لم يتم العثور على المهمة'}), 404
+    job.pop('file_path', None)
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/school/<int:school_id>/report-cards/<int:job_id>/download', methods=['GET'])
+@roles_required('admin', 'school')
+def download_report_cards(school_id, job_id):
+    """Stream the finished zip from disk"""
+    job = find_report_card_job(school_id, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found', 'error_ar': 'لم يتم العثور على المهمة'}), 404
+    if job['status'] != 'completed' or not job['file_path'] or not os.path.exists(job['file_path']):
+        return jsonify({'error': f"Report cards are not ready ({job['status']})", 'error_ar': 'بطاقات الدرجات غير جاهزة بعد'}), 409
+    return send_file(job['file_path'], mimetype='application/zip', as_attachment=True,
+                     download_name=f'report-cards-{job_id}.zip')
+
+STUDENT_HISTORY_GRADES_QUERY = '''SELECT sg.*, say.name as academic_year_name, say.start_year, say.end_year 
+                                  FROM student_grades sg 
+                                  JOIN system_academic_years say ON sg.academic_year_id = say.id 
+                                  WHERE sg.student_id = %s 
+                                  ORDER BY say.start_year DESC, sg.subject_name'''
+
+STUDENT_HISTORY_ATTENDANCE_QUERY = '''SELECT sa.*, say.name as academic_year_name, say.start_year, say.end_year 
+                                      FROM student_attendance sa 
+                                      JOIN system_academic_years say ON sa.academic_year_id = say.id 
+                                      WHERE sa.student_id = %s 
+                                      ORDER BY sa.attendance_date DESC'''
+
+def stream_student_history(pool, student):
+    """Stream a student's history as NDJSON: one 'student' line, then one line per grade and attendance row"""
+    def produce(cur):
+        yield {'type': 'student', 'student': student}
+        cur.execute(STUDENT_HISTORY_GRADES_QUERY, (student['id'],))
+        for row in iter_cursor_rows(cur):
+            yield {'type': 'grade', **row}
+        cur.execute(STUDENT_HISTORY_ATTENDANCE_QUERY, (student['id'],))
+        for row in iter_cursor_rows(cur):
+            yield {'type': 'attendance', **row}
+    return stream_ndjson(pool, produce)
+
 @app.route('/api/student/<int:student_id>/history', methods=['GET'])
 @roles_required('admin', 'school', 'student')
 def get_student_history(student_id):
@@ -1984,12 +3013,11 @@ def get_student_history(student_id):
         if not student:
             return jsonify({'error': 'Student not found', 'error_ar': 'لم يتم العثور على الطالب'}), 404
         
+        if wants_stream():
+            return stream_student_history(pool, decode_student_json_columns(student))
+        
         # Get all grades for this student across all academic years
-        cur.execute('''SELECT sg.*, say.name as academic_year_name, say.start_year, say.end_year 
-                       FROM student_grades sg 
-                       JOIN system_academic_years say ON sg.academic_year_id = say.id 
-                       WHERE sg.student_id = %s 
-                       ORDER BY say.start_year DESC, sg.subject_name''', (student_id,))
+        cur.execute(STUDENT_HISTORY_GRADES_QUERY, (student_id,))
         all_grades = cur.fetchall()
         
         # Group grades by academic year
@@ -2017,11 +3045,7 @@ def get_student_history(student_id):
             }
         
         # Get all attendance for this student across all academic years
-        cur.execute('''SELECT sa.*, say.name as academic_year_name, say.start_year, say.end_year 
-                       FROM student_attendance sa 
-                       JOIN system_academic_years say ON sa.academic_year_id = say.id 
-                       WHERE sa.student_id = %s 
-                       ORDER BY sa.attendance_date DESC''', (student_id,))
+        cur.execute(STUDENT_HISTORY_ATTENDANCE_QUERY, (student_id,))
         all_attendance = cur.fetchall()
         
         # Group attendance by academic year
@@ -2070,10 +3094,26 @@ def serve_static(path):
     if path.startswith('api/'):
         return jsonify({'error': 'API endpoint not found', 'error_ar': 'نقطة نهاية API غير موجودة'}), 404
         
-    if path != "" and os.path.exists(app.static_folder + '/' + path):
-        return send_from_directory(app.static_folder, path)
+    return send_asset(path or 'index.html')
+
+def send_asset(path):
+    """Serve a file from the asset manifest, falling back to index.html for SPA routes"""
+    asset, immutable = asset_manifest.lookup(path)
+    if asset is None:
+        asset, immutable = asset_manifest.lookup('index.html')
+    
+    if request.if_none_match.contains_weak(asset.etag):
+        response = Response(status=304)
     else:
-        return send_from_directory(app.static_folder, 'index.html')
+        encoding, body = asset.negotiate(request.accept_encodings)
+        response = Response(body, mimetype=asset.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(asset.etag, weak=True)
+    # Content-hash URLs never change; everything else is revalidated with the ETag
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable' if immutable else 'no-cache'
+    return response
 
 @app.route('/uploads/<filename>')
 def serve_upload(filename):
@@ -0,0 +1,171 @@
+import json
+import threading
+from database import GRADE_PERIODS, get_mysql_pool, upsert_many
+from grading import get_pass_threshold
+from academic_years import get_current_academic_year_name, current_academic_year_id
+
+# Materialized per-student aggregates for the current academic year, kept in
+# student_summaries so list views can sort and filter without the JSON blobs.
+SUMMARY_COLUMNS = (
+    'average_score', 'latest_score', 'graded_subjects', 'failing_subjects',
+    'attendance_rate', 'attendance_records'
+)
+PRESENT_STATUSES = ('present', 'حاضر')
+SUMMARY_BATCH_SIZE = 500
+
+# (school_id, academic year name) pairs whose summaries this process has brought up to date
+_ensured_schools = set()
+_ensured_schools_lock = threading.Lock()
+
+def _load_json(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+def _to_score(value):
+    try:
+        return int(value or 0)
+    except (ValueError, TypeError):
+        return 0
+
+def compute_student_summary(grade, scores_by_subject, attendance_by_date):
+    """Compute the summary values (in SUMMARY_COLUMNS order) the dashboard derives in the browser.
+
+    scores_by_subject maps subject -> {period: score}; zero scores count as "not graded".
+    attendance_by_date maps date -> either a per-year record ({'status': ...}) or a
+    daily_attendance entry ({subject: status}).
+    """
+    pass_threshold = get_pass_threshold(grade)
+    total = count = 0
+    latest_scores = []
+    graded_subjects = failing_subjects = 0
+    for scores in scores_by_subject.values():
+        if not isinstance(scores, dict):
+            continue
+        graded = [score for score in (_to_score(scores.get(period)) for period in GRADE_PERIODS) if score > 0]
+        if not graded:
+            continue
+        graded_subjects += 1
+        total += sum(graded)
+        count += len(graded)
+        latest_scores.append(graded[-1])
+        if sum(graded) / len(graded) < pass_threshold:
+            failing_subjects += 1
+
+    present = records = 0
+    for record in attendance_by_date.values():
+        if not isinstance(record, dict):
+            continue
+        statuses = [record['status']] if 'status' in record else list(record.values())
+        for status in statuses:
+            records += 1
+            if status in PRESENT_STATUSES:
+                present += 1
+
+    return (
+        round(total / count, 2) if count else None,
+        round(sum(latest_scores) / len(latest_scores), 2) if latest_scores else None,
+        graded_subjects,
+        failing_subjects,
+        round(present * 100.0 / records, 2) if records else None,
+        records,
+    )
+
+def refresh_student_summaries(conn, student_ids, academic_year_id=None):
+    """Recompute the summaries of the given students inside the caller's transaction.
+
+    The student's detailed_scores/daily_attendance are merged with the
+    current academic year's student_grades/student_attendance rows, the
+    same way the dashboard overlays per-year data on the blobs. Pass the
+    academic_year_id that was written: writes to any other year than the
+    date-based current one do not change the summaries and are skipped.
+    """
+    student_ids = list(dict.fromkeys(student_ids))
+    if not student_ids:
+        return 0
+    cur = conn.cursor(dictionary=True)
+    current_year_id = current_academic_year_id(cur)
+    if academic_year_id and int(academic_year_id) != current_year_id:
+        return 0
+    academic_year_id = current_year_id
+
+    rows = []
+    for start in range(0, len(student_ids), SUMMARY_BATCH_SIZE):
+        chunk = student_ids[start:start + SUMMARY_BATCH_SIZE]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cur.execute(f'SELECT id, grade, detailed_scores, daily_attendance FROM students WHERE id IN ({placeholders})',
+                    tuple(chunk))
+        students = {row['id']: row for row in cur.fetchall()}
+        scores = {sid: _load_json(row['detailed_scores']) for sid, row in students.items()}
+        attendance = {sid: _load_json(row['daily_attendance']) for sid, row in students.items()}
+
+        if academic_year_id:
+            cur.execute(f'''SELECT student_id, subject_name, {', '.join(GRADE_PERIODS)} FROM student_grades
+                            WHERE academic_year_id = %s AND student_id IN ({placeholders})''',
+                        (academic_year_id, *chunk))
+            for row in cur.fetchall():
+                if row['student_id'] in scores:
+                    scores[row['student_id']][row['subject_name']] = {period: row[period] for period in GRADE_PERIODS}
+            cur.execute(f'''SELECT student_id, attendance_date, status FROM student_attendance
+                            WHERE academic_year_id = %s AND student_id IN ({placeholders})''',
+                        (academic_year_id, *chunk))
+            for row in cur.fetchall():
+                if row['student_id'] in attendance:
+                    attendance[row['student_id']][str(row['attendance_date'])] = {'status': row['status']}
+
+        for student_id, student in students.items():
+            summary = compute_student_summary(student['grade'], scores[student_id], attendance[student_id])
+            rows.append((student_id, academic_year_id) + summary)
+
+    upsert_many(cur, 'student_summaries', ['student_id', 'academic_year_id'] + list(SUMMARY_COLUMNS),
+                ['student_id'], rows, touch_updated_at=True)
+    return len(rows)
+
+def ensure_student_summaries(school_id=None):
+    """Build summaries for students that have none for the current academic year yet.
+
+    Runs for every school at startup; the student list calls it per school so
+    rows are rebuilt lazily when the academic year changes (September 1) on a
+    server that keeps running. Returns the number of students refreshed, None on error.
+    """
+    pool = get_mysql_pool()
+    if not pool:
+        return 0
+    conn = pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        academic_year_id = current_academic_year_id(cur)
+        conn.commit()
+        query = '''SELECT s.id FROM students s
+                   LEFT JOIN student_summaries ss ON ss.student_id = s.id
+                   WHERE (ss.student_id IS NULL OR ss.academic_year_id IS NULL OR ss.academic_year_id <> %s)'''
+        params = (academic_year_id,)
+        if school_id is not None:
+            query += ' AND s.school_id = %s'
+            params += (school_id,)
+        cur.execute(query, params)
+        missing = [row['id'] for row in cur.fetchall()]
+        for start in range(0, len(missing), SUMMARY_BATCH_SIZE):
+            refresh_student_summaries(conn, missing[start:start + SUMMARY_BATCH_SIZE], academic_year_id)
+            conn.commit()
+        if missing:
+            print(f'✅ Built summaries for {len(missing)} students')
+        return len(missing)
+    except Exception as e:
+        print(f"❌ Error building student summaries: {e}")
+        return None
+    finally:
+        conn.close()
+
+def ensure_school_summaries(school_id):
+    """ensure_student_summaries for one school, once per academic year per process"""
+    key = (school_id, get_current_academic_year_name()[0])
+    with _ensured_schools_lock:
+        if key in _ensured_schools:
+            return
+    if ensure_student_summaries(school_id) is not None:
+        with _ensured_schools_lock:
+            _ensured_schools.add(key)
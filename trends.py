@@ -0,0 +1,175 @@
+import numpy as np
+from database import GRADE_PERIODS
+from grading import get_max_score, score_bands
+
+# Same rules as analyzeGradeTrend in school.js / student.js, applied to a whole
+# school-year at once. Changes are measured in percent of the grade's max score.
+SIGNIFICANT_CHANGE_PERCENT = 30
+TREND_CHANGE_PERCENT = 20
+VARIABLE_SPREAD = 0.15
+INCONSISTENT_SPREAD = 0.25
+
+class GradeTensor:
+    """A school-year's student_grades as a students x subjects x periods score array.
+
+    Missing (student, subject) pairs and ungraded periods are 0, like the dashboard.
+    """
+
+    def __init__(self, student_ids, grades, subjects, scores):
+        self.student_ids = student_ids
+        self.grades = grades
+        self.subjects = subjects
+        self.scores = scores
+        self.max_scores = np.array([get_max_score(grade) for grade in grades], dtype=np.int32)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (student_id, grade, subject_name, month1, ..., final) tuples"""
+        if not rows:
+            return cls([], [], [], np.zeros((0, 0, len(GRADE_PERIODS)), dtype=np.int32))
+        columns = list(zip(*rows))
+        student_ids, student_index = np.unique(np.array(columns[0]), return_inverse=True)
+        subjects, subject_index = np.unique(np.array(columns[2], dtype=object), return_inverse=True)
+        grade_by_student = dict(zip(columns[0], columns[1]))
+        scores = np.zeros((len(student_ids), len(subjects), len(GRADE_PERIODS)), dtype=np.int32)
+        period_scores = np.array(columns[3:], dtype=np.float64).T
+        scores[student_index, subject_index] = np.nan_to_num(period_scores).astype(np.int32)
+        return cls(student_ids.tolist(), [grade_by_student[sid] for sid in student_ids.tolist()],
+                   subjects.tolist(), scores)
+
+def load_grade_tensor(cur, school_id, academic_year_id, grade=None, subject=None, room=None):
+    """Load a school-year's grades with one query. cur must be a tuple (non-dictionary) cursor."""
+    query = f'''SELECT sg.student_id, s.grade, sg.subject_name, {', '.join(f'sg.{period}' for period in GRADE_PERIODS)}
+                FROM student_grades sg
+                JOIN students s ON s.id = sg.student_id
+                WHERE s.school_id = %s AND sg.academic_year_id = %s'''
+    params = [school_id, academic_year_id]
+    if grade:
+        query += ' AND s.grade = %s'
+        params.append(grade)
+    if subject:
+        query += ' AND sg.subject_name = %s'
+        params.append(subject)
+    if room:
+        query += ' AND s.room = %s'
+        params.append(room)
+    cur.execute(query, tuple(params))
+    return GradeTensor.from_rows(cur.fetchall())
+
+def analyze_trends(scores, max_scores):
+    """Compute the analyzeGradeTrend signals for every student and subject in one pass.
+
+    scores is an int array of shape (students, subjects, periods), max_scores has
+    shape (students,). Returns a dict of (students, subjects) arrays, plus
+    'change_percent' of shape (students, subjects, periods): the change of each
+    graded period from the previous graded period (nan where there is none).
+    """
+    periods = scores.shape[-1]
+    max_scores = max_scores.astype(np.float64)[:, None]
+    _, safe_thresholds, _ = score_bands(max_scores)
+    graded = scores > 0
+    has_grades = graded.any(axis=-1)
+
+    # Index of the previous graded period for every period (-1 if none)
+    graded_index = np.where(graded, np.arange(periods), -1)
+    last_seen = np.maximum.accumulate(graded_index, axis=-1)
+    previous_index = np.concatenate([np.full(last_seen.shape[:-1] + (1,), -1), last_seen[..., :-1]], axis=-1)
+    previous_scores = np.take_along_axis(scores, np.maximum(previous_index, 0), axis=-1)
+    has_previous = graded & (previous_index >= 0)
+    change_percent = np.where(has_previous, (scores - previous_scores) / max_scores[..., None] * 100, np.nan)
+    with np.errstate(invalid='ignore'):
+        improvement = (change_percent >= SIGNIFICANT_CHANGE_PERCENT).any(axis=-1)
+        deterioration = (change_percent <= -SIGNIFICANT_CHANGE_PERCENT).any(axis=-1)
+
+    # A zero followed directly (after any run of zeros) by a safe grade
+    good = graded & (scores >= safe_thresholds[..., None])
+    zero_before_good = (good[..., 1:] & ~graded[..., :-1]).any(axis=-1)
+
+    first_index = np.argmax(graded, axis=-1)
+    last_index = periods - 1 - np.argmax(graded[..., ::-1], axis=-1)
+    first_scores = np.take_along_axis(scores, first_index[..., None], axis=-1)[..., 0]
+    latest_scores = np.take_along_axis(scores, last_index[..., None], axis=-1)[..., 0]
+    first_scores = np.where(has_grades, first_scores, 0)
+    latest_scores = np.where(has_grades, latest_scores, 0)
+    overall_percent = (latest_scores - first_scores) / max_scores * 100
+    trend = np.where(overall_percent >= TREND_CHANGE_PERCENT, 'improving',
+                     np.where(overall_percent <= -TREND_CHANGE_PERCENT, 'declining', 'stable'))
+    trend = np.where(has_grades, trend, 'none')
+
+    # Population standard deviation of the graded periods, relative to the scale
+    counts = np.maximum(graded.sum(axis=-1), 1)
+    means = np.where(graded, scores, 0).sum(axis=-1) / counts
+    variance = np.where(graded, (scores - means[..., None]) ** 2, 0).sum(axis=-1) / counts
+    spread = np.sqrt(variance) / max_scores
+    consistency = np.where(spread > INCONSISTENT_SPREAD, 'inconsistent',
+                           np.where(spread > VARIABLE_SPREAD, 'variable', 'consistent'))
+    consistency = np.where(has_grades, consistency, 'unknown')
+
+    positions = np.arange(periods)
+    between = (positions >= first_index[..., None]) & (positions <= last_index[..., None])
+    missed_periods = (between & ~graded & has_grades[..., None]).sum(axis=-1)
+
+    return {
+        'has_grades': has_grades,
+        'improvement': improvement,
+        'deterioration': deterioration,
+        'zero_before_good': zero_before_good,
+        'trend': trend,
+        'first_score': first_scores,
+        'latest_score': latest_scores,
+        'consistency': consistency,
+        'missed_periods': missed_periods,
+        'change_percent': change_percent,
+    }
+
+def find_at_risk(tensor, from_period=None, to_period=None, min_drop=SIGNIFICANT_CHANGE_PERCENT):
+    """List at-risk students, worst drop first.
+
+    Without periods a subject is at risk when it shows a significant
+    deterioration, or a declining trend that ended below the safe threshold.
+    With from_period/to_period it is at risk when both periods are graded and
+    the score fell by at least min_drop percent of the scale between them.
+    """
+    if not tensor.student_ids:
+        return []
+    signals = analyze_trends(tensor.scores, tensor.max_scores)
+    max_scores = tensor.max_scores.astype(np.float64)[:, None]
+
+    if from_period:
+        before = tensor.scores[..., GRADE_PERIODS.index(from_period)]
+        after = tensor.scores[..., GRADE_PERIODS.index(to_period)]
+        drop = (before - after) / max_scores * 100
+        at_risk = (before > 0) & (after > 0) & (drop >= min_drop)
+    else:
+        _, safe_thresholds, _ = score_bands(max_scores)
+        worst_change = np.where(np.isnan(signals['change_percent']), 0, signals['change_percent']).min(axis=-1)
+        drop = np.maximum(-worst_change, 0)
+        declining = (signals['trend'] == 'declining') & (signals['latest_score'] < safe_thresholds)
+        at_risk = signals['deterioration'] | declining
+
+    results = []
+    for student_index in np.flatnonzero(at_risk.any(axis=-1)).tolist():
+        subjects = []
+        for subject_index in np.flatnonzero(at_risk[student_index]).tolist():
+            subjects.append({
+                'subject': tensor.subjects[subject_index],
+                'drop_percent': round(float(drop[student_index, subject_index]), 1),
+                'trend': str(signals['trend'][student_index, subject_index]),
+                'first_score': int(signals['first_score'][student_index, subject_index]),
+                'latest_score': int(signals['latest_score'][student_index, subject_index]),
+                'deterioration': bool(signals['deterioration'][student_index, subject_index]),
+                'zero_before_good': bool(signals['zero_before_good'][student_index, subject_index]),
+                'consistency': str(signals['consistency'][student_index, subject_index]),
+                'missed_periods': int(signals['missed_periods'][student_index, subject_index]),
+                'scores': dict(zip(GRADE_PERIODS, tensor.scores[student_index, subject_index].tolist())),
+            })
+        subjects.sort(key=lambda item: -item['drop_percent'])
+        results.append({
+            'student_id': tensor.student_ids[student_index],
+            'grade': tensor.grades[student_index],
+            'max_score': int(tensor.max_scores[student_index]),
+            'worst_drop_percent': subjects[0]['drop_percent'],
+            'subjects': subjects,
+        })
+    results.sort(key=lambda item: -item['worst_drop_percent'])
+    return results